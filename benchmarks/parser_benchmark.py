@@ -0,0 +1,215 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#   Copyright 2011 Luca Beltrame <einar@heavensinferno.net>
+#
+#   This program is free software; you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License, under
+#   version 2 of the License, or (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details
+#
+#   You should have received a copy of the GNU General Public
+#   License along with this program; if not, write to the
+#   Free Software Foundation, Inc.,
+#   51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+"""Compare the XML and JSON parsers of the Danbooru API.
+
+Large post list pages are generated with random (but reproducible) fields
+modelled on real ``post/index`` answers, serialized both as XML and JSON,
+and parsed with the parsers of :mod:`danbooru.api.parsers`. The payload
+size (plain and compressed) and the parse throughput are reported for each
+format, both for whole answers and for answers fed in network-sized chunks.
+
+Usage::
+
+    python benchmarks/parser_benchmark.py [--posts N] [--rounds N]
+
+"""
+
+from __future__ import print_function
+
+import argparse
+import gzip
+import io
+import json
+import os
+import random
+import sys
+import timeit
+
+from xml.sax.saxutils import quoteattr
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir))
+
+import PyQt4.QtCore as QtCore
+
+from danbooru.api import parsers
+
+FIELDS = ("id", "tags", "created_at", "creator_id", "author", "change",
+          "source", "score", "md5", "file_size", "file_url",
+          "is_shown_in_index", "preview_url", "preview_width",
+          "preview_height", "sample_url", "sample_width", "sample_height",
+          "rating", "has_children", "parent_id", "status", "width", "height")
+
+
+def generate_posts(count, seed=0):
+
+    """Generate *count* posts, as dictionaries."""
+
+    generator = random.Random(seed)
+    vocabulary = ["tag_%d" % index for index in range(5000)]
+    posts = list()
+
+    for index in range(count):
+
+        md5 = "%032x" % generator.getrandbits(128)
+        width = generator.randint(600, 4000)
+        height = generator.randint(600, 4000)
+        url = "http://example.com/data/%s" % md5
+
+        tags = generator.sample(vocabulary, generator.randint(5, 40))
+
+        post = dict(id=100000 + index, tags=" ".join(tags),
+                    created_at=1300000000 + index * 60,
+                    creator_id=generator.randint(1, 50000),
+                    author="user_%d" % generator.randint(1, 50000),
+                    change=generator.randint(1, 10 ** 6), source="",
+                    score=0, md5=md5,
+                    file_size=generator.randint(10 ** 5, 10 ** 7),
+                    file_url="%s.jpg" % url, is_shown_in_index=True,
+                    preview_url="http://example.com/preview/%s.jpg" % md5,
+                    preview_width=150, preview_height=150,
+                    sample_url="%s_sample.jpg" % url, sample_width=1500,
+                    sample_height=1500, rating=generator.choice("sqe"),
+                    has_children=False, parent_id="", status="active",
+                    width=width, height=height)
+
+        posts.append(post)
+
+    return posts
+
+
+def to_xml(posts):
+
+    """Serialize *posts* like a ``post/index.xml`` answer."""
+
+    lines = ['<?xml version="1.0" encoding="UTF-8"?>',
+             '<posts count="%d" offset="0">' % len(posts)]
+
+    for post in posts:
+
+        attributes = list()
+
+        for name in FIELDS:
+
+            value = post[name]
+
+            if isinstance(value, bool):
+                value = str(value).lower()
+
+            attributes.append("%s=%s" % (name, quoteattr(str(value))))
+
+        lines.append("  <post %s/>" % " ".join(attributes))
+
+    lines.append("</posts>")
+
+    return "\n".join(lines).encode("utf-8")
+
+
+def to_json(posts):
+
+    """Serialize *posts* like a ``post/index.json`` answer."""
+
+    return json.dumps(posts, separators=(",", ":")).encode("utf-8")
+
+
+def compressed_size(data):
+
+    output = io.BytesIO()
+
+    with gzip.GzipFile(fileobj=output, mode="wb") as handle:
+        handle.write(data)
+
+    return len(output.getvalue())
+
+
+def parse(parser_class, data, chunk_size=None):
+
+    """Parse *data* with a new parser, optionally in chunks of
+    *chunk_size* bytes. Returns the number of items."""
+
+    parser = parser_class()
+
+    if chunk_size is None:
+        chunks = [QtCore.QByteArray(data)]
+    else:
+        chunks = [QtCore.QByteArray(data[start:start + chunk_size])
+                  for start in range(0, len(data), chunk_size)]
+
+    count = 0
+
+    for chunk in chunks:
+        count += len(parser.feed(chunk))
+
+    count += len(parser.finish())
+
+    if parser.error is not None:
+        raise ValueError(parser.error)
+
+    return count
+
+
+def main():
+
+    argument_parser = argparse.ArgumentParser(description=__doc__.split(
+        "\n\n")[0])
+    argument_parser.add_argument("--posts", type=int, default=1000,
+                                 help="posts in each fixture page")
+    argument_parser.add_argument("--rounds", type=int, default=5,
+                                 help="timing rounds (the best is kept)")
+    argument_parser.add_argument("--chunk-size", type=int, default=4096,
+                                 help="size of the chunks fed to the parsers")
+    argument_parser.add_argument("--save", metavar="DIRECTORY",
+                                 help="also write the fixtures to DIRECTORY")
+    options = argument_parser.parse_args()
+
+    posts = generate_posts(options.posts)
+    fixtures = [("xml", to_xml(posts), parsers.PostParser),
+                ("json", to_json(posts), parsers.JsonPostParser)]
+
+    if options.save:
+        for name, data, _ in fixtures:
+            with open(os.path.join(options.save, "posts.%s" % name),
+                      "wb") as handle:
+                handle.write(data)
+
+    print("%d posts per page, best of %d rounds" % (options.posts,
+                                                   options.rounds))
+    print()
+    print("%-6s %10s %10s %12s %12s %12s" % ("format", "size", "gzip",
+                                             "whole", "chunked", "MiB/s"))
+
+    for name, data, parser_class in fixtures:
+
+        assert parse(parser_class, data) == options.posts
+        assert parse(parser_class, data, options.chunk_size) == options.posts
+
+        whole = min(timeit.repeat(lambda: parse(parser_class, data),
+                                  number=1, repeat=options.rounds))
+        chunked = min(timeit.repeat(
+            lambda: parse(parser_class, data, options.chunk_size),
+            number=1, repeat=options.rounds))
+
+        print("%-6s %10d %10d %10.1fms %10.1fms %12.1f" % (
+            name, len(data), compressed_size(data), whole * 1000,
+            chunked * 1000, len(data) / whole / (1024 * 1024)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#   Copyright 2011 Luca Beltrame <einar@heavensinferno.net>
+#
+#   This program is free software; you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License, under
+#   version 2 of the License, or (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details
+#
+#   You should have received a copy of the GNU General Public
+#   License along with this program; if not, write to the
+#   Free Software Foundation, Inc.,
+#   51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+"""Measure the memory and attribute access cost of DanbooruPost.
+
+The compact, eagerly decoded :class:`DanbooruPost
+<danbooru.api.containers.DanbooruPost>` is compared with a container which
+keeps the parsed fields in a dictionary and decodes them on each access,
+like posts used to do.
+
+Usage::
+
+    python benchmarks/post_benchmark.py [--posts N] [--rounds N]
+
+"""
+
+from __future__ import print_function
+
+import argparse
+import gc
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir))
+
+from danbooru.api import containers
+
+from parser_benchmark import generate_posts
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+if sys.version_info.major > 2:
+    unicode = str
+
+
+class DictPost(object):
+
+    "A post decoding its fields on each access, for comparison."
+
+    def __init__(self, data):
+
+        self.__data = data
+
+    def __getattr__(self, value):
+
+        return containers._text(self.__data.get(value))
+
+    @property
+    def rating(self):
+
+        ratings = dict(s="Safe", q="Questionable", e="Explicit")
+        return ratings.get(containers._text(self.__data.get("rating")),
+                           "Safe")
+
+    @property
+    def tags(self):
+
+        return (containers._text(self.__data.get("tags")) or
+                unicode()).split(" ")
+
+
+def as_text(post):
+
+    "Return the fields of a post as parsers produce them."
+
+    return dict((key, unicode(value).lower() if isinstance(value, bool)
+                 else unicode(value)) for key, value in post.items())
+
+
+def memory_per_post(factory, fields):
+
+    """Return the bytes allocated for each post built by *factory*, or
+    :const:`None` if they cannot be measured."""
+
+    if tracemalloc is None:
+        return
+
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    posts = [factory(dict(item)) for item in fields]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    del posts
+
+    return (after - before) / float(len(fields))
+
+
+def access(posts, blacklist):
+
+    "Access the fields used while filtering and displaying posts."
+
+    for post in posts:
+        post.id
+        post.file_url
+        post.rating
+        any(tag in blacklist for tag in post.tags)
+
+
+def main():
+
+    argument_parser = argparse.ArgumentParser(description=__doc__.split(
+        "\n\n")[0])
+    argument_parser.add_argument("--posts", type=int, default=10000,
+                                 help="number of posts")
+    argument_parser.add_argument("--rounds", type=int, default=5,
+                                 help="timing rounds (the best is kept)")
+    options = argument_parser.parse_args()
+
+    fields = [as_text(post) for post in generate_posts(options.posts)]
+    blacklist = frozenset("tag_%d" % index for index in range(0, 5000, 50))
+
+    print("%d posts, best of %d rounds" % (options.posts, options.rounds))
+    print()
+    print("%-12s %14s %14s %14s" % ("container", "bytes/post", "create",
+                                    "access"))
+
+    for name, factory in (("dictionary", DictPost),
+                          ("DanbooruPost", containers.DanbooruPost)):
+
+        memory = memory_per_post(factory, fields)
+        posts = [factory(item) for item in fields]
+
+        create = min(timeit.repeat(lambda: [factory(item) for item in fields],
+                                   number=1, repeat=options.rounds))
+        accessed = min(timeit.repeat(lambda: access(posts, blacklist),
+                                     number=1, repeat=options.rounds))
+
+        memory = "n/a" if memory is None else "%.0f" % memory
+
+        print("%-12s %14s %12.2fus %12.2fus" % (
+            name, memory, create / options.posts * 10 ** 6,
+            accessed / options.posts * 10 ** 6))
+
+
+if __name__ == "__main__":
+    main()
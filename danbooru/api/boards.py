@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#   Copyright 2011 Luca Beltrame <einar@heavensinferno.net>
+#
+#   This program is free software; you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License, under
+#   version 2 of the License, or (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details
+#
+#   You should have received a copy of the GNU General Public
+#   License along with this program; if not, write to the
+#   Free Software Foundation, Inc.,
+#   51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+"""This module describes what the known Danbooru boards support.
+
+Danbooru derived boards (Danbooru 1.x, Moebooru) differ slightly in what
+their API accepts. Boards not listed here use the defaults.
+
+"""
+
+__all__ = ["BoardCapabilities", "capabilities"]
+
+import sys
+
+import PyKDE4.kdecore as kdecore
+
+if sys.version_info.major > 2:
+    unicode = str
+
+
+class BoardCapabilities(object):
+
+    """The features supported by a specific board.
+
+    :param tag_batch_size: How many tag names can be looked up with a single
+                           ``tag/index`` request (names are separated by
+                           *tag_batch_separator*)
+    :param tag_batch_separator: The separator used for batched names
+    :param response_format: The preferred format of the answers, either
+                            ``xml`` or ``json`` (see
+                            :mod:`danbooru.api.formats`)
+    :param max_tags: The maximum number of terms accepted in a search,
+                     metatags included
+    :param server_filters: Whether searches accept the ``rating:`` metatag
+                           and negated tags, used to filter posts on the
+                           board rather than on the client
+    :param request_rate: How many requests per second can be sent to the
+                         board, on average (see
+                         :mod:`danbooru.api.ratelimit`)
+    :param request_burst: How many requests can be sent at once after a
+                          quiet period
+    :param static_rate: How many requests per second can be sent for
+                        static files (thumbnails and full images), which
+                        have a budget of their own
+    :param static_burst: How many requests for static files can be sent at
+                         once after a quiet period
+
+    """
+
+    def __init__(self, tag_batch_size=1, tag_batch_separator=",",
+                 response_format="xml", max_tags=2, server_filters=True,
+                 request_rate=4.0, request_burst=8, static_rate=20.0,
+                 static_burst=40):
+
+        self.tag_batch_size = tag_batch_size
+        self.tag_batch_separator = tag_batch_separator
+        self.response_format = response_format
+        self.max_tags = max_tags
+        self.server_filters = server_filters
+        self.request_rate = request_rate
+        self.request_burst = request_burst
+        self.static_rate = static_rate
+        self.static_burst = static_burst
+
+
+# Moebooru matches the name of tag/index as a single pattern, so tags can
+# only be looked up one at a time. It also serves all the API paths as JSON,
+# which is smaller and faster to parse. Danbooru splits the name on commas,
+# so up to a page of tags (100) can be looked up at once. Searches are
+# limited to 6 terms on Moebooru, and to 2 for anonymous users on Danbooru,
+# which also throttles anonymous clients sooner.
+#
+# The request rates apply to the API only. Static files are served without
+# going through the application and are already limited to a few
+# connections per host (see danbooru.api.scheduler), so their budget only
+# guards against runaway loops: a burst of 40 covers the thumbnails first
+# shown of a page, and 20 per second fetches a page of 100 in 3 seconds.
+_BOARDS = {
+    "konachan.com": BoardCapabilities(response_format="json", max_tags=6),
+    "konachan.net": BoardCapabilities(response_format="json", max_tags=6),
+    "yande.re": BoardCapabilities(response_format="json", max_tags=6),
+    "oreno.imouto.org": BoardCapabilities(response_format="json",
+                                          max_tags=6),
+    "danbooru.donmai.us": BoardCapabilities(tag_batch_size=100, max_tags=2,
+                                            request_rate=2.0,
+                                            request_burst=4),
+    "safebooru.donmai.us": BoardCapabilities(tag_batch_size=100, max_tags=2,
+                                             request_rate=2.0,
+                                             request_burst=4),
+}
+
+_DEFAULT = BoardCapabilities()
+
+
+def capabilities(board_url):
+
+    """Return the capabilities of a board.
+
+    :param board_url: The URL of the board
+    :return: A :class:`BoardCapabilities` instance
+
+    """
+
+    host = unicode(kdecore.KUrl(board_url).host())
+
+    return _BOARDS.get(host, _DEFAULT)
@@ -0,0 +1,526 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#   Copyright 2011 Luca Beltrame <einar@heavensinferno.net>
+#
+#   This program is free software; you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License, under
+#   version 2 of the License, or (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details
+#
+#   You should have received a copy of the GNU General Public
+#   License along with this program; if not, write to the
+#   Free Software Foundation, Inc.,
+#   51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+"""This module contains the caches used to store the answers of the
+Danbooru API.
+
+Each answer is stored in a separate file, named after the hash of its
+request URL, together with the validators (ETag and Last-Modified) sent by
+the server. An index keeps track of sizes and access times, so that the
+least recently used entries are evicted when the cache grows larger than
+its size budget. The index is written back at most every
+:data:`INDEX_SAVE_INTERVAL` seconds, and when the cache is closed; answers
+whose index entry was lost in between are removed when the cache is next
+opened.
+
+Tag metadata (type and post count) is also kept in memory, as it is needed
+over and over when displaying related tags, and so are the thumbnails most
+recently shown, within a memory budget.
+
+"""
+
+__all__ = ["ResponseCache", "CacheEntry", "TagCache", "ThumbnailCache"]
+
+import collections
+import hashlib
+import json
+import os
+import sys
+import time
+
+if sys.version_info.major > 2:
+    unicode = str
+
+# Default size budget, in bytes
+DEFAULT_MAX_SIZE = 20 * 1024 * 1024
+
+# Default lifetime of tag metadata, in seconds
+DEFAULT_TAG_TTL = 60 * 60
+
+# Default memory budget of decoded thumbnails, in bytes
+DEFAULT_THUMBNAIL_SIZE = 64 * 1024 * 1024
+
+# Minimum delay between two writes of the index, in seconds
+INDEX_SAVE_INTERVAL = 30
+
+_INDEX_NAME = "index.json"
+
+
+class CacheEntry(object):
+
+    """A single cached answer.
+
+    :param data: The body of the answer, as bytes
+    :param etag: The ETag sent by the server, if any
+    :param last_modified: The Last-Modified header sent by the server, if any
+    :param stored: The time (in seconds since the epoch) the answer was
+                   stored or last revalidated
+
+    """
+
+    def __init__(self, data, etag=None, last_modified=None, stored=None):
+
+        self.data = data
+        self.etag = etag
+        self.last_modified = last_modified
+        self.stored = stored if stored is not None else time.time()
+
+    @property
+    def age(self):
+
+        "The number of seconds since the entry was stored or revalidated."
+
+        return time.time() - self.stored
+
+    def validation_headers(self):
+
+        """The headers needed to revalidate the entry with a conditional
+        request.
+
+        :return: A list of header strings
+
+        """
+
+        headers = list()
+
+        if self.etag:
+            headers.append("If-None-Match: %s" % self.etag)
+
+        if self.last_modified:
+            headers.append("If-Modified-Since: %s" % self.last_modified)
+
+        return headers
+
+
+class ResponseCache(object):
+
+    """On-disk cache of API answers, keyed by request URL.
+
+    :param directory: The directory where the answers are stored
+    :param max_size: The maximum size of the cache, in bytes
+
+    """
+
+    def __init__(self, directory, max_size=DEFAULT_MAX_SIZE):
+
+        self.directory = unicode(directory)
+        self.max_size = max_size
+        self.__index = dict()
+        self.__size = 0
+        self.__dirty = False
+        self.__saved = time.time()
+
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+
+        self.__load_index()
+
+    def __len__(self):
+
+        return len(self.__index)
+
+    @property
+    def size(self):
+
+        "The total size of the stored answers, in bytes."
+
+        return self.__size
+
+    def __path(self, key):
+
+        name = hashlib.sha1(key.encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, name)
+
+    def __load_index(self):
+
+        index_path = os.path.join(self.directory, _INDEX_NAME)
+
+        try:
+            with open(index_path) as handle:
+                index = json.load(handle)
+        except (IOError, OSError, ValueError):
+            index = dict()
+
+        # Drop entries whose data went missing
+        self.__index = dict((key, value) for key, value in index.items()
+                            if os.path.exists(self.__path(key)))
+        self.__size = sum(value["size"] for value in self.__index.values())
+
+        # Remove the answers left without an entry when the index was not
+        # written back before exiting
+        known = set(os.path.basename(self.__path(key))
+                    for key in self.__index)
+
+        for name in os.listdir(self.directory):
+
+            if name == _INDEX_NAME or name in known:
+                continue
+
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass
+
+    def __changed(self):
+
+        """Mark the index as modified, writing it if it was not written
+        recently."""
+
+        self.__dirty = True
+
+        if time.time() - self.__saved >= INDEX_SAVE_INTERVAL:
+            self.flush()
+
+    def __save_index(self):
+
+        index_path = os.path.join(self.directory, _INDEX_NAME)
+        temp_path = index_path + ".new"
+
+        with open(temp_path, "w") as handle:
+            json.dump(self.__index, handle)
+
+        os.rename(temp_path, index_path)
+
+    def __remove(self, key):
+
+        record = self.__index.pop(key, None)
+
+        if record is None:
+            return
+
+        self.__size -= record["size"]
+
+        try:
+            os.remove(self.__path(key))
+        except OSError:
+            pass
+
+    def __evict(self):
+
+        """Remove the least recently used entries until the cache fits in
+        its size budget."""
+
+        if self.__size <= self.max_size:
+            return
+
+        by_access = sorted(self.__index.items(),
+                           key=lambda item: item[1]["accessed"])
+
+        for key, _ in by_access:
+
+            if self.__size <= self.max_size:
+                break
+
+            self.__remove(key)
+
+    def lookup(self, key):
+
+        """Look up a cached answer.
+
+        :param key: The request key (see :func:`danbooru.api.utils.request_key`)
+        :return: A :class:`CacheEntry`, or :const:`None` if not cached
+
+        """
+
+        record = self.__index.get(key)
+
+        if record is None:
+            return
+
+        try:
+            with open(self.__path(key), "rb") as handle:
+                data = handle.read()
+        except (IOError, OSError):
+            self.__remove(key)
+            return
+
+        record["accessed"] = time.time()
+
+        return CacheEntry(data, record.get("etag"),
+                          record.get("last_modified"), record["stored"])
+
+    def store(self, key, data, etag=None, last_modified=None):
+
+        """Store an answer in the cache.
+
+        :param key: The request key
+        :param data: The body of the answer, as bytes
+        :param etag: The ETag sent by the server, if any
+        :param last_modified: The Last-Modified header sent by the server
+
+        """
+
+        self.__remove(key)
+
+        if len(data) > self.max_size:
+            return
+
+        path = self.__path(key)
+        temp_path = path + ".new"
+
+        with open(temp_path, "wb") as handle:
+            handle.write(data)
+
+        os.rename(temp_path, path)
+
+        now = time.time()
+        self.__index[key] = dict(size=len(data), etag=etag,
+                                 last_modified=last_modified, stored=now,
+                                 accessed=now)
+        self.__size += len(data)
+
+        self.__evict()
+        self.__changed()
+
+    def refresh(self, key):
+
+        """Mark an entry as fresh, after the server confirmed it is still
+        valid."""
+
+        record = self.__index.get(key)
+
+        if record is None:
+            return
+
+        record["stored"] = record["accessed"] = time.time()
+        self.__changed()
+
+    def set_max_size(self, max_size):
+
+        """Change the size budget, evicting entries if needed."""
+
+        self.max_size = max_size
+        self.__evict()
+        self.__changed()
+
+    def clear(self):
+
+        "Remove all the entries from the cache."
+
+        for key in list(self.__index):
+            self.__remove(key)
+
+        self.__dirty = True
+        self.flush()
+
+    def flush(self):
+
+        """Write the index to disk, if it was modified since it was last
+        written."""
+
+        if self.__dirty:
+            self.__save_index()
+
+        self.__dirty = False
+        self.__saved = time.time()
+
+    def close(self):
+
+        "Write the pending changes to disk, before exiting."
+
+        self.flush()
+
+
+class TagCache(object):
+
+    """In-memory cache of :class:`DanbooruTag
+    <danbooru.api.containers.DanbooruTag>` instances, keyed by name.
+
+    :param ttl: The number of seconds after which a tag is considered stale
+
+    """
+
+    def __init__(self, ttl=DEFAULT_TAG_TTL):
+
+        self.ttl = ttl
+        self.__tags = dict()
+
+    def __len__(self):
+
+        return len(self.__tags)
+
+    def __contains__(self, name):
+
+        return self.get(name) is not None
+
+    def get(self, name):
+
+        """Return the tag called *name*, or :const:`None` if it is not
+        cached or stale."""
+
+        record = self.__tags.get(name)
+
+        if record is None:
+            return
+
+        tag, stored = record
+
+        if time.time() - stored > self.ttl:
+            del self.__tags[name]
+            return
+
+        return tag
+
+    def put(self, tag):
+
+        "Store a tag in the cache."
+
+        self.__tags[tag.name] = (tag, time.time())
+
+    def clear(self):
+
+        "Remove all the tags from the cache."
+
+        self.__tags.clear()
+
+
+class ThumbnailCache(object):
+
+    """In-memory cache of decoded thumbnails (``QPixmap`` instances), keyed
+    by the board and the MD5 hash of the post, so that boards never collide.
+
+    :param max_size: The memory budget, in bytes
+
+    The least recently used thumbnails are evicted once the budget is
+    exceeded. :attr:`statistics` counts hits, misses and evictions.
+
+    """
+
+    def __init__(self, max_size=DEFAULT_THUMBNAIL_SIZE):
+
+        self.max_size = max_size
+        self.__pixmaps = collections.OrderedDict()
+        self.__size = 0
+        self.__stats = dict(hits=0, misses=0, evictions=0)
+
+    def __len__(self):
+
+        return len(self.__pixmaps)
+
+    def __contains__(self, key):
+
+        return key in self.__pixmaps
+
+    @staticmethod
+    def __cost(pixmap):
+
+        return pixmap.width() * pixmap.height() * max(pixmap.depth(), 8) // 8
+
+    @property
+    def size(self):
+
+        "The memory used by the stored thumbnails, in bytes (estimated)."
+
+        return self.__size
+
+    @property
+    def statistics(self):
+
+        """A dictionary with the number of lookups which found a thumbnail
+        (``hits``) or not (``misses``), of thumbnails evicted
+        (``evictions``), and of thumbnails and bytes stored (``count`` and
+        ``size``)."""
+
+        statistics = dict(self.__stats)
+        statistics.update(count=len(self.__pixmaps), size=self.__size)
+
+        return statistics
+
+    def __remove(self, key):
+
+        self.__size -= self.__pixmaps.pop(key)[1]
+
+    def __evict(self):
+
+        while self.__size > self.max_size and self.__pixmaps:
+            key, (pixmap, cost) = self.__pixmaps.popitem(last=False)
+            self.__size -= cost
+            self.__stats["evictions"] += 1
+
+    def get(self, board_url, md5):
+
+        """Return the thumbnail of the post with hash *md5* on the board at
+        *board_url*, or :const:`None` if it is not cached."""
+
+        key = (board_url, md5)
+        record = self.__pixmaps.pop(key, None)
+
+        if record is None:
+            self.__stats["misses"] += 1
+            return
+
+        # Most recently used last
+        self.__pixmaps[key] = record
+        self.__stats["hits"] += 1
+
+        return record[0]
+
+    def put(self, board_url, md5, pixmap):
+
+        "Store the thumbnail of a post in the cache."
+
+        if md5 is None or pixmap is None or pixmap.isNull():
+            return
+
+        key = (board_url, md5)
+
+        if key in self.__pixmaps:
+            self.__remove(key)
+
+        cost = self.__cost(pixmap)
+
+        if cost > self.max_size:
+            return
+
+        self.__pixmaps[key] = (pixmap, cost)
+        self.__size += cost
+        self.__evict()
+
+    def cost(self, board_url, md5):
+
+        """Return the memory used by the thumbnail of the post with hash
+        *md5* on the board at *board_url*, or 0 if it is not cached. Unlike
+        :meth:`get`, it does not count as a use."""
+
+        record = self.__pixmaps.get((board_url, md5))
+
+        return 0 if record is None else record[1]
+
+    def remove(self, board_url, md5):
+
+        "Remove the thumbnail of a post from the cache."
+
+        key = (board_url, md5)
+
+        if key in self.__pixmaps:
+            self.__remove(key)
+
+    def set_max_size(self, max_size):
+
+        """Change the memory budget, evicting thumbnails if needed."""
+
+        self.max_size = max_size
+        self.__evict()
+
+    def clear(self):
+
+        "Remove all the thumbnails from the cache."
+
+        self.__pixmaps.clear()
+        self.__size = 0
@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#   Copyright 2011 Luca Beltrame <einar@heavensinferno.net>
+#
+#   This program is free software; you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License, under
+#   version 2 of the License, or (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details
+#
+#   You should have received a copy of the GNU General Public
+#   License along with this program; if not, write to the
+#   Free Software Foundation, Inc.,
+#   51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+"""This module contains the index used to complete tag names.
+
+Boards have hundreds of thousands of tags, so the names are not kept as
+separate strings: they are concatenated, in alphabetical order, into a
+single string, and located through an array of offsets. The tags starting
+with a prefix form a contiguous range, found by binary search.
+
+Completions are ranked by post count. For short prefixes the range can hold
+tens of thousands of tags, so the best ones for each prefix with a large
+range are computed once, when the index is built; smaller ranges are
+ranked when needed.
+
+"""
+
+__all__ = ["CompletionIndex"]
+
+import heapq
+import sys
+
+from array import array
+
+from .tagindex import _prefix_end
+
+if sys.version_info.major > 2:
+    unicode = str
+
+# Ranges up to this size are ranked on each request
+SCAN_LIMIT = 256
+
+# How many of the best tags are kept for the prefixes with larger ranges
+TOP_SIZE = 20
+
+_SEPARATOR = "\n"
+
+
+class CompletionIndex(object):
+
+    """A compact, read-only index of tag names ranked by post count.
+
+    :param entries: An iterable of ``(name, count)`` tuples, sorted by name
+
+    """
+
+    def __init__(self, entries):
+
+        pieces = list()
+        self.__offsets = array("L")
+        self.__counts = array("L")
+        offset = 0
+
+        for name, count in entries:
+            self.__offsets.append(offset)
+            self.__counts.append(max(int(count or 0), 0))
+            pieces.append(name)
+            offset += len(name) + 1
+
+        self.__offsets.append(offset)
+
+        # A trailing separator, so that every name ends with one
+        pieces.append("")
+        self.__names = unicode(_SEPARATOR).join(pieces)
+
+        self.__top = dict()
+
+        if len(self):
+            self.__rank(0, len(self), 0, unicode())
+
+    def __len__(self):
+
+        return len(self.__offsets) - 1
+
+    def __name(self, index):
+
+        return self.__names[self.__offsets[index]:
+                            self.__offsets[index + 1] - 1]
+
+    def __lower_bound(self, key, low=0, high=None):
+
+        """Return the position of the first name not lower than *key*."""
+
+        if high is None:
+            high = len(self)
+
+        while low < high:
+
+            middle = (low + high) // 2
+
+            if self.__name(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+
+        return low
+
+    def __range(self, prefix, low=0, high=None):
+
+        """Return the range of the names starting with *prefix*."""
+
+        first = self.__lower_bound(prefix, low, high)
+        last = self.__lower_bound(_prefix_end(prefix), first, high)
+
+        return first, last
+
+    def __best(self, candidates, limit):
+
+        return heapq.nlargest(limit, candidates,
+                              key=self.__counts.__getitem__)
+
+    def __rank(self, low, high, depth, prefix):
+
+        """Compute the best tags of the large ranges, recursively.
+
+        :return: The best positions in the range of *prefix*
+
+        """
+
+        if high - low <= SCAN_LIMIT:
+            return self.__best(range(low, high), TOP_SIZE)
+
+        candidates = list()
+        position = low
+
+        # The name equal to the prefix itself comes first
+        if len(self.__name(position)) == depth:
+            candidates.append(position)
+            position += 1
+
+        while position < high:
+
+            child = prefix + self.__name(position)[depth]
+            _, end = self.__range(child, position, high)
+            candidates.extend(self.__rank(position, end, depth + 1, child))
+            position = end
+
+        best = self.__best(candidates, TOP_SIZE)
+        self.__top[prefix] = array("L", best)
+
+        return best
+
+    def complete(self, prefix, limit=10):
+
+        """Return the names of the tags starting with *prefix*, the most
+        used first.
+
+        :param prefix: The start of the names
+        :param limit: The maximum number of names returned (at most
+                      :const:`TOP_SIZE` for short prefixes)
+
+        """
+
+        prefix = unicode(prefix)
+        top = self.__top.get(prefix)
+
+        if top is not None:
+            return [self.__name(index) for index in top[:limit]]
+
+        if not prefix:
+            return list()
+
+        # Prefixes with larger ranges are all in the precomputed table
+        low, high = self.__range(prefix)
+        best = self.__best(range(low, high), limit)
+
+        return [self.__name(index) for index in best]
@@ -17,52 +17,144 @@
 #   Free Software Foundation, Inc.,
 #   51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 
-"""This module contains classes which wrap Danbooru's XML
-API requests into proper objects."""
+"""This module contains classes which wrap Danbooru's API answers into
+proper objects.
+
+The containers are built from dictionaries holding the fields of each item,
+regardless of whether they were parsed from XML or JSON answers (see
+:mod:`danbooru.api.parsers`).
+
+"""
 
 import sys
 
 if sys.version_info.major > 2:
     unicode = str
+    intern = sys.intern
+else:
+    # The built-in intern only accepts byte strings
+    _interned = dict()
+
+    def intern(string):
+        return _interned.setdefault(string, string)
+
+
+def _text(value):
+
+    """Convert a field to text, returning :const:`None` for missing or empty
+    fields."""
+
+    if value is None or value == "":
+        return None
+
+    # XML answers spell booleans in lower case
+    if isinstance(value, bool):
+        return unicode(value).lower()
+
+    return unicode(value)
+
+
+def _integer(value):
+
+    """Convert a field to an integer, returning :const:`None` for missing or
+    invalid fields."""
+
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+# Rating codes, in increasing order of explicitness
+SAFE, QUESTIONABLE, EXPLICIT = range(3)
+
+RATINGS = ("Safe", "Questionable", "Explicit")
+
+_RATING_CODES = dict(s=SAFE, q=QUESTIONABLE, e=EXPLICIT)
+
 
 class DanbooruPost(object):
 
     """A class representing a Danbooru post.
 
-    :param data: The parsed XML answer from the API call
+    The fields are decoded once, when the post is created: tags are kept as
+    a tuple of interned strings (shared among all the posts) and the rating
+    as a small integer code. Posts compare
+    and hash by their ID, so the same post is only kept once in sets.
+
+    :param data: A dictionary with the fields of the post
     :param pixmap: A ``QPixmap`` which contains the thumbnail (default:
                    :const:`None`
+
+    :attr:`board` is the URL of the board the post comes from, once known.
     """
 
+    __slots__ = ("id", "md5", "tags", "rating_code", "width", "height",
+                 "file_size", "file_url", "preview_url", "sample_url",
+                 "board", "_pixmap")
+
     def __init__(self, data, pixmap=None):
 
-        self.__data = data
-        self.__pixmap = None
+        self.id = _integer(data.get("id"))
+        self.md5 = _text(data.get("md5"))
+        self.tags = tuple(intern(tag) for tag in
+                          (_text(data.get("tags")) or unicode()).split())
+        self.rating_code = _RATING_CODES.get(_text(data.get("rating")), SAFE)
+        self.width = _integer(data.get("width"))
+        self.height = _integer(data.get("height"))
+        self.file_size = _integer(data.get("file_size"))
+        self.file_url = _text(data.get("file_url"))
+        self.preview_url = _text(data.get("preview_url"))
+        self.sample_url = _text(data.get("sample_url"))
+        self.board = None
+        self._pixmap = pixmap
 
-    def __getattr__(self, value):
+    def __repr__(self):
+
+        return "<DanbooruPost %s>" % self.id
+
+    def __eq__(self, other):
 
-        result = self.__data.value(value).toString()
+        if not isinstance(other, DanbooruPost):
+            return NotImplemented
 
-        if result.isEmpty():
-            return None
-        else:
-            return unicode(result)
+        if self.id is None or other.id is None:
+            return self is other
+
+        return self.id == other.id
+
+    def __ne__(self, other):
+
+        result = self.__eq__(other)
+
+        if result is NotImplemented:
+            return result
+
+        return not result
+
+    def __hash__(self):
+
+        if self.id is None:
+            return object.__hash__(self)
+
+        return hash(self.id)
 
     @property
     def pixmap(self):
 
         """A QPixmap instance holding the thumbnail of the post,
-        or :const:`None` if the thumbnail has not been downloaded"""
+        or :const:`None` if the thumbnail has not been downloaded (or has
+        been released, to be borrowed from the thumbnail cache instead)"""
 
-        return self.__pixmap
+        return self._pixmap
 
     @pixmap.setter
     def pixmap(self, pixmap):
 
-        if pixmap.isNull():
+        if pixmap is not None and pixmap.isNull():
             return
 
-        self.__pixmap = pixmap
+        self._pixmap = pixmap
 
     @property
     def rating(self):
@@ -73,30 +165,16 @@ class DanbooruPost(object):
 
         """
 
-        ratings = dict(s="Safe", q="Questionable", e="Explicit")
-        rating = unicode(self.__data.value("rating").toString())
-
-        rating = ratings.get(rating)
-
-        if rating is None:
-            return "Safe"
+        return RATINGS[self.rating_code]
 
-        return rating
-
-
-    @property
-    def tags(self):
 
-        """The tags for the image."""
-
-        tags = unicode(self.__data.value("tags").toString())
-
-        return tags.split(" ")
+class DanbooruTag(object):
 
+    """A class representing a Danbooru tag.
 
-class DanbooruTag(object):
+    :param data: A dictionary with the fields of the tag
 
-    """A class representing a Danbooru tag."""
+    """
 
     _TYPES = {0: "General", 1: "Artist", 3: "Copyright",
               4: "Character"}
@@ -107,12 +185,17 @@ class DanbooruTag(object):
 
     def __getattr__(self, value):
 
-        result = self.__data.value(value).toString()
+        return _text(self.__data.get(value))
+
+    @property
+    def type_code(self):
+
+        "The type of the tag, as the integer used by the API."
 
-        if result.isEmpty():
-            return None
-        else:
-            return unicode(result)
+        try:
+            return int(self.__data.get("type") or 0)
+        except ValueError:
+            return 0
 
     @property
     def type(self):
@@ -120,7 +203,7 @@ class DanbooruTag(object):
         """The type of the tag, among "general", "artist",
         "copyright" and "character"."""
 
-        tag_type = int(self.__data.attrib["type"])
+        tag_type = self.type_code
 
         if tag_type not in self._TYPES:
             return unicode("Unknown (%s)" % tag_type)
@@ -130,7 +213,11 @@ class DanbooruTag(object):
 
 class DanbooruPool(object):
 
-    """A class representing a Danbooru pool."""
+    """A class representing a Danbooru pool.
+
+    :param data: A dictionary with the fields of the pool
+
+    """
 
     def __init__(self, data):
 
@@ -138,19 +225,14 @@ class DanbooruPool(object):
 
     def __getattr__(self, value):
 
-        result = self.__data.value(value).toString()
-
-        if result.isEmpty():
-            return None
-        else:
-            return unicode(result)
+        return _text(self.__data.get(value))
 
     @property
     def description(self):
 
-        description = result = self.__data.value("description").toString()
+        description = _text(self.__data.get("description"))
 
-        if description.isEmpty():
+        if description is None:
             return "N/A"
 
-        return unicode(description)
+        return description
@@ -0,0 +1,208 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#   Copyright 2011 Luca Beltrame <einar@heavensinferno.net>
+#
+#   This program is free software; you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License, under
+#   version 2 of the License, or (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details
+#
+#   You should have received a copy of the GNU General Public
+#   License along with this program; if not, write to the
+#   Free Software Foundation, Inc.,
+#   51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+"""This module contains the decoding of thumbnails.
+
+Decoding a JPEG or PNG image takes a few milliseconds, which adds up to a
+noticeable pause when a whole page of thumbnails arrives at once. Images
+are therefore decoded (into a ``QImage``, which unlike ``QPixmap`` can be
+used outside the GUI thread) by a pool of worker threads. The results are
+handed back to the GUI thread, converted to pixmaps there, a batch at a
+time, so that the event loop keeps running between batches.
+
+"""
+
+__all__ = ["ThumbnailDecoder", "shared_decoder"]
+
+import itertools
+import time
+
+import PyQt4.QtCore as QtCore
+import PyQt4.QtGui as QtGui
+
+# Number of decoded images converted to pixmaps at each pass
+BATCH_SIZE = 20
+
+# Delay before converting decoded images, so that they are batched, in ms
+_BATCH_DELAY = 10
+
+
+class _DecodeSignals(QtCore.QObject):
+
+    finished = QtCore.pyqtSignal(int, QtGui.QImage, float)
+
+
+class _DecodeTask(QtCore.QRunnable):
+
+    """Decode an image in a thread of the pool."""
+
+    def __init__(self, task_id, data, signals):
+
+        super(_DecodeTask, self).__init__()
+
+        self.task_id = task_id
+        self.data = data
+        self.signals = signals
+
+    def run(self):
+
+        started = time.time()
+        image = QtGui.QImage()
+        image.loadFromData(self.data)
+
+        self.signals.finished.emit(self.task_id, image, time.time() - started)
+
+
+class ThumbnailDecoder(QtCore.QObject):
+
+    """Decode thumbnails in worker threads.
+
+    :param workers: The number of worker threads
+
+    :attr:`statistics` holds the time taken to decode the images, and the
+    time from their submission to the delivery of the pixmaps.
+
+    """
+
+    def __init__(self, workers=2, parent=None):
+
+        super(ThumbnailDecoder, self).__init__(parent)
+
+        self.__pool = QtCore.QThreadPool(self)
+        self.__pool.setMaxThreadCount(max(int(workers), 1))
+
+        # Created in the GUI thread, so its signals are delivered there
+        self.__signals = _DecodeSignals(self)
+        self.__signals.finished.connect(self.__slot_decoded)
+
+        self.__ids = itertools.count()
+        self.__pending = dict()
+        self.__ready = list()
+        self.__stats = dict(decoded=0, failed=0, decode_time=0.0,
+                            max_decode_time=0.0, latency=0.0,
+                            max_latency=0.0)
+
+        self.__timer = QtCore.QTimer(self)
+        self.__timer.setSingleShot(True)
+        self.__timer.setInterval(_BATCH_DELAY)
+        self.__timer.timeout.connect(self.__flush)
+
+    @property
+    def workers(self):
+
+        "The number of worker threads."
+
+        return self.__pool.maxThreadCount()
+
+    @property
+    def statistics(self):
+
+        """A dictionary with the number of images decoded (``decoded``) or
+        not (``failed``), and the mean and maximum time (in seconds) taken
+        to decode them (``decode_time`` and ``max_decode_time``) and to
+        deliver their pixmaps, including the wait in the queue
+        (``latency`` and ``max_latency``)."""
+
+        statistics = dict(self.__stats)
+        count = max(statistics["decoded"] + statistics["failed"], 1)
+        statistics["decode_time"] /= count
+        statistics["latency"] /= count
+        statistics["pending"] = len(self.__pending)
+
+        return statistics
+
+    def __slot_decoded(self, task_id, image, elapsed):
+
+        self.__ready.append((task_id, image, elapsed))
+
+        if not self.__timer.isActive():
+            self.__timer.start()
+
+    def __flush(self):
+
+        """Convert a batch of decoded images to pixmaps, and hand them
+        over."""
+
+        batch = self.__ready[:BATCH_SIZE]
+        del self.__ready[:BATCH_SIZE]
+
+        now = time.time()
+
+        for task_id, image, elapsed in batch:
+
+            callback, submitted, task = self.__pending.pop(task_id)
+
+            if image.isNull():
+                pixmap = None
+                self.__stats["failed"] += 1
+            else:
+                pixmap = QtGui.QPixmap.fromImage(image)
+                self.__stats["decoded"] += 1
+
+            latency = now - submitted
+            self.__stats["decode_time"] += elapsed
+            self.__stats["latency"] += latency
+            self.__stats["max_decode_time"] = max(
+                self.__stats["max_decode_time"], elapsed)
+            self.__stats["max_latency"] = max(self.__stats["max_latency"],
+                                              latency)
+
+            callback(pixmap)
+
+        if self.__ready:
+            self.__timer.start()
+
+    def decode(self, data, callback):
+
+        """Decode the image in *data* (encoded JPEG or PNG bytes) in a
+        worker thread.
+
+        :param callback: Called in the GUI thread with the ``QPixmap``, or
+                         :const:`None` if the image could not be decoded
+
+        """
+
+        task_id = next(self.__ids)
+        task = _DecodeTask(task_id, data, self.__signals)
+
+        # Kept until finished, rather than owned by the pool
+        task.setAutoDelete(False)
+        self.__pending[task_id] = (callback, time.time(), task)
+        self.__pool.start(task)
+
+    def set_workers(self, workers):
+
+        "Change the number of worker threads."
+
+        self.__pool.setMaxThreadCount(max(int(workers), 1))
+
+
+_DECODER = None
+
+
+def shared_decoder():
+
+    """Return the thumbnail decoder shared by the whole application."""
+
+    global _DECODER
+
+    if _DECODER is None:
+        _DECODER = ThumbnailDecoder()
+
+    return _DECODER
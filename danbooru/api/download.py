@@ -0,0 +1,660 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#   Copyright 2011 Luca Beltrame <einar@heavensinferno.net>
+#
+#   This program is free software; you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License, under
+#   version 2 of the License, or (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details
+#
+#   You should have received a copy of the GNU General Public
+#   License along with this program; if not, write to the
+#   Free Software Foundation, Inc.,
+#   51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+"""This module contains the download of full images, and the queue they
+are started from.
+
+Images are written to a partial file (with a ``.part`` suffix) next to the
+destination. When the connection drops, the download is resumed from where
+it stopped, with a HTTP range request, rather than started again. Once
+complete, the MD5 hash of the file is compared with the one of the post (in
+a separate thread, as images can be large), and only then is the file moved
+to its destination. Corrupted or truncated files are deleted and downloaded
+again.
+
+Downloads are submitted to a :class:`DownloadManager`, which starts only a
+few of them at the same time (in total, and for each host), the ones asked
+for by the user before the batch downloads.
+
+"""
+
+__all__ = ["ImageDownload", "DownloadManager", "shared_manager",
+           "PART_SUFFIX", "HIGH_PRIORITY", "NORMAL_PRIORITY"]
+
+import bisect
+import hashlib
+import itertools
+import os
+import sys
+import time
+
+from functools import partial
+
+import PyQt4.QtCore as QtCore
+import PyKDE4.kdecore as kdecore
+from PyKDE4.kio import KIO
+
+from . import ratelimit
+from .journal import DONE, FAILED, RUNNING
+
+if sys.version_info.major > 2:
+    unicode = str
+
+PART_SUFFIX = ".part"
+
+# Size of the blocks read when computing checksums
+_BLOCK_SIZE = 1024 * 1024
+
+# Priorities of the downloads in the queue: lower values start first
+HIGH_PRIORITY = 0
+NORMAL_PRIORITY = 1
+
+# Interval (in milliseconds) between updates of the transfer speed
+_STATUS_INTERVAL = 1000
+
+# Weight of the last interval in the average transfer speed
+_SPEED_SMOOTHING = 0.3
+
+
+class _ChecksumSignals(QtCore.QObject):
+
+    finished = QtCore.pyqtSignal(unicode)
+
+
+class _Checksum(QtCore.QRunnable):
+
+    """Compute the MD5 hash of a file in a thread of the global
+    ``QThreadPool``."""
+
+    def __init__(self, path):
+
+        super(_Checksum, self).__init__()
+
+        self.path = path
+        self.signals = _ChecksumSignals()
+
+    def run(self):
+
+        digest = hashlib.md5()
+
+        try:
+            with open(self.path, "rb") as handle:
+                for block in iter(lambda: handle.read(_BLOCK_SIZE), b""):
+                    digest.update(block)
+        except (IOError, OSError):
+            self.signals.finished.emit("")
+            return
+
+        self.signals.finished.emit(digest.hexdigest())
+
+
+class ImageDownload(QtCore.QObject):
+
+    """Download of a single full image.
+
+    :param url: The URL of the image
+    :param destination: The ``KUrl`` of the file to save the image to
+    :param md5: The expected MD5 hash of the image, or :const:`None` to skip
+                the verification
+    :param board_url: The URL of the board, whose budget for static files
+                      in *limiter* is used
+    :param limiter: The :class:`RateLimiter
+                    <danbooru.api.ratelimit.RateLimiter>` the download is
+                    subject to, or :const:`None`
+    :param size: The expected size of the image in bytes, if known
+
+    The post the image belongs to can be recorded in :attr:`post_id` and
+    :attr:`tags`, which are kept by the journal of the downloads.
+
+    :attr:`finished` is emitted with the download itself once done: its
+    :attr:`error` is :const:`None` if the image was saved, and
+    :attr:`cancelled` is :const:`True` if it was cancelled. Only local
+    destinations can be resumed and verified; others are copied directly.
+
+    """
+
+    finished = QtCore.pyqtSignal(QtCore.QObject)
+
+    def __init__(self, url, destination, md5=None, board_url=None,
+                 limiter=None, parent=None, size=None):
+
+        super(ImageDownload, self).__init__(parent)
+
+        self.url = kdecore.KUrl(url)
+        self.destination = kdecore.KUrl(destination)
+        self.md5 = None if md5 is None else unicode(md5).lower()
+        self.board_url = board_url or unicode(self.url.url())
+        self.limiter = limiter
+        self.error = None
+        self.cancelled = False
+        self.attempts = 0
+        self.job = None
+        self.size = int(size) if size else 0
+        self.received = 0
+        self.post_id = None
+        self.tags = list()
+        self.journal_id = None
+        self.__offset = 0
+        self.__checksum = None
+        self.__aborted = False
+
+        # Tells callbacks of earlier attempts, still pending in the rate
+        # limiter or in a retry timer, from those of the current one
+        self.__generation = 0
+
+        if self.destination.isLocalFile():
+            self.path = unicode(self.destination.toLocalFile())
+            self.partial_path = self.path + PART_SUFFIX
+        else:
+            self.path = self.partial_path = None
+
+    def __request(self, generation):
+
+        if generation != self.__generation:
+            return
+
+        start = partial(self.__start, generation)
+
+        if self.limiter is None:
+            start()
+        else:
+            self.limiter.request(self.board_url, start, static=True)
+
+    def __start(self, generation):
+
+        # Aborted, or restarted since this attempt was scheduled
+        if self.__aborted or generation != self.__generation:
+            return
+
+        flags = KIO.HideProgressInfo | KIO.Overwrite
+
+        if self.partial_path is not None:
+            # Appends to what an earlier attempt left
+            destination = kdecore.KUrl(self.partial_path)
+            flags |= KIO.Resume
+
+            try:
+                self.__offset = os.path.getsize(self.partial_path)
+            except OSError:
+                self.__offset = 0
+        else:
+            destination = self.destination
+            self.__offset = 0
+
+        self.received = self.__offset
+        self.job = KIO.file_copy(self.url, destination, -1,
+                                 KIO.JobFlags(flags))
+        self.job.processedSize.connect(self.__slot_processed)
+        self.job.totalSize.connect(self.__slot_total)
+        self.job.result.connect(self.__slot_result)
+
+    def __retry(self, restart=False):
+
+        """Try again after a random delay, discarding the partial file if
+        *restart* is :const:`True`.
+
+        :return: :const:`False` if there are no attempts left
+
+        """
+
+        if self.attempts >= ratelimit.MAX_RETRIES:
+            return False
+
+        if restart:
+            self.__remove_partial()
+
+        delay = ratelimit.retry_delay(self.attempts)
+        self.attempts += 1
+        QtCore.QTimer.singleShot(int(delay * 1000),
+                                 partial(self.__request, self.__generation))
+
+        return True
+
+    def __remove_partial(self):
+
+        if self.partial_path is not None and os.path.exists(
+            self.partial_path):
+            os.remove(self.partial_path)
+
+    def __slot_processed(self, job, size):
+
+        # Whether resumed transfers count the bytes already there or not
+        self.received = max(self.__offset, int(size))
+
+    def __slot_total(self, job, size):
+
+        if size:
+            self.size = max(int(size), self.__offset)
+
+    def __finish(self, error=None):
+
+        self.job = None
+        self.error = error
+        self.finished.emit(self)
+
+    def __slot_result(self, job):
+
+        if self.__aborted:
+            return
+
+        if job.error():
+
+            if ratelimit.is_throttled(job) and self.limiter is not None:
+                self.limiter.throttled(self.board_url, job, static=True)
+
+            # The board does not support ranges: start from scratch
+            if job.error() == KIO.ERR_CANNOT_RESUME:
+                if self.__retry(restart=True):
+                    return
+
+            elif ratelimit.should_retry(job) and self.__retry():
+                return
+
+            self.__finish(unicode(job.errorString()))
+            return
+
+        if self.limiter is not None:
+            self.limiter.succeeded(self.board_url, static=True)
+
+        if self.partial_path is None:
+            self.__finish()
+            return
+
+        if self.md5 is None:
+            self.__slot_verified(self.__generation, None)
+            return
+
+        self.__checksum = _Checksum(self.partial_path)
+        self.__checksum.setAutoDelete(False)
+        self.__checksum.signals.finished.connect(
+            partial(self.__slot_verified, self.__generation))
+        QtCore.QThreadPool.globalInstance().start(self.__checksum)
+
+    def __slot_verified(self, generation, digest):
+
+        if generation != self.__generation:
+            return
+
+        self.__checksum = None
+
+        if self.__aborted:
+            return
+
+        if digest is not None and unicode(digest) != self.md5:
+
+            # Corrupted or truncated: download it again
+            if self.__retry(restart=True):
+                return
+
+            self.__remove_partial()
+            self.__finish(unicode(kdecore.i18n("The downloaded file is "
+                                               "corrupted")))
+            return
+
+        try:
+            # Atomic, as both files are in the same directory
+            os.rename(self.partial_path, self.path)
+        except OSError as error:
+            self.__finish(unicode(error))
+            return
+
+        self.__finish()
+
+    def start(self):
+
+        "Start the download."
+
+        self.__aborted = False
+        self.cancelled = False
+        self.attempts = 0
+        self.error = None
+        self.__generation += 1
+        self.__request(self.__generation)
+
+    def abort(self):
+
+        """Stop the download. The partial file is kept, so that the download
+        can be resumed later."""
+
+        self.__aborted = True
+        self.__generation += 1
+
+        if self.job is not None:
+            self.job.kill()
+            self.job = None
+
+    def cancel(self):
+
+        """Stop the download for good, deleting the partial file.
+        :attr:`finished` is emitted."""
+
+        self.abort()
+        self.__remove_partial()
+        self.cancelled = True
+        self.__finish(unicode(kdecore.i18n("The download was cancelled")))
+
+
+class DownloadManager(QtCore.QObject):
+
+    """Queue of image downloads, started a few at a time.
+
+    :param max_jobs: How many downloads run at the same time
+    :param max_host_jobs: How many downloads from the same host run at the
+                          same time
+    :param journal: A :class:`DownloadJournal
+                    <danbooru.api.journal.DownloadJournal>` recording the
+                    downloads, or :const:`None`
+
+    Downloads (:class:`ImageDownload` instances) start by priority, and in
+    the order they were submitted within the same priority. Their
+    :attr:`finished <ImageDownload.finished>` signal is emitted as usual.
+
+    :attr:`statusChanged` is emitted when the queue changes and, while
+    downloads run, about every second (see :meth:`status`).
+    :attr:`queueFinished` is emitted once the queue is empty.
+
+    """
+
+    statusChanged = QtCore.pyqtSignal()
+    queueFinished = QtCore.pyqtSignal()
+
+    def __init__(self, max_jobs=5, max_host_jobs=2, journal=None,
+                 parent=None):
+
+        super(DownloadManager, self).__init__(parent)
+
+        self.max_jobs = max(int(max_jobs), 1)
+        self.max_host_jobs = max(int(max_host_jobs), 1)
+        self.journal = journal
+        self.paused = False
+
+        # Sorted (priority, sequence, download) tuples
+        self.__queue = list()
+        self.__sequence = itertools.count()
+        self.__running = dict()
+        self.__hosts = dict()
+
+        self.__finished = 0
+        self.__failed = 0
+        self.__done_bytes = 0
+        self.__done_size = 0
+        self.__speed = 0.0
+        self.__last_received = 0
+        self.__last_time = None
+
+        self.__timer = QtCore.QTimer(self)
+        self.__timer.setInterval(_STATUS_INTERVAL)
+        self.__timer.timeout.connect(self.__update_speed)
+
+    def __len__(self):
+
+        return len(self.__queue) + len(self.__running)
+
+    def __host(self, download):
+
+        return unicode(download.url.host())
+
+    def __downloads(self):
+
+        for key in self.__queue:
+            yield key[2]
+
+        for download in self.__running:
+            yield download
+
+    def __received(self):
+
+        # Paused downloads keep what they received
+        return self.__done_bytes + sum(download.received
+                                       for download in self.__downloads())
+
+    def __record(self, download, state):
+
+        if self.journal is not None and download.journal_id is not None:
+            self.journal.set_state(download.journal_id, state)
+
+    def __reset(self):
+
+        """Clear the counters, once the previous downloads are over."""
+
+        self.__finished = self.__failed = 0
+        self.__done_bytes = self.__done_size = 0
+        self.__speed = 0.0
+        self.__last_received = 0
+
+    def __dispatch(self):
+
+        """Start queued downloads while the limits allow."""
+
+        if self.paused:
+            return
+
+        index = 0
+
+        while (index < len(self.__queue) and
+               len(self.__running) < self.max_jobs):
+
+            key = self.__queue[index]
+            download = key[2]
+            host = self.__host(download)
+
+            # Others, from different hosts, can go ahead
+            if self.__hosts.get(host, 0) >= self.max_host_jobs:
+                index += 1
+                continue
+
+            del self.__queue[index]
+            self.__running[download] = key
+            self.__hosts[host] = self.__hosts.get(host, 0) + 1
+            self.__record(download, RUNNING)
+            download.start()
+
+        if self.__running and not self.__timer.isActive():
+            self.__last_time = time.time()
+            self.__last_received = self.__received()
+            self.__timer.start()
+
+    def __release(self, download):
+
+        key = self.__running.pop(download)
+        host = self.__host(download)
+        self.__hosts[host] -= 1
+
+        if not self.__hosts[host]:
+            del self.__hosts[host]
+
+        return key
+
+    def __update_speed(self):
+
+        now = time.time()
+        received = self.__received()
+        elapsed = now - self.__last_time
+
+        if elapsed > 0:
+            speed = max(received - self.__last_received, 0) / elapsed
+            self.__speed = (_SPEED_SMOOTHING * speed +
+                            (1 - _SPEED_SMOOTHING) * self.__speed)
+
+        self.__last_time = now
+        self.__last_received = received
+        self.statusChanged.emit()
+
+    def __slot_finished(self, download):
+
+        if download not in self.__running:
+            return
+
+        self.__release(download)
+        self.__done_bytes += download.received
+        self.__done_size += download.size
+
+        if download.error is None:
+            self.__finished += 1
+            self.__record(download, DONE)
+        elif not download.cancelled:
+            self.__failed += 1
+            self.__record(download, FAILED)
+
+        self.__dispatch()
+        self.__check_finished()
+
+    def __check_finished(self):
+
+        if not self.__running:
+            self.__timer.stop()
+
+        self.statusChanged.emit()
+
+        if not self.__queue and not self.__running:
+
+            # Nothing left to start again
+            if self.journal is not None:
+                self.journal.clear()
+
+            self.queueFinished.emit()
+
+    def submit(self, download, priority=NORMAL_PRIORITY):
+
+        """Add *download* to the queue. It starts as soon as the limits
+        allow.
+
+        :param download: An :class:`ImageDownload` not started yet
+        :param priority: :const:`HIGH_PRIORITY` for downloads asked for one
+                         at a time, :const:`NORMAL_PRIORITY` otherwise
+
+        Downloads restored from the journal keep their entry.
+
+        """
+
+        if not self.__queue and not self.__running:
+            self.__reset()
+
+        if self.journal is not None and download.journal_id is None:
+            download.journal_id = self.journal.add(download, priority)
+
+        download.finished.connect(self.__slot_finished)
+
+        bisect.insort(self.__queue,
+                      (priority, next(self.__sequence), download))
+        self.__dispatch()
+        self.statusChanged.emit()
+
+    def set_limits(self, max_jobs, max_host_jobs):
+
+        """Change how many downloads run at the same time, in total and for
+        each host. Running downloads are not stopped."""
+
+        self.max_jobs = max(int(max_jobs), 1)
+        self.max_host_jobs = max(int(max_host_jobs), 1)
+        self.__dispatch()
+
+    def pause(self):
+
+        """Stop all the downloads, keeping them in the queue. Partial files
+        are kept, so that they are resumed later."""
+
+        self.paused = True
+
+        for download in list(self.__running):
+            download.abort()
+            bisect.insort(self.__queue, self.__release(download))
+
+        self.__timer.stop()
+        self.__speed = 0.0
+        self.statusChanged.emit()
+
+    def resume(self):
+
+        "Start the downloads again after :meth:`pause`."
+
+        self.paused = False
+        self.__dispatch()
+        self.statusChanged.emit()
+
+    def cancel(self, download=None):
+
+        """Remove *download*, or all the downloads if it is :const:`None`,
+        from the queue, stopping them if running."""
+
+        if download is None:
+            cancelled = [key[2] for key in self.__queue]
+            cancelled.extend(self.__running)
+        else:
+            cancelled = [download]
+
+        self.__queue = [key for key in self.__queue
+                        if key[2] not in cancelled]
+
+        for item in cancelled:
+
+            if item in self.__running:
+                self.__release(item)
+
+            item.finished.disconnect(self.__slot_finished)
+            item.cancel()
+
+            if self.journal is not None and item.journal_id is not None:
+                self.journal.remove(item.journal_id)
+
+        self.__dispatch()
+        self.__check_finished()
+
+    def status(self):
+
+        """Return the state of the queue, as a dictionary holding:
+
+        - ``queued``, ``running``, ``finished`` and ``failed``: how many
+          downloads are in each state
+        - ``paused``: whether the queue is paused
+        - ``received`` and ``total``: the bytes received and expected
+          since the queue was last empty
+        - ``speed``: the average transfer speed, in bytes per second
+        - ``eta``: the time left in seconds, or :const:`None` if unknown
+
+        """
+
+        received = self.__received()
+        sizes = [download.size for download in self.__downloads()]
+        total = self.__done_size + sum(sizes)
+        eta = None
+
+        # Sizes known only for some downloads would give a wrong estimate
+        if self.__speed > 0 and all(sizes):
+            eta = max(total - received, 0) / self.__speed
+
+        return dict(queued=len(self.__queue), running=len(self.__running),
+                    finished=self.__finished, failed=self.__failed,
+                    paused=self.paused, received=received,
+                    total=total, speed=self.__speed, eta=eta)
+
+
+_MANAGER = None
+
+
+def shared_manager():
+
+    """Return the download queue shared by the whole application."""
+
+    global _MANAGER
+
+    if _MANAGER is None:
+        _MANAGER = DownloadManager()
+
+    return _MANAGER
@@ -0,0 +1,294 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#   Copyright 2011 Luca Beltrame <einar@heavensinferno.net>
+#
+#   This program is free software; you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License, under
+#   version 2 of the License, or (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details
+#
+#   You should have received a copy of the GNU General Public
+#   License along with this program; if not, write to the
+#   Free Software Foundation, Inc.,
+#   51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+"""This module contains the federated search, which runs the same search on
+several boards at once.
+
+A :class:`FederatedService` wraps one :class:`DanbooruService
+<danbooru.api.remote.DanbooruService>` for each board, and can be used in
+its place. Searches are sent to all the boards at the same time, and the
+posts of each board are made available as they arrive. The boards share a
+set of MD5 hashes, so that an image posted on several boards is shown (and
+its thumbnail retrieved) only once.
+
+Everything else (tags, pools, the tag index) comes from the first board,
+called the *primary* board. The thumbnail caches are shared by all the
+boards, so cached thumbnails of any board are found through the primary one.
+
+"""
+
+__all__ = ["FederatedService"]
+
+import sys
+import time
+
+from functools import partial
+
+import PyQt4.QtCore as QtCore
+
+from . import containers
+
+if sys.version_info.major > 2:
+    unicode = str
+
+
+class _FederatedScheduler(object):
+
+    """Forward the calls made to a thumbnail scheduler to the schedulers of
+    all the boards.
+
+    Each board numbers its lists of posts on its own: the groups of the
+    federated search are translated to the group of each board.
+
+    """
+
+    def __init__(self, services):
+
+        self.__services = services
+        self.__groups = dict()
+
+    def add_group(self, group, service, service_group):
+
+        self.__groups.setdefault(group, dict())[service] = service_group
+
+    def __translate(self, group):
+
+        return self.__groups.get(group, dict())
+
+    def set_active_group(self, group):
+
+        for service, service_group in self.__translate(group).items():
+            service.scheduler.set_active_group(service_group)
+
+    def set_visible_range(self, group, first, last):
+
+        for service, service_group in self.__translate(group).items():
+            service.scheduler.set_visible_range(service_group, first, last)
+
+    def cancel(self, group=None):
+
+        if group is None:
+            self.__groups.clear()
+
+            for service in self.__services:
+                service.scheduler.cancel()
+
+            return
+
+        for service, service_group in self.__groups.pop(group,
+                                                        dict()).items():
+            service.scheduler.cancel(service_group)
+
+
+class FederatedService(QtCore.QObject):
+
+    """Search several boards at once.
+
+    :param services: A list of :class:`DanbooruService
+                     <danbooru.api.remote.DanbooruService>` instances, one
+                     for each board. The first one is the primary board.
+
+    Once all the posts of a board have been retrieved, :attr:`boardFinished`
+    is emitted with the URL of the board and the time (in seconds) it took.
+    :attr:`latencies` holds the times of the last search.
+
+    """
+
+    postRetrieved = QtCore.pyqtSignal(containers.DanbooruPost)
+    postListStarted = QtCore.pyqtSignal(int)
+    postDownloadFinished = QtCore.pyqtSignal()
+    downloadError = QtCore.pyqtSignal(unicode)
+    boardFinished = QtCore.pyqtSignal(unicode, float)
+
+    def __init__(self, services, parent=None):
+
+        super(FederatedService, self).__init__(parent)
+
+        self.services = list(services)
+        self.primary = self.services[0]
+        self.scheduler = _FederatedScheduler(self.services)
+        self.latencies = dict()
+
+        self.__group = 0
+        self.__started = None
+        self.__pending = set()
+        self.__listed = set()
+        self.__md5 = set()
+
+        for service in self.services:
+            service.postRetrieved.connect(self.postRetrieved.emit)
+            service.postListStarted.connect(
+                partial(self.__slot_list_started, service))
+            service.postDownloadFinished.connect(
+                partial(self.__slot_board_finished, service))
+            service.downloadError.connect(
+                partial(self.__slot_download_error, service))
+
+    def __getattr__(self, name):
+
+        # Private attributes are never delegated
+        if name.startswith("_") or name == "primary":
+            raise AttributeError(name)
+
+        # Tags, pools and the tag index come from the primary board
+        return getattr(self.primary, name)
+
+    def __set_all(self, name, value):
+
+        for service in self.services:
+            setattr(service, name, value)
+
+    @property
+    def url(self):
+
+        return self.primary.url
+
+    @property
+    def urls(self):
+
+        "The URLs of all the boards searched."
+
+        return [service.url for service in self.services]
+
+    @property
+    def current_tags(self):
+
+        return self.primary.current_tags
+
+    @property
+    def tag_index(self):
+
+        return self.primary.tag_index
+
+    @tag_index.setter
+    def tag_index(self, tag_index):
+
+        self.primary.tag_index = tag_index
+
+    # Settings applied to all the boards
+
+    cache = property(lambda self: self.primary.cache,
+                     lambda self, value: self.__set_all("cache", value))
+    response_cache = property(
+        lambda self: self.primary.response_cache,
+        lambda self, value: self.__set_all("response_cache", value))
+    thumbnail_cache = property(
+        lambda self: self.primary.thumbnail_cache,
+        lambda self, value: self.__set_all("thumbnail_cache", value))
+    prefetch_depth = property(
+        lambda self: self.primary.prefetch_depth,
+        lambda self, value: self.__set_all("prefetch_depth", value))
+    prefetch_thumbnails = property(
+        lambda self: self.primary.prefetch_thumbnails,
+        lambda self, value: self.__set_all("prefetch_thumbnails", value))
+
+    @property
+    def request_statistics(self):
+
+        """The request counters of all the boards, summed. Timings are
+        in :attr:`latencies` instead."""
+
+        statistics = dict()
+
+        for service in self.services:
+            for key, value in service.request_statistics.items():
+                if isinstance(value, int):
+                    statistics[key] = statistics.get(key, 0) + value
+
+        return statistics
+
+    def __start_list(self, services):
+
+        """Prepare for a new list of posts from *services*."""
+
+        self.__group += 1
+        self.__started = time.time()
+        self.__pending = set(services)
+        self.__listed = set()
+        self.latencies = dict()
+
+        # A new set, as posts of the previous list may still arrive
+        self.__md5 = set()
+
+        for service in self.services:
+            service.seen_md5 = self.__md5
+
+        self.postListStarted.emit(self.__group)
+
+    def __finish_board(self, service):
+
+        if service not in self.__pending:
+            return
+
+        self.__pending.discard(service)
+        elapsed = time.time() - self.__started
+        self.latencies[service.url] = elapsed
+        self.boardFinished.emit(unicode(service.url), elapsed)
+
+        if not self.__pending:
+            self.postDownloadFinished.emit()
+
+    def __slot_list_started(self, service, service_group):
+
+        self.__listed.add(service)
+        self.scheduler.add_group(self.__group, service, service_group)
+        self.scheduler.set_active_group(self.__group)
+
+    def __slot_board_finished(self, service):
+
+        self.__finish_board(service)
+
+    def __slot_download_error(self, service, error):
+
+        self.downloadError.emit(error)
+
+        # A board failing before sending any post is done
+        if service not in self.__listed:
+            self.__finish_board(service)
+
+    def get_post_list(self, page=None, tags=None, limit=100, rating="Safe",
+                      blacklist=None):
+
+        """Retrieve posts from all the boards.
+
+        The parameters are the same as :meth:`DanbooruService.get_post_list
+        <danbooru.api.remote.DanbooruService.get_post_list>`. The posts of
+        each board are made available as they arrive, skipping those with
+        the same image as a post already received from another board.
+
+        """
+
+        self.__start_list(self.services)
+
+        for service in self.services:
+            service.get_post_list(page=page, tags=tags, limit=limit,
+                                  rating=rating, blacklist=blacklist)
+
+    def get_pool(self, pool_id, page=None, rating="Safe", blacklist=None):
+
+        """Download all the posts of a pool of the primary board."""
+
+        self.__start_list([self.primary])
+        self.primary.get_pool(pool_id, page=page, rating=rating,
+                              blacklist=blacklist)
+
+    def cancel_prefetch(self):
+
+        for service in self.services:
+            service.cancel_prefetch()
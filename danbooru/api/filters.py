@@ -0,0 +1,361 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#   Copyright 2011 Luca Beltrame <einar@heavensinferno.net>
+#
+#   This program is free software; you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License, under
+#   version 2 of the License, or (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details
+#
+#   You should have received a copy of the GNU General Public
+#   License along with this program; if not, write to the
+#   Free Software Foundation, Inc.,
+#   51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+"""This module contains the filters used to hide posts on the client side.
+
+Blacklist entries use the Danbooru search syntax. Each entry is a list of
+terms separated by spaces, and hides the posts matching all of them:
+
+* ``tag`` matches posts with the tag, ``-tag`` posts without it
+* ``rating:s`` (or ``safe``, ``q``, ``questionable``, ``e``, ``explicit``)
+  matches posts with that rating
+* ``width:``, ``height:``, ``id:`` and ``filesize:`` compare the field
+  with a number: ``width:>1000``, ``height:<=600``, ``id:100..200`` or
+  ``width:1024``
+
+Entries are compiled once into a :class:`PostFilter`. Entries made of a
+single tag (by far the most common) are merged into one set, checked with a
+single set operation per post; the other entries are indexed by one of
+their tags, so that only the entries which can match a post are evaluated.
+
+Boards can also exclude posts themselves: :func:`server_tags` adds the
+rating limit and the blacklisted tags to the terms of a search, as far as
+the board allows. The client side filter is still applied, as not all the
+blacklist can be expressed in a search.
+
+"""
+
+__all__ = ["PostFilter", "tag_names", "server_tags"]
+
+import operator
+import sys
+
+from . import containers
+
+if sys.version_info.major > 2:
+    unicode = str
+
+_RATINGS = dict(s=containers.SAFE, safe=containers.SAFE,
+                q=containers.QUESTIONABLE,
+                questionable=containers.QUESTIONABLE,
+                e=containers.EXPLICIT, explicit=containers.EXPLICIT)
+
+# Search terms excluding the ratings above each rating limit
+_RATING_TERMS = {containers.SAFE: "rating:s",
+                 containers.QUESTIONABLE: "-rating:e"}
+
+# Metatags comparing a numeric field of the posts
+_NUMERIC_FIELDS = dict(width="width", height="height", id="id",
+                       filesize="file_size")
+
+_OPERATORS = ((">=", operator.ge), ("<=", operator.le), (">", operator.gt),
+              ("<", operator.lt))
+
+
+def _number(text):
+
+    """Convert *text* to a number, accepting the ``kb`` and ``mb``
+    suffixes used for file sizes."""
+
+    text = text.lower()
+    factor = 1
+
+    if text.endswith("kb"):
+        factor, text = 1024, text[:-2]
+    elif text.endswith("mb"):
+        factor, text = 1024 * 1024, text[:-2]
+
+    return float(text) * factor
+
+
+def _compile_numeric(field, condition):
+
+    """Compile a numeric comparison, returning a predicate on posts, or
+    :const:`None` if *condition* is invalid."""
+
+    try:
+
+        if ".." in condition:
+
+            low, high = condition.split("..", 1)
+            low, high = _number(low), _number(high)
+
+            def predicate(post):
+                value = getattr(post, field)
+                return value is not None and low <= value <= high
+
+            return predicate
+
+        for prefix, compare in _OPERATORS:
+            if condition.startswith(prefix):
+                operand = _number(condition[len(prefix):])
+                break
+        else:
+            compare, operand = operator.eq, _number(condition)
+
+    except ValueError:
+        return
+
+    def predicate(post):
+        value = getattr(post, field)
+        return value is not None and compare(value, operand)
+
+    return predicate
+
+
+def _compile_metatag(name, value):
+
+    """Compile a metatag, returning a predicate on posts, or :const:`None`
+    if it is not supported."""
+
+    if name == "rating":
+
+        code = _RATINGS.get(value)
+
+        if code is None:
+            return
+
+        return lambda post: post.rating_code == code
+
+    field = _NUMERIC_FIELDS.get(name)
+
+    if field is None:
+        return
+
+    return _compile_numeric(field, value)
+
+
+class _Rule(object):
+
+    """A blacklist entry with more than a plain tag."""
+
+    def __init__(self, required, excluded, predicates):
+
+        self.required = required
+        self.excluded = excluded
+        self.predicates = predicates
+
+    def matches(self, post, tags):
+
+        if not self.required.issubset(tags):
+            return False
+
+        if not self.excluded.isdisjoint(tags):
+            return False
+
+        for predicate in self.predicates:
+            if not predicate(post):
+                return False
+
+        return True
+
+
+def _compile_entry(entry):
+
+    """Compile a blacklist entry.
+
+    :return: A tag name for entries made of a single tag, a :class:`_Rule`
+             for the others, or :const:`None` for entries which can never
+             match (empty ones, or with unsupported metatags)
+
+    """
+
+    terms = entry.lower().split()
+
+    if not terms:
+        return
+
+    if len(terms) == 1 and ":" not in terms[0] and terms[0][0] != "-":
+        return terms[0]
+
+    required = set()
+    excluded = set()
+    predicates = list()
+
+    for term in terms:
+
+        negated = term.startswith("-")
+
+        if negated:
+            term = term[1:]
+
+        if not term:
+            continue
+
+        name, separator, value = term.partition(":")
+
+        if separator and (name == "rating" or name in _NUMERIC_FIELDS):
+
+            predicate = _compile_metatag(name, value)
+
+            if predicate is None:
+                return
+
+            if negated:
+                predicate = (lambda function: lambda post:
+                             not function(post))(predicate)
+
+            predicates.append(predicate)
+
+        elif negated:
+            excluded.add(term)
+        else:
+            required.add(term)
+
+    return _Rule(frozenset(required), frozenset(excluded), predicates)
+
+
+def tag_names(blacklist):
+
+    """Return the plain tag names contained in *blacklist*, as a
+    ``frozenset``. Used to filter lists of tags rather than posts."""
+
+    names = set()
+
+    for entry in blacklist or ():
+
+        compiled = _compile_entry(unicode(entry))
+
+        if isinstance(compiled, unicode):
+            names.add(compiled)
+
+    return frozenset(names)
+
+
+def server_tags(tags, blacklist=None, max_rating=None, max_tags=None):
+
+    """Add terms to a search so that the board excludes the posts which
+    would be filtered out anyway.
+
+    The rating limit comes first, followed by the blacklisted tags (negated)
+    in the order of the blacklist, until the search has *max_tags* terms.
+
+    :param tags: The tags of the search
+    :param blacklist: A list of blacklist entries
+    :param max_rating: The highest rating code allowed, or :const:`None`
+    :param max_tags: The maximum number of terms in a search, or
+                     :const:`None` for no limit
+    :return: A list with the terms of the search
+
+    """
+
+    terms = [unicode(tag) for tag in tags or () if tag]
+    extra = list()
+
+    has_rating = any(term.lstrip("-").startswith("rating:")
+                     for term in terms)
+
+    if (max_rating is not None and max_rating in _RATING_TERMS and
+        not has_rating):
+        extra.append(_RATING_TERMS[max_rating])
+
+    for entry in blacklist or ():
+
+        compiled = _compile_entry(unicode(entry))
+
+        # Only plain tags can be negated in a search
+        if not isinstance(compiled, unicode) or compiled in terms:
+            continue
+
+        term = "-" + compiled
+
+        if term not in terms and term not in extra:
+            extra.append(term)
+
+    if max_tags is not None:
+        extra = extra[:max(max_tags - len(terms), 0)]
+
+    return terms + extra
+
+
+class PostFilter(object):
+
+    """A compiled filter for posts.
+
+    :param blacklist: A list of blacklist entries (see the module
+                      documentation)
+    :param max_rating: The highest rating code allowed (see
+                       :mod:`danbooru.api.containers`), or :const:`None`
+                       to allow all
+
+    """
+
+    def __init__(self, blacklist=None, max_rating=None):
+
+        self.max_rating = (containers.EXPLICIT if max_rating is None
+                           else max_rating)
+
+        tags = set()
+        indexed = dict()
+        unindexed = list()
+
+        for entry in blacklist or ():
+
+            compiled = _compile_entry(unicode(entry))
+
+            if compiled is None:
+                continue
+
+            if isinstance(compiled, unicode):
+                tags.add(compiled)
+            elif compiled.required:
+                # Any required tag will do: posts without it cannot match
+                key = min(compiled.required)
+                indexed.setdefault(key, list()).append(compiled)
+            else:
+                unindexed.append(compiled)
+
+        self.__tags = frozenset(tags)
+        self.__indexed = indexed
+        self.__unindexed = unindexed
+
+    def __call__(self, post):
+
+        """Return :const:`True` if *post* passes the filter."""
+
+        if post.rating_code > self.max_rating:
+            return False
+
+        if not self.__tags.isdisjoint(post.tags):
+            return False
+
+        if not self.__indexed and not self.__unindexed:
+            return True
+
+        rules = list(self.__unindexed)
+
+        for tag in post.tags:
+            rules.extend(self.__indexed.get(tag, ()))
+
+        if not rules:
+            return True
+
+        tags = frozenset(post.tags)
+
+        for rule in rules:
+            if rule.matches(post, tags):
+                return False
+
+        return True
+
+    def filter(self, posts):
+
+        """Return the posts of *posts* which pass the filter."""
+
+        return [post for post in posts if self(post)]
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#   Copyright 2011 Luca Beltrame <einar@heavensinferno.net>
+#
+#   This program is free software; you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License, under
+#   version 2 of the License, or (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details
+#
+#   You should have received a copy of the GNU General Public
+#   License along with this program; if not, write to the
+#   Free Software Foundation, Inc.,
+#   51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+"""This module describes the formats in which the Danbooru API can answer.
+
+Each API path (``post/index``, ``tag/index``, ...) can be requested with a
+format suffix (``.xml`` or ``.json``). A :class:`ResponseFormat` builds the
+path for a given format, and provides the parser for each kind of answer.
+
+"""
+
+__all__ = ["ResponseFormat", "response_format", "XML", "JSON", "FORMATS",
+           "POSTS", "POOL_POSTS", "TAGS", "RELATED_TAGS", "POOLS"]
+
+from . import parsers
+
+# Kinds of answers
+POSTS = "posts"
+POOL_POSTS = "pool_posts"
+TAGS = "tags"
+RELATED_TAGS = "related_tags"
+POOLS = "pools"
+
+
+class ResponseFormat(object):
+
+    """A format of the answers of the API.
+
+    :param name: The name of the format, also used as the path suffix
+    :param parsers: A dictionary mapping each kind of answer to its parser
+                    class
+
+    """
+
+    def __init__(self, name, parsers):
+
+        self.name = name
+        self.__parsers = parsers
+
+    def __repr__(self):
+
+        return "<ResponseFormat %s>" % self.name
+
+    def path(self, api_path):
+
+        """Return *api_path* with the suffix of the format."""
+
+        return "%s.%s" % (api_path, self.name)
+
+    def parser(self, kind):
+
+        """Return the parser class for answers of type *kind*."""
+
+        return self.__parsers[kind]
+
+
+XML = ResponseFormat("xml", {POSTS: parsers.PostParser,
+                             POOL_POSTS: parsers.PostParser,
+                             TAGS: parsers.TagParser,
+                             RELATED_TAGS: parsers.RelatedTagParser,
+                             POOLS: parsers.PoolParser})
+
+JSON = ResponseFormat("json", {POSTS: parsers.JsonPostParser,
+                               POOL_POSTS: parsers.JsonPoolPostParser,
+                               TAGS: parsers.JsonTagParser,
+                               RELATED_TAGS: parsers.JsonRelatedTagParser,
+                               POOLS: parsers.JsonPoolParser})
+
+FORMATS = dict(xml=XML, json=JSON)
+
+
+def response_format(name):
+
+    """Return the format called *name*, falling back to XML for unknown
+    names."""
+
+    return FORMATS.get(name, XML)
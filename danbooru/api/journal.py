@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#   Copyright 2011 Luca Beltrame <einar@heavensinferno.net>
+#
+#   This program is free software; you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License, under
+#   version 2 of the License, or (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details
+#
+#   You should have received a copy of the GNU General Public
+#   License along with this program; if not, write to the
+#   Free Software Foundation, Inc.,
+#   51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+"""This module contains the journal of the image downloads.
+
+Each download submitted to the :class:`DownloadManager
+<danbooru.api.download.DownloadManager>` is recorded in a SQLite database,
+with what is needed to start it again (the URL, the destination, the MD5
+hash and the post it comes from), and its state is updated as it runs. Every
+change is committed at once, so that after a crash the downloads which did
+not complete can be found in the journal and started again.
+
+"""
+
+__all__ = ["DownloadJournal", "QUEUED", "RUNNING", "DONE", "FAILED"]
+
+import os
+import sqlite3
+import sys
+import time
+
+if sys.version_info.major > 2:
+    unicode = str
+
+# States of the downloads
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS downloads (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    url TEXT NOT NULL,
+    destination TEXT NOT NULL,
+    path TEXT,
+    md5 TEXT,
+    board TEXT,
+    post_id INTEGER,
+    size INTEGER NOT NULL DEFAULT 0,
+    tags TEXT NOT NULL DEFAULT '',
+    priority INTEGER NOT NULL DEFAULT 0,
+    state TEXT NOT NULL,
+    updated REAL NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS downloads_state ON downloads (state);
+"""
+
+
+class DownloadJournal(object):
+
+    """Persistent record of the image downloads.
+
+    :param path: The path of the database file
+
+    """
+
+    def __init__(self, path):
+
+        self.path = unicode(path)
+        self.__connection = sqlite3.connect(self.path)
+        # NORMAL is only safe from corruption with a write-ahead log
+        self.__connection.execute("PRAGMA journal_mode = WAL")
+        self.__connection.execute("PRAGMA synchronous = NORMAL")
+        self.__connection.executescript(_SCHEMA)
+
+    def add(self, download, priority=0):
+
+        """Record *download*, an :class:`ImageDownload
+        <danbooru.api.download.ImageDownload>`, as queued.
+
+        :return: The ID of the entry in the journal
+
+        """
+
+        tags = " ".join(unicode(tag) for tag in download.tags or [])
+
+        with self.__connection:
+            cursor = self.__connection.execute(
+                "INSERT INTO downloads (url, destination, path, md5, board, "
+                "post_id, size, tags, priority, state, updated) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (unicode(download.url.url()),
+                 unicode(download.destination.url()), download.path,
+                 download.md5, download.board_url, download.post_id,
+                 download.size, tags, priority, QUEUED, time.time()))
+
+        return cursor.lastrowid
+
+    def set_state(self, entry_id, state):
+
+        "Change the state of the entry *entry_id*."
+
+        with self.__connection:
+            self.__connection.execute(
+                "UPDATE downloads SET state = ?, updated = ? WHERE id = ?",
+                (state, time.time(), entry_id))
+
+    def remove(self, entry_id):
+
+        "Remove the entry *entry_id*."
+
+        with self.__connection:
+            self.__connection.execute("DELETE FROM downloads WHERE id = ?",
+                                      (entry_id,))
+
+    def pending(self):
+
+        """Return the downloads which did not complete, in the order they
+        were submitted, as a list of dictionaries holding the columns of the
+        journal (``id``, ``url``, ``destination``, ``md5``, ``board``,
+        ``post_id``, ``size``, ``priority`` and ``tags``, as a list).
+
+        Entries whose file is already at its (local) destination, as the
+        download completed but not its entry, are marked as done instead,
+        without any network access.
+
+        """
+
+        cursor = self.__connection.execute(
+            "SELECT id, url, destination, path, md5, board, post_id, size, "
+            "tags, priority FROM downloads WHERE state IN (?, ?) ORDER BY id",
+            (QUEUED, RUNNING))
+
+        names = [column[0] for column in cursor.description]
+        entries = list()
+        completed = list()
+
+        for row in cursor.fetchall():
+
+            entry = dict(zip(names, row))
+            entry["tags"] = entry["tags"].split()
+            path = entry.pop("path")
+
+            if path is not None and os.path.isfile(path):
+                completed.append(entry["id"])
+            else:
+                entries.append(entry)
+
+        for entry_id in completed:
+            self.set_state(entry_id, DONE)
+
+        return entries
+
+    def clear(self, states=(DONE, FAILED)):
+
+        """Remove the entries in *states*: by default, those of the downloads
+        which are over."""
+
+        states = list(states)
+        placeholders = ", ".join("?" * len(states))
+
+        with self.__connection:
+            self.__connection.execute(
+                "DELETE FROM downloads WHERE state IN (%s)" % placeholders,
+                states)
+
+    def close(self):
+
+        "Close the database."
+
+        self.__connection.close()
@@ -0,0 +1,262 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#   Copyright 2011 Luca Beltrame <einar@heavensinferno.net>
+#
+#   This program is free software; you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License, under
+#   version 2 of the License, or (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details
+#
+#   You should have received a copy of the GNU General Public
+#   License along with this program; if not, write to the
+#   Free Software Foundation, Inc.,
+#   51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+"""This module contains the local library of downloaded images.
+
+The library is a SQLite database recording where each image downloaded was
+saved, keyed by its MD5 hash (and also holding the board and the ID of its
+post). Images already in the library are never downloaded again: they are
+linked, or copied, to the new destination instead.
+
+Checking whether an image is in the library must be quick, as it is done
+for every thumbnail shown: the first 32 bits of the hashes are kept in
+memory in a sorted array (4 bytes per image), searched with a binary search
+without touching the database. Rare false positives are possible, so
+anything acting on a file uses :meth:`Library.lookup`, which is exact.
+
+"""
+
+__all__ = ["Library"]
+
+import array
+import bisect
+import os
+import shutil
+import sqlite3
+import sys
+import time
+
+if sys.version_info.major > 2:
+    unicode = str
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    md5 TEXT PRIMARY KEY,
+    board TEXT,
+    post_id INTEGER,
+    path TEXT NOT NULL,
+    size INTEGER NOT NULL DEFAULT 0,
+    added REAL NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS files_post ON files (board, post_id);
+"""
+
+
+def _prefix(md5):
+
+    """Return the first 32 bits of the hexadecimal hash *md5* as an integer,
+    or :const:`None` if it is not a valid hash."""
+
+    try:
+        return int(md5[:8], 16)
+    except (TypeError, ValueError):
+        return
+
+
+class Library(object):
+
+    """Persistent index of the images downloaded.
+
+    :param path: The path of the database file
+
+    """
+
+    def __init__(self, path):
+
+        self.path = unicode(path)
+        self.__connection = sqlite3.connect(self.path)
+        # NORMAL is only safe from corruption with a write-ahead log
+        self.__connection.execute("PRAGMA journal_mode = WAL")
+        self.__connection.execute("PRAGMA synchronous = NORMAL")
+        self.__connection.executescript(_SCHEMA)
+
+        # "L" holds at least 32 bits everywhere
+        cursor = self.__connection.execute("SELECT md5 FROM files")
+        prefixes = (_prefix(row[0]) for row in cursor)
+        self.__prefixes = array.array("L", sorted(
+            prefix for prefix in prefixes if prefix is not None))
+
+    def __len__(self):
+
+        return len(self.__prefixes)
+
+    def __contains__(self, md5):
+
+        """Return :const:`True` if the image with hash *md5* is (very
+        probably) in the library. The database is not accessed."""
+
+        prefix = _prefix(md5)
+
+        if prefix is None:
+            return False
+
+        position = bisect.bisect_left(self.__prefixes, prefix)
+
+        return (position < len(self.__prefixes) and
+                self.__prefixes[position] == prefix)
+
+    def __remove_prefix(self, md5):
+
+        prefix = _prefix(md5)
+        position = bisect.bisect_left(self.__prefixes, prefix)
+
+        if (position < len(self.__prefixes) and
+            self.__prefixes[position] == prefix):
+            del self.__prefixes[position]
+
+    def __row(self, md5):
+
+        cursor = self.__connection.execute(
+            "SELECT path FROM files WHERE md5 = ?", (unicode(md5).lower(),))
+        return cursor.fetchone()
+
+    def __existing(self, md5, path):
+
+        """Return *path* if the file is still there, otherwise forget about
+        the image and return :const:`None`."""
+
+        if os.path.isfile(path):
+            return path
+
+        self.remove(md5)
+
+    def lookup(self, md5):
+
+        """Return the path of the image with hash *md5*, or :const:`None` if
+        it is not in the library. Files deleted since they were downloaded
+        are removed from the library."""
+
+        if md5 not in self:
+            return
+
+        row = self.__row(md5)
+
+        if row is None:
+            return
+
+        return self.__existing(md5, row[0])
+
+    def lookup_post(self, board_url, post_id):
+
+        """Return the path of the image of the post *post_id* of the board at
+        *board_url*, or :const:`None` if it is not in the library."""
+
+        cursor = self.__connection.execute(
+            "SELECT md5, path FROM files WHERE board = ? AND post_id = ?",
+            (unicode(board_url), post_id))
+        row = cursor.fetchone()
+
+        if row is None:
+            return
+
+        return self.__existing(row[0], row[1])
+
+    def add(self, md5, path, board_url=None, post_id=None):
+
+        """Record that the image with hash *md5* was saved to *path*.
+
+        :param md5: The MD5 hash of the image
+        :param path: The path of the local file
+        :param board_url: The URL of the board the post comes from
+        :param post_id: The ID of the post
+
+        """
+
+        if _prefix(md5) is None:
+            return
+
+        md5 = unicode(md5).lower()
+        path = os.path.abspath(unicode(path))
+
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            return
+
+        known = self.__row(md5) is not None
+
+        with self.__connection:
+            self.__connection.execute(
+                "INSERT OR REPLACE INTO files "
+                "(md5, board, post_id, path, size, added) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (md5, None if board_url is None else unicode(board_url),
+                 post_id, path, size, time.time()))
+
+        if not known:
+            bisect.insort(self.__prefixes, _prefix(md5))
+
+    def remove(self, md5):
+
+        "Forget about the image with hash *md5*."
+
+        md5 = unicode(md5).lower()
+
+        if self.__row(md5) is None:
+            return
+
+        with self.__connection:
+            self.__connection.execute("DELETE FROM files WHERE md5 = ?",
+                                      (md5,))
+
+        self.__remove_prefix(md5)
+
+    def copy_to(self, md5, path):
+
+        """Put the image with hash *md5* at *path* from the library, with a
+        hard link if possible, or a copy otherwise.
+
+        :return: :const:`True` if the file is at *path*, :const:`False` if
+                 the image is not in the library or could not be copied
+
+        """
+
+        source = self.lookup(md5)
+
+        if source is None:
+            return False
+
+        path = os.path.abspath(unicode(path))
+
+        if os.path.exists(path):
+            try:
+                if os.path.samefile(source, path):
+                    return True
+            except OSError:
+                return False
+
+            # Not ours to replace
+            return False
+
+        try:
+            os.link(source, path)
+        except (AttributeError, OSError):
+            # Not supported, or another file system
+            try:
+                shutil.copy2(source, path)
+            except (IOError, OSError):
+                return False
+
+        return True
+
+    def close(self):
+
+        "Close the database."
+
+        self.__connection.close()
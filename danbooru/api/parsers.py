@@ -0,0 +1,411 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#   Copyright 2011 Luca Beltrame <einar@heavensinferno.net>
+#
+#   This program is free software; you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License, under
+#   version 2 of the License, or (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details
+#
+#   You should have received a copy of the GNU General Public
+#   License along with this program; if not, write to the
+#   Free Software Foundation, Inc.,
+#   51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+"""This module contains the parsers for the answers of the Danbooru API.
+
+Parsers are incremental: data can be fed to them as it arrives from the
+network, and each call to :meth:`feed` returns the items that could be
+completely parsed so far. :meth:`finish` is called once the whole answer
+has been received, and returns the remaining items.
+
+Both XML and JSON answers are supported. Items are returned as the
+containers of :mod:`danbooru.api.containers`, built from plain
+dictionaries, so the rest of the program does not depend on the format.
+
+"""
+
+__all__ = ["PostParser", "TagParser", "PoolParser", "RelatedTagParser",
+           "JsonPostParser", "JsonPoolPostParser", "JsonTagParser",
+           "JsonPoolParser", "JsonRelatedTagParser"]
+
+import codecs
+import json
+import re
+import sys
+
+import PyQt4.QtCore as QtCore
+
+from . import containers
+
+if sys.version_info.major > 2:
+    unicode = str
+
+QXmlStreamReader = QtCore.QXmlStreamReader
+
+# Separators between the elements of a JSON array
+_SEPARATORS = re.compile(r"[\s,]*")
+
+
+def _attributes(stream):
+
+    """Return the attributes of the current XML element as a dictionary."""
+
+    attributes = stream.attributes()
+    result = dict()
+
+    for index in range(attributes.size()):
+        attribute = attributes.at(index)
+        result[unicode(attribute.name().toString())] = unicode(
+            attribute.value().toString())
+
+    return result
+
+
+class XmlParser(object):
+
+    """Base class for incremental parsers of XML answers.
+
+    Subclasses implement :meth:`element`, which turns the current start
+    element into an item (or :const:`None` to skip it).
+
+    """
+
+    def __init__(self):
+
+        self._stream = QXmlStreamReader()
+        self._finished = False
+
+    def feed(self, data):
+
+        """Add data to the parser.
+
+        :param data: A chunk of the answer, as a ``QByteArray``
+        :return: A list of the items parsed from the data received so far
+
+        """
+
+        self._stream.addData(data)
+
+        items = list()
+        stream = self._stream
+
+        while True:
+
+            token = stream.readNext()
+
+            # Invalid is also returned when more data is needed
+            if (token == QXmlStreamReader.Invalid or
+                token == QXmlStreamReader.EndDocument):
+                break
+
+            if token == QXmlStreamReader.StartElement:
+
+                item = self.element(stream)
+
+                if item is not None:
+                    items.append(item)
+
+        return items
+
+    def finish(self):
+
+        """Signal that the whole answer has been fed to the parser.
+
+        :return: A list of the items not returned yet
+
+        """
+
+        self._finished = True
+
+        return list()
+
+    @property
+    def error(self):
+
+        """The parsing error, or :const:`None` if the data received so far
+        is well-formed."""
+
+        stream = self._stream
+
+        if not stream.hasError():
+            return
+
+        if (stream.error() == QXmlStreamReader.PrematureEndOfDocumentError
+            and not self._finished):
+            return
+
+        return unicode(stream.errorString())
+
+    def element(self, stream):
+
+        raise NotImplementedError
+
+
+class PostParser(XmlParser):
+
+    """Parser for lists of posts (``post/index.xml`` and
+    ``pool/show.xml``)."""
+
+    def element(self, stream):
+
+        name = stream.name()
+
+        if name == "posts" or name == "pool" or name == "description":
+            return
+
+        return containers.DanbooruPost(_attributes(stream))
+
+
+class TagParser(XmlParser):
+
+    "Parser for lists of tags (``tag/index.xml``)."
+
+    def element(self, stream):
+
+        if stream.name() == "tags":
+            return
+
+        return containers.DanbooruTag(_attributes(stream))
+
+
+class PoolParser(XmlParser):
+
+    "Parser for lists of pools (``pool/index.xml``)."
+
+    def element(self, stream):
+
+        if stream.name() != "pool":
+            return
+
+        return containers.DanbooruPool(_attributes(stream))
+
+
+class RelatedTagParser(XmlParser):
+
+    """Parser for related tags (``tag/related.xml``). Only the names of the
+    tags are returned, as the rest of the information is incomplete."""
+
+    def element(self, stream):
+
+        name = stream.attributes().value("name").toString()
+
+        if name.isEmpty():
+            return
+
+        return unicode(name)
+
+
+class JsonParser(object):
+
+    """Base class for parsers of JSON answers.
+
+    When the answer is an array, its elements are decoded as soon as they
+    are complete; other answers are decoded once they have been received
+    entirely. Subclasses implement :meth:`element`, which turns a decoded
+    element into an item (or :const:`None` to skip it), and can override
+    :meth:`elements` to pick the elements out of a whole answer.
+
+    """
+
+    def __init__(self):
+
+        self._decoder = codecs.getincrementaldecoder("utf-8")("replace")
+        self._json = json.JSONDecoder()
+        self._text = unicode()
+        self._position = None
+        self._error = None
+
+    def feed(self, data):
+
+        """Add data to the parser.
+
+        :param data: A chunk of the answer, as a ``QByteArray``
+        :return: A list of the items parsed from the data received so far
+
+        """
+
+        self._text += self._decoder.decode(data.data())
+
+        return self._read_array()
+
+    def finish(self):
+
+        """Signal that the whole answer has been fed to the parser.
+
+        :return: A list of the items not returned yet
+
+        """
+
+        self._text += self._decoder.decode(bytes(), True)
+
+        if self._position is not None and self._position >= 0:
+
+            items = self._read_array()
+
+            if self._text.strip() != "]":
+                self._error = unicode("Truncated or invalid JSON array")
+
+            return items
+
+        try:
+            document = json.loads(self._text)
+        except ValueError as error:
+            self._error = unicode(error)
+            return list()
+
+        self._text = unicode()
+
+        return self._items(self.elements(document))
+
+    @property
+    def error(self):
+
+        """The parsing error, or :const:`None` if the data received so far
+        is well-formed."""
+
+        return self._error
+
+    def _items(self, elements):
+
+        items = list()
+
+        for element in elements:
+
+            item = self.element(element)
+
+            if item is not None:
+                items.append(item)
+
+        return items
+
+    def _read_array(self):
+
+        """Decode the complete elements of a top-level array."""
+
+        text = self._text
+
+        if self._position is None:
+
+            stripped = text.lstrip()
+
+            if not stripped:
+                return list()
+
+            if stripped[0] != "[":
+                # Not an array: decoded as a whole at the end
+                self._position = -1
+                return list()
+
+            self._position = len(text) - len(stripped) + 1
+
+        elif self._position < 0:
+            return list()
+
+        position = self._position
+        elements = list()
+
+        while True:
+
+            position = _SEPARATORS.match(text, position).end()
+
+            if position >= len(text) or text[position] == "]":
+                break
+
+            try:
+                element, position = self._json.raw_decode(text, position)
+            except ValueError:
+                # Incomplete: wait for more data
+                break
+
+            elements.append(element)
+
+        # Keep only what still needs to be decoded
+        self._text = text[position:]
+        self._position = 0
+
+        return self._items(elements)
+
+    def elements(self, document):
+
+        """Return the elements contained in a whole answer."""
+
+        if isinstance(document, list):
+            return document
+
+        return list()
+
+    def element(self, element):
+
+        raise NotImplementedError
+
+
+class JsonPostParser(JsonParser):
+
+    "Parser for lists of posts (``post/index.json``)."
+
+    def element(self, element):
+
+        return containers.DanbooruPost(element)
+
+
+class JsonPoolPostParser(JsonPostParser):
+
+    "Parser for the posts of a pool (``pool/show.json``)."
+
+    def elements(self, document):
+
+        if isinstance(document, dict):
+            return document.get("posts") or list()
+
+        return super(JsonPoolPostParser, self).elements(document)
+
+
+class JsonTagParser(JsonParser):
+
+    "Parser for lists of tags (``tag/index.json``)."
+
+    def element(self, element):
+
+        return containers.DanbooruTag(element)
+
+
+class JsonPoolParser(JsonParser):
+
+    "Parser for lists of pools (``pool/index.json``)."
+
+    def element(self, element):
+
+        return containers.DanbooruPool(element)
+
+
+class JsonRelatedTagParser(JsonParser):
+
+    """Parser for related tags (``tag/related.json``). The answer maps each
+    requested tag to a list of ``[name, count]`` pairs: only the names are
+    returned."""
+
+    def elements(self, document):
+
+        if not isinstance(document, dict):
+            return list()
+
+        elements = list()
+
+        for pairs in document.values():
+            elements.extend(pairs)
+
+        return elements
+
+    def element(self, element):
+
+        if not element or not element[0]:
+            return
+
+        return unicode(element[0])
+
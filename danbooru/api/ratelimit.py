@@ -0,0 +1,357 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#   Copyright 2011 Luca Beltrame <einar@heavensinferno.net>
+#
+#   This program is free software; you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License, under
+#   version 2 of the License, or (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details
+#
+#   You should have received a copy of the GNU General Public
+#   License along with this program; if not, write to the
+#   Free Software Foundation, Inc.,
+#   51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+"""This module contains the rate limiter shared by all the requests made to
+a board.
+
+Each board has two token buckets, one for API calls and one for static
+files (thumbnails and full images), which are far cheaper for the board and
+needed in much larger numbers. Every request takes a token from its bucket,
+and tokens are added back at the rate allowed for the board (see
+:class:`BoardCapabilities <danbooru.api.boards.BoardCapabilities>`).
+Requests which find the bucket empty wait in a queue for their turn.
+
+When the board answers that it is overloaded (HTTP 421, 429 or 503), the
+rate is halved and no request is sent until the time asked by the board, or
+an increasing delay, has passed. The rate then grows back slowly with each
+successful request.
+
+Failed requests which can safely be sent again are retried after a random
+delay (see :func:`retry_delay`), so that many clients throttled at once do
+not come back at the same time.
+
+"""
+
+__all__ = ["RateLimiter", "shared_limiter", "retry_delay", "should_retry",
+           "is_throttled"]
+
+import collections
+import random
+import sys
+import time
+
+from functools import partial
+
+import PyQt4.QtCore as QtCore
+import PyKDE4.kdecore as kdecore
+from PyKDE4.kio import KIO
+
+from . import boards
+
+if sys.version_info.major > 2:
+    unicode = str
+
+# HTTP status codes sent by overloaded boards
+THROTTLE_CODES = frozenset(["421", "429", "503"])
+
+# HTTP status codes and KIO errors worth a new attempt
+RETRY_CODES = THROTTLE_CODES | frozenset(["500", "502", "504"])
+RETRY_ERRORS = frozenset([KIO.ERR_CONNECTION_BROKEN, KIO.ERR_SERVER_TIMEOUT,
+                          KIO.ERR_COULD_NOT_CONNECT])
+
+MAX_RETRIES = 4
+
+# Delays (in seconds) used for retries and for backing off
+BASE_DELAY = 1.0
+MAX_DELAY = 60.0
+
+# The rate never falls below this many requests per second
+MIN_RATE = 0.1
+
+# Fraction of the configured rate recovered with each successful request
+RECOVERY = 0.1
+
+
+def retry_delay(attempt):
+
+    """Return how long to wait before retrying a request for the *attempt*
+    time (starting from 0): a random delay up to an exponentially growing
+    limit."""
+
+    return random.uniform(0, min(MAX_DELAY, BASE_DELAY * 2 ** attempt))
+
+
+def _retry_after(job):
+
+    """Return the delay (in seconds) asked by the board with a
+    ``Retry-After`` header, or :const:`None`."""
+
+    headers = unicode(job.queryMetaData("HTTP-Headers"))
+
+    for line in headers.splitlines():
+
+        name, separator, value = line.partition(":")
+
+        if not separator or name.strip().lower() != "retry-after":
+            continue
+
+        # Dates are not supported, only delays
+        try:
+            return max(float(value.strip()), 0)
+        except ValueError:
+            return
+
+    return
+
+
+def is_throttled(job):
+
+    """Return :const:`True` if *job* failed because the board is
+    overloaded."""
+
+    return unicode(job.queryMetaData("responsecode")) in THROTTLE_CODES
+
+
+def should_retry(job):
+
+    """Return :const:`True` if *job* failed in a way that another attempt
+    can fix."""
+
+    if not job.error():
+        return False
+
+    if unicode(job.queryMetaData("responsecode")) in RETRY_CODES:
+        return True
+
+    return job.error() in RETRY_ERRORS
+
+
+class _Board(object):
+
+    """The rate limiting state of a single board."""
+
+    def __init__(self, rate, burst):
+
+        self.base_rate = float(rate)
+        self.rate = float(rate)
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.time()
+        self.blocked_until = 0
+        self.backoff = 0
+        self.queue = collections.deque()
+        self.timer = False
+        self.started = 0
+        self.throttled = 0
+
+    def refill(self, now):
+
+        # Nothing is added back while paused
+        if now <= self.updated:
+            return
+
+        self.tokens = min(self.burst,
+                          self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now):
+
+        """Return how long to wait (in seconds) before the next request can
+        be sent."""
+
+        if now < self.blocked_until:
+            return self.blocked_until - now
+
+        self.refill(now)
+
+        if self.tokens >= 1:
+            return 0
+
+        return (1 - self.tokens) / self.rate
+
+
+class RateLimiter(QtCore.QObject):
+
+    """Token bucket rate limiter for requests to boards.
+
+    :attr:`stateChanged` is emitted with the host of a board, and whether
+    the bucket of its static files is meant, when it is throttled or when
+    its rate changes.
+
+    Every method takes a *static* argument, :const:`True` for the requests
+    of static files.
+
+    """
+
+    stateChanged = QtCore.pyqtSignal(unicode, bool)
+
+    def __init__(self, parent=None):
+
+        super(RateLimiter, self).__init__(parent)
+
+        self.__boards = dict()
+
+    def __board(self, board_url, static):
+
+        host = unicode(kdecore.KUrl(board_url).host())
+        board = self.__boards.get((host, static))
+
+        if board is None:
+            capabilities = boards.capabilities(board_url)
+
+            if static:
+                board = _Board(capabilities.static_rate,
+                               capabilities.static_burst)
+            else:
+                board = _Board(capabilities.request_rate,
+                               capabilities.request_burst)
+
+            self.__boards[(host, static)] = board
+
+        return host, board
+
+    def __dispatch(self, key):
+
+        """Start the queued requests of the bucket *key* for which there
+        are tokens."""
+
+        board = self.__boards[key]
+        board.timer = False
+
+        while board.queue:
+
+            delay = board.delay(time.time())
+
+            if delay > 0:
+                board.timer = True
+                QtCore.QTimer.singleShot(int(delay * 1000) + 1,
+                                         partial(self.__dispatch, key))
+                return
+
+            board.tokens -= 1
+            board.started += 1
+            start = board.queue.popleft()
+            start()
+
+    def request(self, board_url, start, static=False):
+
+        """Call *start* (with no arguments) once a request to the board at
+        *board_url* is allowed: at once if possible, later otherwise."""
+
+        host, board = self.__board(board_url, static)
+        board.queue.append(start)
+
+        if not board.timer:
+            self.__dispatch((host, static))
+
+    def throttled(self, board_url, job=None, static=False):
+
+        """Record that the board at *board_url* is overloaded, halving its
+        rate and pausing its requests. The delay asked by the board in the
+        answer of *job*, if any, is respected."""
+
+        host, board = self.__board(board_url, static)
+
+        delay = None if job is None else _retry_after(job)
+
+        if delay is None:
+            delay = retry_delay(board.backoff)
+
+        board.backoff = min(board.backoff + 1, MAX_RETRIES)
+        board.rate = max(board.rate / 2, MIN_RATE)
+        board.blocked_until = max(board.blocked_until,
+                                  time.time() + min(delay, MAX_DELAY))
+        board.tokens = 0
+        board.updated = board.blocked_until
+        board.throttled += 1
+
+        self.stateChanged.emit(host, static)
+
+    def succeeded(self, board_url, static=False):
+
+        """Record a successful request, bringing the rate of the board at
+        *board_url* back towards its configured value."""
+
+        host, board = self.__board(board_url, static)
+
+        if board.rate >= board.base_rate and not board.backoff:
+            return
+
+        board.backoff = 0
+        board.refill(time.time())
+        board.rate = min(board.base_rate,
+                         board.rate + board.base_rate * RECOVERY)
+
+        self.stateChanged.emit(host, static)
+
+    def set_rate(self, board_url, rate, burst=None, static=False):
+
+        """Change the allowed rate (in requests per second) and, optionally,
+        the burst size of the board at *board_url*."""
+
+        host, board = self.__board(board_url, static)
+        board.refill(time.time())
+        board.base_rate = board.rate = max(float(rate), MIN_RATE)
+
+        if burst is not None:
+            board.burst = burst
+
+        self.stateChanged.emit(host, static)
+
+    def state(self, host=None, static=False):
+
+        """Return the state of the board at *host*, or of all the boards
+        (keyed by host) if it is :const:`None`.
+
+        The state of a board is a dictionary holding its configured and
+        current rate (``base_rate`` and ``rate``), the tokens available
+        (``tokens``), the requests waiting (``queued``), how long requests
+        are paused for (``blocked``, in seconds), and how many requests were
+        started and throttled (``started`` and ``throttled``).
+
+        """
+
+        now = time.time()
+
+        if host is not None:
+            hosts = [unicode(host)]
+        else:
+            hosts = [name for name, kind in self.__boards if kind == static]
+
+        state = dict()
+
+        for name in hosts:
+
+            board = self.__boards[(name, static)]
+            board.refill(now)
+            state[name] = dict(base_rate=board.base_rate, rate=board.rate,
+                               tokens=board.tokens, queued=len(board.queue),
+                               blocked=max(board.blocked_until - now, 0),
+                               started=board.started,
+                               throttled=board.throttled)
+
+        if host is not None:
+            return state[hosts[0]]
+
+        return state
+
+
+_LIMITER = None
+
+
+def shared_limiter():
+
+    """Return the rate limiter shared by the whole application."""
+
+    global _LIMITER
+
+    if _LIMITER is None:
+        _LIMITER = RateLimiter()
+
+    return _LIMITER
@@ -19,9 +19,12 @@
 
 __all__ = ["DanbooruService"]
 
-from collections import deque
+from collections import OrderedDict
+from functools import partial
 
+import sqlite3
 import sys
+import time
 
 # Python3 compatibility
 
@@ -38,20 +41,121 @@ import sip
 sip.setapi('QString', 1)
 sip.setapi('QVariant', 1)
 
+from . import boards
+from . import completion
 from . import containers
+from . import decoder
+from . import filters
+from . import formats
+from . import ratelimit
+from . import scheduler
+from . import tagindex
 from . import utils
+from .cache import TagCache
 
-POST_URL = "post/index.xml"
-TAG_URL = "tag/index.xml"
-POOL_URL = "pool/index.xml"
-ARTIST_URL = "pool/index.xml"
-POOL_DATA_URL = "pool/show.xml"
-RELATED_TAG_URL = "tag/related.xml"
+# API paths, without the format suffix (see danbooru.api.formats)
+POST_URL = "post/index"
+TAG_URL = "tag/index"
+POOL_URL = "pool/index"
+ARTIST_URL = "pool/index"
+POOL_DATA_URL = "pool/show"
+RELATED_TAG_URL = "tag/related"
 
-MAX_RATINGS = dict(Safe=("Safe"), Questionable=("Safe", "Questionable"),
-                   Explicit=("Safe", "Questionable", "Explicit"))
+# How long (in seconds) cached answers are used without asking the board
+CACHE_TTL = {POST_URL: 5 * 60, TAG_URL: 60 * 60, POOL_URL: 10 * 60,
+             POOL_DATA_URL: 60 * 60, RELATED_TAG_URL: 60 * 60}
 
-QXmlStreamReader = QtCore.QXmlStreamReader
+# The highest rating code allowed by each rating setting
+MAX_RATINGS = dict(Safe=containers.SAFE, Questionable=containers.QUESTIONABLE,
+                   Explicit=containers.EXPLICIT)
+
+
+class _CompletionSignals(QtCore.QObject):
+
+    finished = QtCore.pyqtSignal(int, object)
+
+
+class _CompletionTask(QtCore.QRunnable):
+
+    """Build a :class:`CompletionIndex
+    <danbooru.api.completion.CompletionIndex>` from the tag index stored in
+    *path*, in a thread of the pool."""
+
+    def __init__(self, task_id, path, signals):
+
+        super(_CompletionTask, self).__init__()
+
+        self.task_id = task_id
+        self.path = path
+        self.signals = signals
+
+    def run(self):
+
+        index = None
+
+        try:
+            # SQLite connections can't be shared between threads
+            tag_index = tagindex.TagIndex(self.path)
+
+            try:
+                index = completion.CompletionIndex(tag_index.entries())
+            finally:
+                tag_index.close()
+
+        except sqlite3.Error:
+            pass
+
+        self.signals.finished.emit(self.task_id, index)
+
+
+def _parse(parser, data):
+
+    """Parse a whole answer with *parser*, returning all the items."""
+
+    items = parser.feed(data)
+    items.extend(parser.finish())
+
+    return items
+
+
+class _PendingRequest(object):
+
+    """A request in progress, and the callers waiting for its answer.
+
+    The request is sent once the rate limiter allows it, and possibly again
+    if it fails: :attr:`job` is :const:`None` while waiting, and changes
+    with each attempt.
+
+    """
+
+    def __init__(self, key, url, reload_policy, entry, parser, stream,
+                 cached, waiter):
+
+        self.key = key
+        self.url = url
+        self.reload_policy = reload_policy
+        self.job = None
+        self.priority = None
+        self.attempts = 0
+        self.entry = entry
+        self.parser = parser
+        self.stream = stream
+        self.cached = cached
+        self.waiters = [waiter]
+        self.items = list()
+        self.body = QtCore.QByteArray()
+        self.started = time.time()
+        self.first_item = None
+
+    def set_priority(self, priority):
+
+        """Set the priority of the request in the KIO scheduler, now or once
+        it is sent."""
+
+        self.priority = priority
+
+        if self.job is not None:
+            KIO.Scheduler.setJobPriority(self.job, priority)
 
 
 class DanbooruService(QtCore.QObject):
@@ -61,12 +165,15 @@ class DanbooruService(QtCore.QObject):
     """
 
     postRetrieved = QtCore.pyqtSignal(containers.DanbooruPost)
+    postListStarted = QtCore.pyqtSignal(int)
     postDownloadFinished = QtCore.pyqtSignal()
     poolDownloadFinished = QtCore.pyqtSignal()
     tagRetrieved = QtCore.pyqtSignal(containers.DanbooruTag)
+    tagListRetrieved = QtCore.pyqtSignal(list)
     poolRetrieved = QtCore.pyqtSignal(containers.DanbooruPool)
     downloadError = QtCore.pyqtSignal(unicode)
-    allTags = QtCore.pyqtSignal(list)
+    tagIndexUpdated = QtCore.pyqtSignal(int)
+    completionUpdated = QtCore.pyqtSignal()
 
     def __init__(self, board_url, username=None, password=None, cache=None,
                  parent=None):
@@ -77,217 +184,833 @@ class DanbooruService(QtCore.QObject):
         self.username = username
         self.password = password
         self.tag_blacklist = None
+        # A ThumbnailStore holding the thumbnails downloaded, on disk
         self.cache = cache
+        self.response_cache = None
+
+        # A ThumbnailCache of decoded thumbnails, looked up before the disk
+        self.thumbnail_cache = None
+        self.tag_cache = TagCache()
+        self.tag_index = None
+        self.completion = None
+        self.seen_md5 = None
+
+        # Completion indexes are built one at a time, away from the GUI
+        self.__completion_pool = QtCore.QThreadPool(self)
+        self.__completion_pool.setMaxThreadCount(1)
+        self.__completion_signals = _CompletionSignals(self)
+        self.__completion_signals.finished.connect(
+            self.__slot_completion_built)
+        self.__completion_tasks = dict()
+        self.__completion_id = 0
+
+        # Without thumbnails, posts are made available as soon as parsed
+        self.thumbnails = True
+        self.capabilities = boards.capabilities(board_url)
+        self.response_format = formats.response_format(
+            self.capabilities.response_format)
+        self.limiter = ratelimit.shared_limiter()
+        self.scheduler = scheduler.ThumbnailScheduler(
+            limiter=self.limiter, board_url=board_url, parent=self)
+        self.decoder = decoder.shared_decoder()
         self.__data = None
+        self.__parsing = False
+        self.__filter = None
+        self.__group = 0
         self._current_tags = None
 
-    def __slot_process_post_list(self, job):
+        # Prefetching of the following pages
+        self.prefetch_depth = 1
+        self.prefetch_thumbnails = True
+        self.__prefetch_query = None
+        self.__prefetch_page = None
+        self.__prefetched = OrderedDict()
+        self.__prefetch_requests = dict()
+
+        # Requests in progress, and the callers waiting for them
+        self.__requests = dict()
+        self.__inflight = dict()
+        self.__stats = dict(cached=0, coalesced=0, started=0, discarded=0,
+                            retried=0)
+        self.__timings = dict(first_item=None, complete=None)
+
+        self.postDownloadFinished.connect(self.__prefetch_next)
+
+    def __request_url(self, endpoint, parameters=None):
+
+        """Create the URL of a request to *endpoint*, in the format of
+        :attr:`response_format`."""
+
+        return utils.danbooru_request_url(self.url,
+                                          self.response_format.path(endpoint),
+                                          parameters, self.username,
+                                          self.password)
+
+    def __get(self, request_url, endpoint, kind, handler, ttl=None,
+              stream=False, cached=True, **options):
+
+        """Retrieve the answer to an API request, and pass it to *handler*.
+
+        Answers are looked up in :attr:`response_cache` first: fresh ones are
+        used as they are, stale ones are revalidated with a conditional
+        request. If the same request is already in progress, *handler* waits
+        for its answer instead of starting a new one.
+
+        The answer is parsed with the parser for answers of type *kind* in
+        :attr:`response_format` (see :mod:`danbooru.api.formats`), and
+        *handler* is called with the list of parsed items, a dictionary
+        holding *options*, and whether the answer is complete. If *stream*
+        is :const:`True`, the answer is parsed while it is being downloaded
+        and *handler* is called each time new items are available; otherwise
+        it is called only once.
+
+        :param request_url: The URL of the request
+        :param endpoint: The API path, used to pick the cache lifetime
+        :param kind: The kind of answer, e.g. ``formats.POSTS``
+        :param handler: The callable processing the answer
+        :param ttl: Lifetime of cached answers, overriding the default one
+        :param stream: Whether to process the answer as it arrives
+        :param cached: Whether to use :attr:`response_cache` at all
+        :param on_error: Called with the dictionary of options, instead of
+                         *handler*, if the request fails
+        :return: The request in progress, or :const:`None` if the cache was
+                 used
 
-        """Slot called from :meth:`get_post_list`."""
+        """
 
-        if job.error():
-            self.downloadError.emit(unicode(job.errorString()))
+        key = utils.request_key(request_url)
+        parser = self.response_format.parser(kind)
+        entry = None
+
+        if ttl is None:
+            ttl = CACHE_TTL.get(endpoint, 0)
+
+        if cached and self.response_cache is not None:
+            entry = self.response_cache.lookup(key)
+
+        if entry is not None and entry.age < ttl:
+            self.__stats["cached"] += 1
+            items = _parse(parser(), QtCore.QByteArray(entry.data))
+            QtCore.QTimer.singleShot(0, partial(handler, items, options,
+                                                True))
             return
 
-        job_data = job.data()
+        if key in self.__inflight:
+            self.__stats["coalesced"] += 1
+            request = self.__inflight[key]
+            request.waiters.append((handler, options))
+
+            # Catch up with what was already streamed
+            if request.items:
+                handler(list(request.items), options, False)
+
+            return request
+
+        self.__stats["started"] += 1
+
+        reload_policy = KIO.NoReload
+
+        if entry is not None or not cached:
+            reload_policy = KIO.Reload
+
+        request = _PendingRequest(key, request_url, reload_policy, entry,
+                                  parser(), stream, cached,
+                                  (handler, options))
+        self.__inflight[key] = request
+        self.limiter.request(self.url, partial(self.__start_request, request))
+
+        return request
 
-        stream = QXmlStreamReader()
-        stream.addData(job_data)
+    def __start_request(self, request):
 
-        blacklisted_tags = job.property("blacklisted_tags").toPyObject()
-        allowed_rating = job.property("ratings").toPyObject()
+        """Send *request* to the board, once allowed by :attr:`limiter`."""
 
-        if allowed_rating is not None:
-            allowed_ratings = MAX_RATINGS[unicode(allowed_rating)]
+        if self.__inflight.get(request.key) is not request:
+            # Cancelled while waiting
+            return
+
+        flags = KIO.JobFlags(KIO.HideProgressInfo)
+
+        if request.stream:
+            job = KIO.get(request.url, request.reload_policy, flags)
+            job.data.connect(self.__slot_request_data)
         else:
-            allowed_ratings = None
+            job = KIO.storedGet(request.url, request.reload_policy, flags)
 
-        self.__data = set()
+        if request.entry is not None:
+            # Ask the board directly whether our copy is still valid
+            headers = request.entry.validation_headers()
 
-        while not stream.atEnd() and not stream.hasError():
+            if headers:
+                job.addMetaData("customHTTPHeader", "\r\n".join(headers))
 
-            token = stream.readNext()
+        job.addMetaData("PropagateHttpHeader", "true")
 
-            if token == QXmlStreamReader.StartDocument:
-                continue
+        # Error pages would be streamed and cached like answers otherwise
+        job.addMetaData("errorPage", "false")
 
-            if (token == QXmlStreamReader.StartElement and
-                stream.name() != "posts" and stream.name() != "pool"):
+        request.job = job
+        self.__requests[job] = request.key
+        job.result.connect(self.__slot_request_finished)
 
-                # Skip description tags
+        if request.priority is not None:
+            KIO.Scheduler.setJobPriority(job, request.priority)
 
-                if stream.name() == "description":
-                    continue
+    def __retry_request(self, request, job):
 
-                attributes = stream.attributes()
-                item = containers.DanbooruPost(attributes)
+        """Send *request* again after a failure, if it is worth it.
 
-                if blacklisted_tags is not None and blacklisted_tags:
-                    if any((tag in blacklisted_tags for tag in item.tags)):
-                        continue
+        :return: :const:`True` if the request will be sent again
 
-                # Same for ratings
-                if (allowed_ratings is not None
-                    and item.rating not in allowed_ratings):
+        """
 
-                    continue
+        # Items already delivered would be delivered twice
+        if request.items or request.attempts >= ratelimit.MAX_RETRIES:
+            return False
 
-                self.__data.add(item)
-                self.download_thumbnail(item)
+        if not ratelimit.should_retry(job):
+            return False
 
-        if not self.__data:
-            self.postDownloadFinished.emit()
+        delay = ratelimit.retry_delay(request.attempts)
+        request.attempts += 1
+        request.job = None
+        request.parser = type(request.parser)()
+        request.body = QtCore.QByteArray()
+
+        self.__inflight[request.key] = request
+        self.__stats["retried"] += 1
+
+        retry = partial(self.limiter.request, self.url,
+                        partial(self.__start_request, request))
+        QtCore.QTimer.singleShot(int(delay * 1000), retry)
+
+        return True
+
+    def __slot_request_data(self, job, data):
+
+        """Slot called when a chunk of a streamed answer arrives."""
+
+        key = self.__requests.get(job)
+
+        if key is None or data.isEmpty():
+            return
+
+        request = self.__inflight[key]
+
+        if request.cached:
+            request.body.append(data)
+
+        items = request.parser.feed(data)
+
+        if not items:
             return
 
-    def __slot_process_tag_list(self, job):
+        if not request.items:
+            request.first_item = time.time()
+
+        request.items.extend(items)
+
+        for handler, options in list(request.waiters):
+            handler(items, options, False)
 
-        """Slot called from :meth:`get_tag_list` and by related tag processing
-        functions."""
+    def __slot_request_finished(self, job):
+
+        """Slot called when a request started by :meth:`__get` is done."""
+
+        key = self.__requests.pop(job, None)
+
+        if key is None:
+            return
+
+        request = self.__inflight.pop(key)
+        entry = request.entry
+
+        if job.error() and ratelimit.is_throttled(job):
+            self.limiter.throttled(self.url, job)
+        elif not job.error():
+            self.limiter.succeeded(self.url)
 
         if job.error():
-            self.downloadError.emit(unicode(job.errorString()))
+
+            if self.__retry_request(request, job):
+                return
+
+            if entry is None or request.items:
+
+                self.downloadError.emit(unicode(job.errorString()))
+
+                for handler, options in request.waiters:
+
+                    if options.get("on_error") is not None:
+                        options["on_error"](options)
+                    elif request.items:
+                        # Let the handlers which already got items finish
+                        handler(list(), options, True)
+
+                self.__forget_prefetch(request)
+
+                return
+
+            # Better stale data than no data
+            parser = type(request.parser)()
+            items = _parse(parser, QtCore.QByteArray(entry.data))
+
+        elif entry is not None and job.queryMetaData("responsecode") == "304":
+
+            self.response_cache.refresh(key)
+            items = _parse(request.parser, QtCore.QByteArray(entry.data))
+
+        else:
+
+            if request.stream:
+                # Everything was fed to the parser as it arrived
+                data = request.body
+                items = request.parser.finish()
+            else:
+                data = job.data()
+                items = _parse(request.parser, data)
+
+            if (request.cached and self.response_cache is not None and
+                request.parser.error is None):
+
+                etag, last_modified = utils.validators(
+                    job.queryMetaData("HTTP-Headers"))
+                self.response_cache.store(key, data.data(), etag,
+                                          last_modified)
+
+        now = time.time()
+        first_item = request.first_item or now
+        self.__timings = dict(first_item=first_item - request.started,
+                              complete=now - request.started)
+
+        for handler, options in request.waiters:
+            handler(items, options, True)
+
+    def __forget_prefetch(self, request):
+
+        """Forget *request*, which failed, if it was retrieving a page in
+        advance, so that the page can be asked for again."""
+
+        for page, prefetch in list(self.__prefetch_requests.items()):
+            if prefetch is request:
+                del self.__prefetch_requests[page]
+
+    def __cancel_request(self, request, handler):
+
+        """Stop waiting for the answer of *request* in *handler*. The
+        request is dropped (and its job killed) if no other caller is
+        waiting for it."""
+
+        if self.__inflight.get(request.key) is not request:
             return
 
-        job_data = job.data()
+        waiters = request.waiters
+        waiters[:] = [item for item in waiters if item[0] != handler]
 
-        stream = QXmlStreamReader()
-        stream.addData(job_data)
-        blacklisted_tags = job.property("blacklisted_tags").toPyObject()
+        if waiters:
+            return
 
-        while not stream.atEnd() and not stream.hasError():
+        del self.__inflight[request.key]
 
-             token = stream.readNext()
+        if request.job is not None:
+            del self.__requests[request.job]
+            request.job.kill()
 
-             if token == QXmlStreamReader.StartDocument:
-                continue
+    def __filter_posts(self, posts, options):
 
-             if (token == QXmlStreamReader.StartElement and
-                 stream.name() != "tags"):
+        """Exclude the posts matching the blacklist or with a rating higher
+        than allowed.
 
-                    attributes = stream.attributes()
-                    tag = containers.DanbooruTag(attributes)
+        :return: A list of :class:`DanbooruPost` instances
 
-                    if (blacklisted_tags is not None and
-                        tag.name in blacklisted_tags):
-                        continue
+        """
 
-                    self.tagRetrieved.emit(tag)
+        post_filter = options.get("filter")
 
-    def __slot_process_related_tag_list(self, job):
+        if post_filter is None:
+            post_filter = self.__post_filter(options.get("rating"),
+                                             options.get("blacklist"))
+            options["filter"] = post_filter
 
-        """Slot called from :meth:`get_related_tags`.
+        result = post_filter.filter(posts)
+        self.__stats["discarded"] += len(posts) - len(result)
 
-        For some reason Danbooru related tags lack information when compared
-        to "normally retrieved" tags, so the tags obtained are re-queried to
-        fetch all the information.
+        return result
+
+    def __post_filter(self, rating, blacklist):
+
+        """Return the compiled filter for *rating* and *blacklist*. The last
+        one is reused, as it is the same for all the pages of a search."""
+
+        key = (None if rating is None else unicode(rating),
+               tuple(unicode(entry) for entry in blacklist or ()))
+
+        if self.__filter is None or self.__filter[0] != key:
+
+            max_rating = None if rating is None else MAX_RATINGS[key[0]]
+            post_filter = filters.PostFilter(key[1], max_rating)
+            self.__filter = (key, post_filter)
+
+        return self.__filter[1]
+
+    def __process_post_list(self, posts, options, finished):
+
+        """Process the answers of :meth:`get_post_list` and
+        :meth:`get_pool`.
+
+        Posts are made available (and their thumbnails requested) as soon
+        as they are parsed, while the rest of the answer is still being
+        downloaded.
 
         """
 
+        if "group" not in options:
+            self.__start_post_list(options)
+        elif options["group"] != self.__group:
+            # Superseded by a more recent list
+            return
+
+        # Pages can shift while being read, repeating posts
+        seen = options["seen"]
+        posts = [item for item in self.__filter_posts(posts, options)
+                 if item not in seen]
+        seen.update(posts)
+
+        if self.seen_md5 is not None:
+            posts = self.__unseen_images(posts)
+
+        group = options["group"]
+        index = options["index"]
+        options["index"] += len(posts)
+
+        self.__data.update(posts)
+
+        for offset, item in enumerate(posts):
+
+            item.board = self.url
+
+            if self.thumbnails:
+                self.download_thumbnail(item, group, index + offset)
+            else:
+                self.__thumbnail_retrieved(item)
+
+        if not finished:
+            return
+
+        self.__parsing = False
+
+        if options["index"] == 0:
+            # Nothing to retrieve in advance after an empty page
+            self.__prefetch_page = None
+
+        if not self.__data:
+            self.__data = None
+            self.postDownloadFinished.emit()
+
+    def __unseen_images(self, posts):
+
+        """Skip the posts whose image is in :attr:`seen_md5`, and add the
+        others to it."""
+
+        unseen = list()
+
+        for item in posts:
+
+            if item.md5 is not None:
+
+                if item.md5 in self.seen_md5:
+                    continue
+
+                self.seen_md5.add(item.md5)
+
+            unseen.append(item)
+
+        return unseen
+
+    def __start_post_list(self, options):
+
+        """Prepare for the posts of a new list."""
+
+        self.__data = set()
+        self.__parsing = True
+
+        # Each list of posts is a separate group for the thumbnail scheduler
+        self.__group += 1
+        options["group"] = self.__group
+        options["index"] = 0
+        options["seen"] = set()
+
+        self.scheduler.set_active_group(self.__group)
+        self.postListStarted.emit(self.__group)
+
+    def __process_prefetched_post_list(self, posts, options, finished):
+
+        """Process a page retrieved in advance."""
+
+        received = options.setdefault("posts", list())
+        received.extend(self.__filter_posts(posts, options))
+
+        if not finished:
+            return
+
+        if options["query"] != self.__prefetch_query:
+            # The query changed in the meantime
+            return
+
+        page = options["page"]
+
+        if page not in self.__prefetch_requests:
+            # Requested while being retrieved: get_post_list got it already
+            return
+
+        del self.__prefetch_requests[page]
+
+        self.__prefetched[page] = received
+
+        while len(self.__prefetched) > max(self.prefetch_depth, 1):
+            self.__prefetched.popitem(last=False)
+
+        if self.prefetch_thumbnails and self.cache is not None:
+            self.__prefetch_thumbnails(page, received)
+
+    def __slot_prefetch_thumbnail(self, danbooru_item, job):
+
+        """Slot called when a thumbnail retrieved in advance has been
+        downloaded: the image is only stored in the cache, without being
+        decoded."""
+
         if job.error():
-            self.downloadError.emit(unicode(job.errorString()))
             return
 
-        job_data = job.data()
+        self.cache.put(self.url, danbooru_item.md5, job.data().data())
 
-        stream = QXmlStreamReader()
-        stream.addData(job_data)
-        blacklisted_tags = job.property("blacklisted_tags").toPyObject()
+    def __prefetch_thumbnails(self, page, posts):
 
-        while not stream.atEnd() and not stream.hasError():
+        """Queue the thumbnails of a page retrieved in advance, in a group
+        which is never the active one."""
 
-            token = stream.readNext()
+        for index, item in enumerate(posts):
 
-            if token == QXmlStreamReader.StartDocument:
+            if (self.url, item.md5) in self.cache:
                 continue
 
-            if (token == QXmlStreamReader.StartElement):
+            # Already supplied by another board of a federated search. Not
+            # marked as seen: the page is not shown yet
+            if self.seen_md5 is not None and item.md5 in self.seen_md5:
+                continue
 
-                name = stream.attributes().value("name").toString()
-                if not name.isEmpty():
-                    self.get_tag_list(limit=1, name=unicode(name),
-                                      blacklist=blacklisted_tags)
+            image_url = kdecore.KUrl(item.preview_url)
+            callback = partial(self.__slot_prefetch_thumbnail, item)
+            self.scheduler.submit(image_url, callback, -page, index)
 
+    def __prefetch_next(self):
 
-    def __slot_process_pool_list(self, job):
+        """Retrieve the pages following the current one in the background.
 
-        """Slot called from :meth:`get_pool_list"""
+        Called when all the posts of the current page have been
+        downloaded."""
 
-        if job.error():
-            self.downloadError.emit(unicode(job.errorString()))
+        if self.__prefetch_page is None or self.prefetch_depth <= 0:
             return
 
-        stream = QXmlStreamReader()
-        stream.addData(job.data())
+        query = self.__prefetch_query
+        tags, limit, rating, blacklist = query
+        current_page = self.__prefetch_page
+
+        # Do it only once per page
+        self.__prefetch_page = None
 
-        while not stream.atEnd() and not stream.hasError():
+        tags = "+".join(tags)
 
-            token = stream.readNext()
+        for page in range(current_page + 1,
+                          current_page + self.prefetch_depth + 1):
 
-            if token == QXmlStreamReader.StartDocument:
+            if (page in self.__prefetched or
+                page in self.__prefetch_requests):
                 continue
-            if (token == QXmlStreamReader.StartElement and stream.name() == "pool"):
-                pool = containers.DanbooruPool(stream.attributes())
-                self.poolRetrieved.emit(pool)
 
-        self.poolDownloadFinished.emit()
+            parameters = dict(tags=tags, limit=limit, page=page)
+            request_url = self.__request_url(POST_URL, parameters)
+
+            # Streamed, in case the page is requested while in progress
+            request = self.__get(request_url, POST_URL, formats.POSTS,
+                                 self.__process_prefetched_post_list,
+                                 stream=True, page=page, query=query,
+                                 rating=rating, blacklist=blacklist)
+
+            if request is not None:
+                # Low priority: these are not needed right now
+                request.set_priority(10)
+
+            self.__prefetch_requests[page] = request
+
+    def __process_tag_list(self, tags, options, finished):
+
+        """Process the answers of :meth:`get_tag_list`."""
+
+        tags = self.__store_tags(tags, options)
+        self.__emit_tags(tags)
 
-    def __slot_download_thumbnail(self, job):
+    def __store_tags(self, tags, options):
 
-        """Slot called from :meth:`download_thumbnail`."""
+        """Store *tags* in :attr:`tag_cache` (and :attr:`tag_index`, if
+        available), and return those which are not blacklisted."""
 
-        img = QtGui.QPixmap()
+        blacklisted_tags = filters.tag_names(options.get("blacklist"))
+        result = list()
+
+        if self.tag_index is not None:
+            self.tag_index.update(tags)
+
+        for tag in tags:
+
+            self.tag_cache.put(tag)
+
+            if tag.name in blacklisted_tags:
+                continue
+
+            result.append(tag)
+
+        return result
+
+    def __emit_tags(self, tags):
+
+        """Make a list of tags available, both one by one and as a
+        whole."""
+
+        for tag in tags:
+            self.tagRetrieved.emit(tag)
+
+        self.tagListRetrieved.emit(tags)
+
+    def __process_related_tag_list(self, related, options, finished):
+
+        """Process the answers of :meth:`get_related_tags`.
+
+        For some reason Danbooru related tags lack information when compared
+        to "normally retrieved" tags, so the missing information is looked up
+        in :attr:`tag_cache` first, then the tags not found are re-queried in
+        as few requests as the board allows.
+
+        """
+
+        blacklist = options.get("blacklist")
+        blacklisted_tags = filters.tag_names(blacklist)
+        names = list()
+
+        for name in related:
+
+            if name in names or name in blacklisted_tags:
+                continue
+
+            names.append(name)
+
+        self.__resolve_tags(names, blacklist)
+
+    def __resolve_tags(self, names, blacklist=None):
+
+        """Emit the complete information for the tags in *names*, once all
+        of them are known."""
+
+        missing = list()
+
+        for name in names:
+
+            if name in self.tag_cache:
+                continue
+
+            tag = None
+
+            if self.tag_index is not None:
+                tag = self.tag_index.lookup(name)
+
+            if tag is None:
+                missing.append(name)
+            else:
+                self.tag_cache.put(tag)
+
+        if not missing:
+            self.__emit_resolved_tags(names)
+            return
+
+        batch_size = max(self.capabilities.tag_batch_size, 1)
+        separator = self.capabilities.tag_batch_separator
+
+        batches = [missing[index:index + batch_size]
+                   for index in range(0, len(missing), batch_size)]
+
+        # Shared by all the batches, to know when the last one is done
+        pending = dict(names=names, batches=len(batches))
+
+        for batch in batches:
+
+            parameters = dict(name=separator.join(batch), limit=len(batch))
+            request_url = self.__request_url(TAG_URL, parameters)
+
+            self.__get(request_url, TAG_URL, formats.TAGS,
+                       self.__process_tag_batch, blacklist=blacklist,
+                       pending=pending, on_error=self.__finish_tag_batch)
+
+    def __process_tag_batch(self, tags, options, finished):
+
+        """Process the answer to a batch of tags looked up by
+        :meth:`__resolve_tags`."""
+
+        self.__store_tags(tags, options)
+        self.__finish_tag_batch(options)
+
+    def __finish_tag_batch(self, options):
+
+        """Account for a batch of tags, whether it was retrieved or not, and
+        emit the tags resolved once all the batches are done."""
+
+        pending = options["pending"]
+        pending["batches"] -= 1
+
+        if pending["batches"] == 0:
+            self.__emit_resolved_tags(pending["names"])
+
+    def __emit_resolved_tags(self, names):
+
+        """Emit the cached tags corresponding to *names*, in order."""
+
+        tags = [self.tag_cache.get(name) for name in names]
+        self.__emit_tags([tag for tag in tags if tag is not None])
+
+
+    def __process_pool_list(self, pools, options, finished):
+
+        """Process the answers of :meth:`get_pool_list`."""
+
+        for pool in pools:
+            self.poolRetrieved.emit(pool)
+
+        self.poolDownloadFinished.emit()
+
+    def __slot_download_thumbnail(self, danbooru_item, job):
+
+        """Slot called by the thumbnail scheduler, from
+        :meth:`download_thumbnail`. The image is decoded by :attr:`decoder`,
+        away from the GUI thread."""
 
         if job.error():
             self.downloadError.emit(unicode(job.errorString()))
+            self.__post_processed(danbooru_item)
             return
 
-        img.loadFromData(job.data())
+        data = job.data().data()
+        callback = partial(self.__slot_thumbnail_decoded, danbooru_item, data)
+        self.decoder.decode(data, callback)
 
-        if self.cache is not None:
-            self.cache.insert(job.url().fileName(), img)
+    def __slot_thumbnail_decoded(self, danbooru_item, data, pixmap):
+
+        """Slot called when a thumbnail has been decoded. *data* is stored
+        in the disk cache if it was just downloaded, :const:`None`
+        otherwise."""
+
+        if pixmap is None:
+            pixmap = QtGui.QPixmap()
+        else:
+
+            if self.cache is not None and data is not None:
+                self.cache.put(danbooru_item.board, danbooru_item.md5, data)
+
+            if self.thumbnail_cache is not None:
+                self.thumbnail_cache.put(danbooru_item.board,
+                                         danbooru_item.md5, pixmap)
+
+        danbooru_item.pixmap = pixmap
+
+        self.__thumbnail_retrieved(danbooru_item)
+
+    def __thumbnail_retrieved(self, danbooru_item):
 
-        danbooru_item = job.property("danbooru_item").toPyObject()
-        danbooru_item.pixmap = img
+        """Notify that the thumbnail of *danbooru_item* is available, and
+        whether the whole list has been processed."""
+
+        # Decoded after the list was cleared or replaced by another one
+        if self.__data is None or danbooru_item not in self.__data:
+            return
 
         self.postRetrieved.emit(danbooru_item)
+        self.__post_processed(danbooru_item)
 
-        if danbooru_item in self.__data:
-            self.__data.remove(danbooru_item)
+    def __post_processed(self, danbooru_item):
 
-        if not self.__data:
+        """Remove *danbooru_item* from the pending posts, and signal when
+        no more posts are left."""
+
+        if self.__data is None or danbooru_item not in self.__data:
+            return
+
+        self.__data.remove(danbooru_item)
+
+        # More posts may still be coming
+        if not self.__data and not self.__parsing:
             self.__data = None
             self.postDownloadFinished.emit()
 
-    def __slot_download_all_tags(self, job):
+    def __process_synced_tags(self, tags, options, finished):
 
-        """Slot called from :meth:`all_tags`."""
+        """Process the answer of :meth:`sync_tags`, as it arrives."""
 
-        if job.error():
-            self.downloadError.emit(unicode(job.errorString()))
-            return
+        last_id = self.tag_index.update(tags)
+        options["added"] = options.get("added", 0) + len(tags)
+        options["last_id"] = max(options.get("last_id", 0), last_id)
 
-        stream = QXmlStreamReader()
-        stream.addData(job.data())
-        container = deque()
+        if finished:
 
-        while not stream.atEnd() and not stream.hasError():
+            # Only a complete answer tells that nothing was missed
+            if options["last_id"] > self.tag_index.last_id:
+                self.tag_index.set_last_id(options["last_id"])
 
-            token = stream.readNext()
+            self.__finish_tag_sync(options)
 
-            if token == QXmlStreamReader.StartDocument:
-                continue
+    def __finish_tag_sync(self, options):
 
-            if (token == QXmlStreamReader.StartElement
-                and stream.name() == "tag"):
+        """Rebuild :attr:`completion` with the tags added by
+        :meth:`sync_tags`, even if it failed, and signal the end of the
+        synchronization."""
 
-                name = stream.attributes().value("name").toString()
+        added = options.get("added", 0)
+        building = bool(self.__completion_tasks)
 
-                if not name.isEmpty():
-                    name = unicode(name)
-                    container.append(name)
+        if added or (self.completion is None and not building):
+            self.__build_completion()
 
-        self.allTags.emit(container)
+        self.tagIndexUpdated.emit(added)
+
+    def __build_completion(self):
+
+        """Rebuild :attr:`completion` from the contents of the tag index,
+        in a worker thread. :attr:`completionUpdated` is emitted once the
+        new index is in place; until then the previous one is used."""
+
+        if self.tag_index is None or not len(self.tag_index):
+            return
+
+        self.__completion_id += 1
+        task = _CompletionTask(self.__completion_id, self.tag_index.path,
+                               self.__completion_signals)
+
+        # Kept until finished, rather than owned by the pool
+        task.setAutoDelete(False)
+        self.__completion_tasks[self.__completion_id] = task
+        self.__completion_pool.start(task)
+
+    def __slot_completion_built(self, task_id, index):
+
+        """Slot called when a completion index was built by
+        :meth:`__build_completion`."""
+
+        self.__completion_tasks.pop(task_id, None)
+
+        # A later build, with more tags, is on its way
+        if index is None or task_id != self.__completion_id:
+            return
 
+        self.completion = index
+        self.completionUpdated.emit()
 
     @property
     def current_tags(self):
@@ -296,54 +1019,213 @@ class DanbooruService(QtCore.QObject):
 
         return self._current_tags
 
-    def all_tags(self):
+    @property
+    def request_statistics(self):
 
-        """Fetch all the current tags."""
+        """Counters of the API requests made.
 
-        parameters = dict(limit=0, order="name")
-        flags = KIO.JobFlags(KIO.HideProgressInfo)
+        A dictionary with the number of requests answered from the cache
+        (``cached``), joined to an identical request in progress
+        (``coalesced``), and actually sent to the board (``started``), as
+        well as the number of failed requests sent again (``retried``). The
+        number of posts received but filtered out on the client is also
+        counted (``discarded``). The state of the rate limiter is in
+        :attr:`limiter`, the time taken to decode thumbnails in
+        :attr:`decoder`.
+
+        The time (in seconds) taken by the last request sent to the board
+        to produce its first item and to complete is also included
+        (``first_item`` and ``complete``).
+
+        """
+
+        statistics = dict(self.__stats)
+        statistics.update(self.__timings)
+
+        return statistics
+
+    def cancel_prefetch(self):
+
+        """Stop retrieving pages in advance, and discard those already
+        retrieved."""
+
+        for page, request in self.__prefetch_requests.items():
+
+            if request is not None:
+                self.__cancel_request(request,
+                                      self.__process_prefetched_post_list)
+
+            self.scheduler.cancel(-page)
+
+        for page in self.__prefetched:
+            self.scheduler.cancel(-page)
+
+        self.__prefetch_requests.clear()
+        self.__prefetched.clear()
+        self.__prefetch_query = None
+        self.__prefetch_page = None
+
+    def sync_tags(self):
+
+        """Bring :attr:`tag_index` up to date.
+
+        Only the tags added since the last complete synchronization (that
+        is, with an ID higher than :attr:`TagIndex.last_id
+        <danbooru.api.tagindex.TagIndex.last_id>`) are retrieved, in ID
+        order. :attr:`tagIndexUpdated` is emitted with the number of tags
+        added once done, and :attr:`completionUpdated` once
+        :attr:`completion` has been rebuilt. If the synchronization fails,
+        the tags received are kept, but the next one starts again from the
+        same point.
+
+        """
+
+        if self.tag_index is None:
+            return
+
+        # Complete from what is stored while the new tags arrive
+        if self.completion is None:
+            self.__build_completion()
 
-        request_url = utils.danbooru_request_url(self.url, TAG_URL,
-                                                 parameters, self.username,
-                                                 self.password)
+        parameters = dict(after_id=self.tag_index.last_id, limit=0,
+                          order="id")
+        request_url = self.__request_url(TAG_URL, parameters)
 
-        job = KIO.storedGet(request_url, KIO.Reload, flags)
-        job.result.connect(self.__slot_download_all_tags)
+        # The answer is stored in the index rather than in the cache
+        self.__get(request_url, TAG_URL, formats.TAGS,
+                   self.__process_synced_tags, stream=True, cached=False,
+                   on_error=self.__finish_tag_sync)
 
+    def unknown_tags(self, tags):
 
+        """Return the tags of a search which are not in :attr:`tag_index`.
 
-    def download_thumbnail(self, danbooru_item):
+        Negated tags are checked without their prefix, while metatags and
+        wildcards are never reported. Nothing is reported if the index is
+        not available or was never synchronized.
+
+        :param tags: The tags of the search
+        :return: A list of tags
+
+        """
+
+        if self.tag_index is None or self.tag_index.last_id == 0:
+            return list()
+
+        unknown = list()
+
+        for tag in tags or ():
+
+            tag = unicode(tag).strip()
+            name = tag.lstrip("-~")
+
+            if not name or ":" in name or "*" in name:
+                continue
+
+            if name not in self.tag_index:
+                unknown.append(tag)
+
+        return unknown
+
+    def download_thumbnail(self, danbooru_item, group=None, index=0):
 
         """Retrieve a thumbnail for a specific Danbooru item.
 
-        KIO.storedGet is used for asyncrhonous download. Jobs are scheduled
-        to prevent server overload.
+        Downloads are queued in the thumbnail scheduler (see
+        :class:`ThumbnailScheduler <danbooru.api.scheduler.ThumbnailScheduler>`)
+        to prevent server overload and to fetch visible thumbnails first.
 
         :param danbooru_item: An instance of
                               :class:`DanbooruItem <danbooru.api.containers.DanbooruItem>`
+        :param group: The scheduler group the item belongs to
+        :param index: The position of the item in the list of posts
 
         """
 
         image_url = kdecore.KUrl(danbooru_item.preview_url)
-        flags = KIO.JobFlags(KIO.HideProgressInfo)
-
-        pixmap = QtGui.QPixmap()
-        name = image_url.fileName()
+        board = danbooru_item.board or self.url
 
         # No need to download if in cache
+        if self.thumbnail_cache is not None:
+            pixmap = self.thumbnail_cache.get(board, danbooru_item.md5)
 
-        if self.cache is not None:
-            if self.cache.find(name, pixmap):
+            if pixmap is not None:
                 danbooru_item.pixmap = pixmap
-                self.postRetrieved.emit(danbooru_item)
+                self.__thumbnail_retrieved(danbooru_item)
                 return
 
-        job = KIO.storedGet(image_url, KIO.NoReload, flags)
-        job.setProperty("danbooru_item", QtCore.QVariant(danbooru_item))
+        data = None
+
+        if self.cache is not None:
+            data = self.cache.get(board, danbooru_item.md5)
+
+        if data is not None:
+            callback = partial(self.__slot_thumbnail_decoded, danbooru_item,
+                               None)
+            self.decoder.decode(data, callback)
+            return
+
+        callback = partial(self.__slot_download_thumbnail, danbooru_item)
+        self.scheduler.submit(image_url, callback, group, index)
+
+    def thumbnail(self, danbooru_item, callback=None):
 
-        # Schedule: we don't want to overload servers
-        KIO.Scheduler.setJobPriority(job, 1)
-        job.result.connect(self.__slot_download_thumbnail)
+        """Return the thumbnail of *danbooru_item* if it is cached, in
+        :attr:`thumbnail_cache` or on disk, or :const:`None`. The board is
+        never asked for it.
+
+        :param danbooru_item: An instance of :class:`DanbooruPost
+                              <danbooru.api.containers.DanbooruPost>`
+        :param callback: If given, a thumbnail found on disk is decoded in
+                         the background and passed to *callback*, rather
+                         than returned
+
+        """
+
+        board = danbooru_item.board or self.url
+
+        if self.thumbnail_cache is not None:
+            pixmap = self.thumbnail_cache.get(board, danbooru_item.md5)
+
+            if pixmap is not None:
+                return pixmap
+
+        if self.cache is None:
+            return
+
+        data = self.cache.get(board, danbooru_item.md5)
+
+        if data is None:
+            return
+
+        if callback is not None:
+            self.decoder.decode(data, partial(self.__slot_thumbnail_loaded,
+                                              board, danbooru_item.md5,
+                                              callback))
+            return
+
+        pixmap = QtGui.QPixmap()
+
+        if not pixmap.loadFromData(data):
+            return
+
+        if self.thumbnail_cache is not None:
+            self.thumbnail_cache.put(board, danbooru_item.md5, pixmap)
+
+        return pixmap
+
+    def __slot_thumbnail_loaded(self, board, md5, callback, pixmap):
+
+        """Slot called when a thumbnail asked to :meth:`thumbnail` has been
+        decoded."""
+
+        if pixmap is None:
+            return
+
+        if self.thumbnail_cache is not None:
+            self.thumbnail_cache.put(board, md5, pixmap)
+
+        callback(pixmap)
 
     def get_pool(self, pool_id, page=None, rating="Safe", blacklist=None):
 
@@ -359,18 +1241,15 @@ class DanbooruService(QtCore.QObject):
         if page is not None:
             parameters["page"] = page
 
-        request_url = utils.danbooru_request_url(self.url, POOL_DATA_URL,
-                                                 parameters, self.username,
-                                                 self.password)
+        request_url = self.__request_url(POOL_DATA_URL, parameters)
 
-        job = KIO.storedGet(request_url, KIO.NoReload,
-                            KIO.HideProgressInfo)
-
-        job.setProperty("ratings", QtCore.QVariant(rating))
-        job.setProperty("blacklisted_tags", QtCore.QVariant(blacklist))
+        # Pools are not retrieved in advance
+        self.cancel_prefetch()
 
         # We get a list of posts, which we can handle normally
-        job.result.connect(self.__slot_process_post_list)
+        self.__get(request_url, POOL_DATA_URL, formats.POOL_POSTS,
+                   self.__process_post_list, stream=True, rating=rating,
+                   blacklist=blacklist)
 
     def get_post_list(self, page=None, tags=None, limit=100, rating="Safe",
                       blacklist=None):
@@ -388,6 +1267,12 @@ class DanbooruService(QtCore.QObject):
 
         Ratings can be controlled with the *rating* parameter.
 
+        When the board supports it, the rating limit and the blacklisted
+        tags are added to the search (see
+        :func:`danbooru.api.filters.server_tags`), so that the board does not
+        send posts which would be discarded. Posts are still filtered on the
+        client for what could not be added.
+
         :param page: The page to view (default: 0)
         :param tags: A list of tags to include (if None, use all tags)
         :param limit: The maximum number of items to retrieve (up to 100)
@@ -395,33 +1280,65 @@ class DanbooruService(QtCore.QObject):
                        "Questionable", and "Explicit".
         :param blacklist: A blacklist of tags used to exclude posts
 
+        Once all the posts have been retrieved, the following
+        :attr:`prefetch_depth` pages are retrieved in the background, so that
+        they are available immediately when requested.
+
         """
 
         if limit > 100:
             limit = 100
 
-        if tags is None:
-            tags = ""
-        else:
+        if tags is not None:
             self._current_tags = tags
-            tags = "+".join(tags)
 
-        parameters = dict(tags=tags, limit=limit)
+        if self.capabilities.server_filters:
+            search_tags = filters.server_tags(tags, blacklist,
+                                              MAX_RATINGS[unicode(rating)],
+                                              self.capabilities.max_tags)
+        else:
+            search_tags = tags or ()
+
+        query = (tuple(search_tags), limit, unicode(rating),
+                 tuple(unicode(tag) for tag in blacklist or ()))
+
+        parameters = dict(tags="+".join(search_tags), limit=limit)
 
         if page is not None:
             parameters["page"] = page
 
-        request_url = utils.danbooru_request_url(self.url, POST_URL,
-                                                 parameters, self.username,
-                                                 self.password)
+        # A different query makes the pages retrieved in advance useless
 
-        job = KIO.storedGet(request_url, KIO.NoReload,
-                            KIO.HideProgressInfo)
+        if query != self.__prefetch_query:
+            self.cancel_prefetch()
+            self.__prefetch_query = query
 
-        job.setProperty("ratings", QtCore.QVariant(rating))
-        job.setProperty("blacklisted_tags", QtCore.QVariant(blacklist))
+        page_number = 1 if page is None else int(page)
+        self.__prefetch_page = page_number
 
-        job.result.connect(self.__slot_process_post_list)
+        posts = self.__prefetched.pop(page_number, None)
+
+        if posts is not None:
+            # Thumbnails still queued are now retrieved with the page
+            self.scheduler.cancel(-page_number)
+            QtCore.QTimer.singleShot(0, partial(self.__process_post_list,
+                                                posts, dict(), True))
+            return
+
+        request = self.__prefetch_requests.pop(page_number, None)
+
+        # Requests over (or cancelled) have no job to reprioritise anymore
+        if (request is not None and
+            self.__inflight.get(request.key) is request):
+            # Being retrieved in advance: the request below will wait for
+            # it, which is now needed as soon as possible
+            request.set_priority(0)
+
+        request_url = self.__request_url(POST_URL, parameters)
+
+        self.__get(request_url, POST_URL, formats.POSTS,
+                   self.__process_post_list, stream=True, rating=rating,
+                   blacklist=blacklist)
 
     def get_related_tags(self, tags=None, tag_type=None, blacklist=None):
 
@@ -446,15 +1363,10 @@ class DanbooruService(QtCore.QObject):
 
             parameters["type"] = tag_type
 
-        request_url = utils.danbooru_request_url(self.url, RELATED_TAG_URL,
-                                                 parameters, self.username,
-                                                 self.password)
+        request_url = self.__request_url(RELATED_TAG_URL, parameters)
 
-        job = KIO.storedGet(request_url, KIO.NoReload,
-                            KIO.HideProgressInfo)
-
-        job.setProperty("tag_blacklist", QtCore.QVariant(blacklist))
-        job.result.connect(self.__slot_process_related_tag_list)
+        self.__get(request_url, RELATED_TAG_URL, formats.RELATED_TAGS,
+                   self.__process_related_tag_list, blacklist=blacklist)
 
 
     def get_tag_list(self, limit=10, name="", blacklist=None):
@@ -473,15 +1385,10 @@ class DanbooruService(QtCore.QObject):
 
         parameters = dict(name=name, limit=limit)
 
-        request_url = utils.danbooru_request_url(self.url, TAG_URL, parameters,
-                                                 self.username, self.password)
-
-        job = KIO.storedGet(request_url, KIO.NoReload,
-                            KIO.HideProgressInfo)
-
-        job.setProperty("tag_blacklist", QtCore.QVariant(blacklist))
+        request_url = self.__request_url(TAG_URL, parameters)
 
-        job.result.connect(self.__slot_process_tag_list)
+        self.__get(request_url, TAG_URL, formats.TAGS,
+                   self.__process_tag_list, blacklist=blacklist)
 
     def get_pool_list(self, page=None):
 
@@ -495,11 +1402,7 @@ class DanbooruService(QtCore.QObject):
         else:
             parameters = None
 
-        request_url = utils.danbooru_request_url(self.url, POOL_URL, parameters,
-                                                 self.username, self.password)
-
-        job = KIO.storedGet(request_url, KIO.NoReload,
-                            KIO.HideProgressInfo)
-
+        request_url = self.__request_url(POOL_URL, parameters)
 
-        job.result.connect(self.__slot_process_pool_list)
+        self.__get(request_url, POOL_URL, formats.POOLS,
+                   self.__process_pool_list)
@@ -0,0 +1,348 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#   Copyright 2011 Luca Beltrame <einar@heavensinferno.net>
+#
+#   This program is free software; you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License, under
+#   version 2 of the License, or (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details
+#
+#   You should have received a copy of the GNU General Public
+#   License along with this program; if not, write to the
+#   Free Software Foundation, Inc.,
+#   51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+"""This module contains the scheduler used to download thumbnails.
+
+Requests are kept in a priority queue and only a limited number of them is
+run at the same time for each host. Requests belong to *groups* (one for each
+list of posts retrieved) and the priority of each request depends on whether
+its group is the one currently shown, and on whether its position falls in
+the range that is visible on screen.
+
+Requests are also subject to the rate limiter of the board for static
+files, if any (see :mod:`danbooru.api.ratelimit`), and retried when they
+fail in a way that another attempt can fix.
+
+"""
+
+__all__ = ["ThumbnailScheduler"]
+
+import heapq
+import itertools
+import sys
+
+from functools import partial
+
+import PyQt4.QtCore as QtCore
+import PyKDE4.kdecore as kdecore
+from PyKDE4.kio import KIO
+
+from . import ratelimit
+
+if sys.version_info.major > 2:
+    unicode = str
+
+# Maximum number of concurrent thumbnail downloads for each host
+MAX_JOBS_PER_HOST = 4
+
+# Priorities: lower values are run first
+VISIBLE_PRIORITY = 0
+ACTIVE_PRIORITY = 1000
+BACKGROUND_PRIORITY = 100000
+
+
+class _Request(object):
+
+    """A single queued thumbnail download."""
+
+    def __init__(self, url, callback, group, index):
+
+        self.url = url
+        self.host = unicode(url.host())
+        self.callback = callback
+        self.group = group
+        self.index = index
+        self.priority = BACKGROUND_PRIORITY
+        self.cancelled = False
+        self.attempts = 0
+
+
+class ThumbnailScheduler(QtCore.QObject):
+
+    """Priority-based scheduler for thumbnail downloads.
+
+    :param max_per_host: The maximum number of jobs running at the same time
+                         against a single host
+    :param limiter: The :class:`RateLimiter
+                    <danbooru.api.ratelimit.RateLimiter>` requests are
+                    subject to, or :const:`None`
+    :param board_url: The URL of the board the thumbnails belong to, whose
+                      budget in *limiter* is used
+
+    """
+
+    def __init__(self, max_per_host=MAX_JOBS_PER_HOST, limiter=None,
+                 board_url=None, parent=None):
+
+        super(ThumbnailScheduler, self).__init__(parent)
+
+        self.max_per_host = max_per_host
+        self.limiter = limiter
+        self.board_url = board_url
+        self.__queue = list()
+        self.__waiting = set()
+        self.__retrying = set()
+        self.__running = dict()
+        self.__host_jobs = dict()
+        self.__counter = itertools.count()
+        self.__active_group = None
+        self.__visible = dict()
+
+    def __len__(self):
+
+        "Returns the number of requests still waiting to be started."
+
+        return len([item for item in self.__queue if not item[-1].cancelled])
+
+    @property
+    def active_group(self):
+
+        """The group currently shown to the user."""
+
+        return self.__active_group
+
+    def __priority(self, request):
+
+        """Compute the priority of a request: lower values are served
+        first."""
+
+        if request.group != self.__active_group:
+            return BACKGROUND_PRIORITY + request.index
+
+        visible = self.__visible.get(request.group)
+
+        if visible is None:
+            return ACTIVE_PRIORITY + request.index
+
+        first, last = visible
+
+        if first <= request.index <= last:
+            return VISIBLE_PRIORITY + request.index - first
+
+        # Offscreen items: the closer they are to the visible range, the
+        # sooner they are fetched
+
+        if request.index > last:
+            distance = request.index - last
+        else:
+            distance = first - request.index
+
+        return ACTIVE_PRIORITY + distance
+
+    def __reprioritize(self):
+
+        """Recompute all the priorities in the queue."""
+
+        queue = list()
+
+        for _, count, request in self.__queue:
+
+            if request.cancelled:
+                continue
+
+            request.priority = self.__priority(request)
+            queue.append((request.priority, count, request))
+
+        heapq.heapify(queue)
+        self.__queue = queue
+
+    def __pending(self, group):
+
+        """Whether requests of *group* are still queued, waiting for the
+        rate limiter or for a retry, or running."""
+
+        requests = itertools.chain((entry[-1] for entry in self.__queue),
+                                   self.__waiting, self.__retrying,
+                                   self.__running.values())
+
+        return any(request.group == group and not request.cancelled
+                   for request in requests)
+
+    def __prune(self, group):
+
+        """Forget the visible range of *group* once it is no longer shown
+        and all its requests are over."""
+
+        if group != self.__active_group and not self.__pending(group):
+            self.__visible.pop(group, None)
+
+    def __dispatch(self):
+
+        """Start as many queued requests as the per-host limits allow."""
+
+        deferred = list()
+
+        while self.__queue:
+
+            entry = heapq.heappop(self.__queue)
+            request = entry[-1]
+
+            if request.cancelled:
+                continue
+
+            if self.__host_jobs.get(request.host, 0) >= self.max_per_host:
+                deferred.append(entry)
+                continue
+
+            # The slot is taken while waiting for the rate limiter
+            self.__host_jobs[request.host] = self.__host_jobs.get(
+                request.host, 0) + 1
+
+            if self.limiter is None:
+                self.__start(request)
+            else:
+                self.__waiting.add(request)
+                self.limiter.request(self.board_url or request.url,
+                                     partial(self.__start, request),
+                                     static=True)
+
+        for entry in deferred:
+            heapq.heappush(self.__queue, entry)
+
+    def __start(self, request):
+
+        self.__waiting.discard(request)
+
+        if request.cancelled:
+            self.__host_jobs[request.host] -= 1
+            self.__dispatch()
+            return
+
+        flags = KIO.JobFlags(KIO.HideProgressInfo)
+        job = KIO.storedGet(request.url, KIO.NoReload, flags)
+
+        self.__running[job] = request
+        job.result.connect(self.__slot_job_finished)
+
+    def __requeue(self, request):
+
+        """Queue a failed request again."""
+
+        self.__retrying.discard(request)
+
+        if request.cancelled:
+            self.__prune(request.group)
+            return
+
+        request.priority = self.__priority(request)
+        heapq.heappush(self.__queue, (request.priority,
+                                      next(self.__counter), request))
+        self.__dispatch()
+
+    def __slot_job_finished(self, job):
+
+        request = self.__running.pop(job, None)
+
+        if request is None:
+            return
+
+        self.__host_jobs[request.host] -= 1
+
+        board_url = self.board_url or request.url
+
+        if self.limiter is not None:
+            if job.error() and ratelimit.is_throttled(job):
+                self.limiter.throttled(board_url, job, static=True)
+            elif not job.error():
+                self.limiter.succeeded(board_url, static=True)
+
+        if (not request.cancelled and request.attempts < ratelimit.MAX_RETRIES
+            and ratelimit.should_retry(job)):
+
+            delay = ratelimit.retry_delay(request.attempts)
+            request.attempts += 1
+
+            # Only the timer refers to it otherwise, out of reach of cancel()
+            self.__retrying.add(request)
+            QtCore.QTimer.singleShot(int(delay * 1000),
+                                     partial(self.__requeue, request))
+
+        elif not request.cancelled:
+            request.callback(job)
+
+        self.__dispatch()
+        self.__prune(request.group)
+
+    def submit(self, url, callback, group=None, index=0):
+
+        """Queue a thumbnail for download.
+
+        :param url: The URL of the thumbnail, as a ``KUrl``
+        :param callback: A callable which is passed the finished job
+        :param group: The group the request belongs to
+        :param index: The position of the thumbnail inside its group
+
+        """
+
+        request = _Request(kdecore.KUrl(url), callback, group, index)
+        request.priority = self.__priority(request)
+
+        heapq.heappush(self.__queue, (request.priority,
+                                      next(self.__counter), request))
+        self.__dispatch()
+
+    def set_active_group(self, group):
+
+        """Set the group which is currently displayed: its requests will be
+        run before the others."""
+
+        if group == self.__active_group:
+            return
+
+        previous = self.__active_group
+        self.__active_group = group
+        self.__reprioritize()
+        self.__prune(previous)
+
+    def set_visible_range(self, group, first, last):
+
+        """Set the range of positions which are visible on screen for a
+        specific group."""
+
+        if self.__visible.get(group) == (first, last):
+            return
+
+        self.__visible[group] = (first, last)
+
+        if group == self.__active_group:
+            self.__reprioritize()
+
+    def cancel(self, group=None):
+
+        """Cancel the queued requests belonging to *group*, or all of them
+        if *group* is :const:`None`. Running jobs are left to complete, but
+        their callbacks are not called."""
+
+        for _, _, request in self.__queue:
+            if group is None or request.group == group:
+                request.cancelled = True
+
+        requests = itertools.chain(self.__running.values(), self.__waiting,
+                                   self.__retrying)
+
+        for request in requests:
+            if group is None or request.group == group:
+                request.cancelled = True
+
+        if group is None:
+            self.__visible.clear()
+        else:
+            self.__visible.pop(group, None)
+
+        self.__reprioritize()
@@ -0,0 +1,233 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#   Copyright 2011 Luca Beltrame <einar@heavensinferno.net>
+#
+#   This program is free software; you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License, under
+#   version 2 of the License, or (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details
+#
+#   You should have received a copy of the GNU General Public
+#   License along with this program; if not, write to the
+#   Free Software Foundation, Inc.,
+#   51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+"""This module contains the local index of the tags of a board.
+
+The index is a SQLite database (one for each board) holding the name, type
+and post count of each tag. It is kept up to date by asking the board only
+for the tags added since the last synchronization (see
+:meth:`DanbooruService.sync_tags
+<danbooru.api.remote.DanbooruService.sync_tags>`), so that lookups and
+completions never need the network.
+
+Tags retrieved for other reasons (related tags, for instance) are stored
+too, so the highest ID stored says nothing about what was synchronized: the
+ID reached by the last complete synchronization is kept apart, in the
+``metadata`` table.
+
+"""
+
+__all__ = ["TagIndex"]
+
+import sqlite3
+import sys
+
+from . import containers
+
+if sys.version_info.major > 2:
+    unicode = str
+    unichr = chr
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tags (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    type INTEGER NOT NULL DEFAULT 0,
+    count INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS metadata (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+def _prefix_end(prefix):
+
+    """Return the smallest string greater than all the strings starting
+    with *prefix*."""
+
+    return prefix[:-1] + unichr(ord(prefix[-1]) + 1)
+
+
+class TagIndex(object):
+
+    """Persistent index of the tags of a board.
+
+    :param path: The path of the database file
+
+    """
+
+    def __init__(self, path):
+
+        self.path = unicode(path)
+        self.__connection = sqlite3.connect(self.path)
+        # NORMAL is only safe from corruption with a write-ahead log, which
+        # also lets the completion index be built while tags are stored
+        self.__connection.execute("PRAGMA journal_mode = WAL")
+        self.__connection.execute("PRAGMA synchronous = NORMAL")
+        self.__connection.executescript(_SCHEMA)
+
+    def __len__(self):
+
+        cursor = self.__connection.execute("SELECT COUNT(*) FROM tags")
+        return cursor.fetchone()[0]
+
+    def __contains__(self, name):
+
+        cursor = self.__connection.execute(
+            "SELECT 1 FROM tags WHERE name = ?", (unicode(name),))
+
+        return cursor.fetchone() is not None
+
+    @property
+    def last_id(self):
+
+        """The highest tag ID reached by the last complete synchronization,
+        or 0 if the index was never synchronized."""
+
+        cursor = self.__connection.execute(
+            "SELECT value FROM metadata WHERE key = 'last_id'")
+        row = cursor.fetchone()
+
+        return int(row[0]) if row is not None else 0
+
+    def set_last_id(self, tag_id):
+
+        """Record that all the tags up to *tag_id* were synchronized."""
+
+        with self.__connection:
+            self.__connection.execute(
+                "INSERT OR REPLACE INTO metadata (key, value) "
+                "VALUES ('last_id', ?)", (unicode(int(tag_id)),))
+
+    def update(self, tags):
+
+        """Add or refresh tags in the index.
+
+        :param tags: A list of :class:`DanbooruTag
+                     <danbooru.api.containers.DanbooruTag>` instances
+        :return: The highest ID among the tags stored, or 0 if none was
+
+        """
+
+        rows = list()
+
+        for tag in tags:
+
+            try:
+                tag_id = int(tag.id)
+            except (TypeError, ValueError):
+                continue
+
+            if tag.name is None:
+                continue
+
+            rows.append((tag_id, tag.name, tag.type_code,
+                         int(tag.count or 0)))
+
+        if not rows:
+            return 0
+
+        with self.__connection:
+            # Replacing also drops a stale row holding the same name
+            self.__connection.executemany(
+                "INSERT OR REPLACE INTO tags (id, name, type, count) "
+                "VALUES (?, ?, ?, ?)", rows)
+
+        return max(row[0] for row in rows)
+
+    def lookup(self, name):
+
+        """Return the tag called *name*, as a :class:`DanbooruTag
+        <danbooru.api.containers.DanbooruTag>`, or :const:`None` if it is not
+        in the index."""
+
+        cursor = self.__connection.execute(
+            "SELECT id, name, type, count FROM tags WHERE name = ?",
+            (unicode(name),))
+        row = cursor.fetchone()
+
+        if row is None:
+            return
+
+        return containers.DanbooruTag(dict(id=row[0], name=row[1],
+                                           type=row[2], count=row[3]))
+
+    def complete(self, prefix, limit=10):
+
+        """Return the names of the tags starting with *prefix*, the most
+        used first.
+
+        :param prefix: The start of the names
+        :param limit: The maximum number of names returned
+
+        """
+
+        prefix = unicode(prefix)
+
+        if not prefix:
+            cursor = self.__connection.execute(
+                "SELECT name FROM tags ORDER BY count DESC LIMIT ?",
+                (limit,))
+        else:
+            # A range on the name index, unlike LIKE
+            cursor = self.__connection.execute(
+                "SELECT name FROM tags WHERE name >= ? AND name < ? "
+                "ORDER BY count DESC LIMIT ?",
+                (prefix, _prefix_end(prefix), limit))
+
+        return [row[0] for row in cursor]
+
+    def names(self):
+
+        """Iterate over the names of all the tags, in alphabetical
+        order."""
+
+        cursor = self.__connection.execute(
+            "SELECT name FROM tags ORDER BY name")
+
+        for row in cursor:
+            yield row[0]
+
+    def entries(self):
+
+        """Iterate over ``(name, count)`` tuples for all the tags, in
+        alphabetical order."""
+
+        cursor = self.__connection.execute(
+            "SELECT name, count FROM tags ORDER BY name")
+
+        for row in cursor:
+            yield row
+
+    def clear(self):
+
+        "Remove all the tags from the index."
+
+        with self.__connection:
+            self.__connection.execute("DELETE FROM tags")
+            self.__connection.execute("DELETE FROM metadata")
+
+    def close(self):
+
+        "Close the database."
+
+        self.__connection.close()
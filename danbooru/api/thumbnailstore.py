@@ -0,0 +1,447 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#   Copyright 2011 Luca Beltrame <einar@heavensinferno.net>
+#
+#   This program is free software; you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License, under
+#   version 2 of the License, or (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details
+#
+#   You should have received a copy of the GNU General Public
+#   License along with this program; if not, write to the
+#   Free Software Foundation, Inc.,
+#   51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+"""This module contains the disk cache of thumbnails.
+
+Thumbnails are stored as they were downloaded (JPEG or PNG data, much
+smaller than decoded images), one after the other in append-only segment
+files of a few MiB. Each record starts with a header holding its key (a
+hash of the board URL and the MD5 hash of the post), the time it was stored
+and its length, so the index (kept in memory) is rebuilt at startup by
+reading the headers only, and a record cut short by a crash is simply
+dropped.
+
+Segments are memory-mapped for reading: a thumbnail is a slice of a map,
+with no file to open. Space is reclaimed by deleting whole segments: the
+oldest ones when the cache grows too large or its entries too old, and,
+from a timer, segments mostly made of replaced entries, once the entries
+still valid have been copied to the newest segment (compaction).
+
+"""
+
+__all__ = ["ThumbnailStore"]
+
+import binascii
+import hashlib
+import mmap
+import os
+import re
+import struct
+import sys
+import time
+
+from collections import OrderedDict
+
+import PyQt4.QtCore as QtCore
+
+if sys.version_info.major > 2:
+    unicode = str
+
+# Default size budget, in bytes
+DEFAULT_MAX_SIZE = 100 * 1024 * 1024
+
+# Default lifetime of the thumbnails, in seconds
+DEFAULT_MAX_AGE = 30 * 24 * 60 * 60
+
+# Size of each segment file, in bytes
+SEGMENT_SIZE = 8 * 1024 * 1024
+
+# Segments with less than this fraction of valid entries are compacted
+COMPACT_RATIO = 0.5
+
+# Interval between maintenance runs (eviction and compaction), in ms
+_MAINTENANCE_INTERVAL = 2000
+
+# Magic, key, time stored, length of the data
+_HEADER = struct.Struct("<2s20sdI")
+_MAGIC = b"DT"
+
+_SEGMENT_NAME = re.compile(r"^segment-(\d+)\.dat$")
+
+
+def _key(board_url, md5):
+
+    """Return the key of the thumbnail of the post with hash *md5* on the
+    board at *board_url*, or :const:`None` if *md5* is not a valid hash."""
+
+    try:
+        digest = binascii.unhexlify(md5)
+    except (TypeError, ValueError, binascii.Error):
+        return
+
+    if len(digest) != 16:
+        return
+
+    board = unicode(board_url or "").encode("utf-8")
+
+    return hashlib.sha1(board).digest()[:4] + digest
+
+
+class _Segment(object):
+
+    """A segment file, and its memory map."""
+
+    def __init__(self, path, number):
+
+        self.path = path
+        self.number = number
+        self.size = os.path.getsize(path) if os.path.exists(path) else 0
+        self.live = 0
+        self.newest = 0
+        self.map = None
+
+    def view(self, end):
+
+        """Return a map of the segment covering at least *end* bytes."""
+
+        if self.map is None or len(self.map) < end:
+            self.close()
+
+            with open(self.path, "rb") as handle:
+                self.map = mmap.mmap(handle.fileno(), 0,
+                                     access=mmap.ACCESS_READ)
+
+        return self.map
+
+    def close(self):
+
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+
+
+class ThumbnailStore(QtCore.QObject):
+
+    """Disk cache of thumbnails, keyed by board and MD5 hash.
+
+    :param directory: The directory where the segments are stored
+    :param max_size: The maximum size of the cache, in bytes
+    :param max_age: How long thumbnails are kept, in seconds
+
+    :attr:`statistics` counts hits, misses, evicted and compacted entries.
+
+    """
+
+    def __init__(self, directory, max_size=DEFAULT_MAX_SIZE,
+                 max_age=DEFAULT_MAX_AGE, parent=None):
+
+        super(ThumbnailStore, self).__init__(parent)
+
+        self.directory = unicode(directory)
+        self.max_size = max_size
+        self.max_age = max_age
+
+        # Key: (segment number, offset of the data, length of the data)
+        self.__index = dict()
+        self.__segments = OrderedDict()
+        self.__writer = None
+        self.__stats = dict(hits=0, misses=0, evictions=0, compacted=0)
+
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+
+        self.__load()
+
+        self.__timer = QtCore.QTimer(self)
+        self.__timer.setInterval(_MAINTENANCE_INTERVAL)
+        self.__timer.timeout.connect(self.__maintain)
+        self.__timer.start()
+
+    def __len__(self):
+
+        return len(self.__index)
+
+    def __contains__(self, key):
+
+        return _key(*key) in self.__index
+
+    @property
+    def size(self):
+
+        "The total size of the segments, in bytes."
+
+        return sum(segment.size for segment in self.__segments.values())
+
+    @property
+    def statistics(self):
+
+        """A dictionary with the number of lookups which found a thumbnail
+        (``hits``) or not (``misses``), of entries evicted (``evictions``)
+        or moved by compaction (``compacted``), and of entries and bytes
+        stored (``count`` and ``size``)."""
+
+        statistics = dict(self.__stats)
+        statistics.update(count=len(self.__index), size=self.size)
+
+        return statistics
+
+    def __path(self, number):
+
+        return os.path.join(self.directory, "segment-%08d.dat" % number)
+
+    def __load(self):
+
+        numbers = list()
+
+        for name in os.listdir(self.directory):
+            match = _SEGMENT_NAME.match(name)
+
+            if match is not None:
+                numbers.append(int(match.group(1)))
+
+        for number in sorted(numbers):
+            segment = _Segment(self.__path(number), number)
+            self.__segments[number] = segment
+            self.__scan(segment)
+
+    def __scan(self, segment):
+
+        """Add the records of *segment* to the index, dropping a record cut
+        short at its end."""
+
+        if not segment.size:
+            return
+
+        view = segment.view(segment.size)
+        offset = 0
+
+        while offset + _HEADER.size <= segment.size:
+
+            magic, key, stored, length = _HEADER.unpack_from(view, offset)
+            end = offset + _HEADER.size + length
+
+            if magic != _MAGIC or end > segment.size:
+                break
+
+            self.__set(key, segment, offset + _HEADER.size, length, stored)
+            offset = end
+
+        if offset < segment.size:
+            segment.close()
+
+            with open(segment.path, "r+b") as handle:
+                handle.truncate(offset)
+
+            segment.size = offset
+
+    def __set(self, key, segment, offset, length, stored):
+
+        self.__discard(key)
+        self.__index[key] = (segment.number, offset, length)
+        segment.live += _HEADER.size + length
+        segment.newest = max(segment.newest, stored)
+
+    def __discard(self, key):
+
+        entry = self.__index.pop(key, None)
+
+        if entry is not None:
+            self.__segments[entry[0]].live -= _HEADER.size + entry[2]
+
+    def __active(self, length):
+
+        """Return the segment to append a record of *length* bytes to,
+        starting a new one if the last is full."""
+
+        if self.__segments:
+            segment = self.__segments[next(reversed(self.__segments))]
+
+            if segment.size + _HEADER.size + length <= SEGMENT_SIZE:
+
+                if self.__writer is None:
+                    self.__writer = open(segment.path, "ab")
+
+                return segment
+
+        if self.__writer is not None:
+            self.__writer.close()
+
+        number = next(reversed(self.__segments), 0) + 1
+        segment = _Segment(self.__path(number), number)
+        self.__segments[number] = segment
+        self.__writer = open(segment.path, "ab")
+
+        return segment
+
+    def __append(self, key, data, stored=None):
+
+        stored = time.time() if stored is None else stored
+        segment = self.__active(len(data))
+
+        self.__writer.write(_HEADER.pack(_MAGIC, key, stored, len(data)))
+        self.__writer.write(data)
+        self.__writer.flush()
+
+        offset = segment.size + _HEADER.size
+        segment.size = offset + len(data)
+        self.__set(key, segment, offset, len(data), stored)
+
+    def __read(self, entry):
+
+        number, offset, length = entry
+        view = self.__segments[number].view(offset + length)
+
+        return view[offset:offset + length]
+
+    def __drop(self, number, evicted=True):
+
+        """Delete the segment *number*, and forget the entries in it."""
+
+        segment = self.__segments.pop(number)
+        segment.close()
+
+        if not self.__segments and self.__writer is not None:
+            self.__writer.close()
+            self.__writer = None
+
+        keys = [key for key, entry in self.__index.items()
+                if entry[0] == number]
+
+        for key in keys:
+            del self.__index[key]
+
+        if evicted:
+            self.__stats["evictions"] += len(keys)
+
+        try:
+            os.remove(segment.path)
+        except OSError:
+            pass
+
+    def __is_active(self, number):
+
+        return number == next(reversed(self.__segments), None)
+
+    def __compact(self):
+
+        """Copy the entries still valid of the emptiest segment to the last
+        one, and delete it.
+
+        :return: :const:`True` if a segment was compacted
+
+        """
+
+        candidates = [segment for segment in self.__segments.values()
+                      if not self.__is_active(segment.number) and
+                      segment.live < segment.size * COMPACT_RATIO]
+
+        if not candidates:
+            return False
+
+        segment = min(candidates,
+                      key=lambda item: item.live / float(item.size or 1))
+
+        # The header is read back to keep the time each entry was stored
+        entries = [(key, entry) for key, entry in self.__index.items()
+                   if entry[0] == segment.number]
+
+        for key, entry in entries:
+
+            view = segment.view(entry[1] + entry[2])
+            stored = _HEADER.unpack_from(view, entry[1] - _HEADER.size)[2]
+            self.__append(key, self.__read(entry), stored)
+
+        self.__stats["compacted"] += len(entries)
+        self.__drop(segment.number, evicted=False)
+
+        return True
+
+    def __maintain(self):
+
+        self.evict()
+        self.__compact()
+
+    def get(self, board_url, md5):
+
+        """Return the data of the thumbnail of the post with hash *md5* on
+        the board at *board_url*, or :const:`None` if it is not cached."""
+
+        entry = self.__index.get(_key(board_url, md5))
+
+        if entry is None:
+            self.__stats["misses"] += 1
+            return
+
+        self.__stats["hits"] += 1
+
+        return self.__read(entry)
+
+    def put(self, board_url, md5, data):
+
+        """Store the data of a thumbnail (as downloaded, not decoded)."""
+
+        key = _key(board_url, md5)
+        data = bytes(data)
+
+        if key is None or not data:
+            return
+
+        if _HEADER.size + len(data) > SEGMENT_SIZE:
+            return
+
+        self.__append(key, data)
+
+    def remove(self, board_url, md5):
+
+        "Remove a thumbnail from the cache."
+
+        self.__discard(_key(board_url, md5))
+
+    def evict(self):
+
+        """Delete the oldest segments while the cache is larger than its
+        size budget, or their entries older than its maximum age."""
+
+        oldest = time.time() - self.max_age
+
+        while self.__segments:
+
+            number, segment = next(iter(self.__segments.items()))
+
+            if self.size <= self.max_size and segment.newest >= oldest:
+                break
+
+            self.__drop(number)
+
+    def set_max_size(self, max_size):
+
+        """Change the size budget, evicting entries if needed."""
+
+        self.max_size = max_size
+        self.evict()
+
+    def clear(self):
+
+        "Remove all the thumbnails from the cache."
+
+        for number in list(self.__segments):
+            self.__drop(number, evicted=False)
+
+    def close(self):
+
+        "Close the segment files."
+
+        self.__timer.stop()
+
+        for segment in self.__segments.values():
+            segment.close()
+
+        if self.__writer is not None:
+            self.__writer.close()
+            self.__writer = None
@@ -31,7 +31,8 @@ def danbooru_request_url(board_url, api_url, parameters=None, username=None,
 
     The processing follows the "normal" way of encoding URLs, minus
     for the plus sign("+") which is kept literal as otherwise it wouldn't be
-    understood by the Danbooru API.
+    understood by the Danbooru API. Parameters are added in sorted order, so
+    that the same request always produces the same URL.
 
     :param board_url: The base URL for generation
     :param api_url: The specific API path
@@ -51,7 +52,7 @@ def danbooru_request_url(board_url, api_url, parameters=None, username=None,
         else:
             iterator = parameters.iteritems()
 
-        for key, value in iterator:
+        for key, value in sorted(iterator):
 
             if key == "tags":
                 # By adding a plus to tags, we already encoded them
@@ -64,3 +65,49 @@ def danbooru_request_url(board_url, api_url, parameters=None, username=None,
         danbooru_url.setPassword(password)
 
     return danbooru_url
+
+
+def request_key(request_url):
+
+    """Create the key used to identify a request in caches.
+
+    The key is the canonical request URL, minus the password. The user
+    name is kept, as answers depend on who is logged in (hidden posts,
+    blacklists, favorites) and must not be shared between accounts.
+
+    :param request_url: A URL created by :func:`danbooru_request_url`
+    :return: A string identifying the request
+
+    """
+
+    key_url = kdecore.KUrl(request_url)
+    key_url.setPassword("")
+
+    return unicode(key_url.url())
+
+
+def validators(http_headers):
+
+    """Extract the cache validators from the headers of an HTTP answer.
+
+    :param http_headers: The headers, one per line, as returned by KIO's
+                         ``HTTP-Headers`` metadata
+    :return: A tuple with the ETag and the Last-Modified values (either can
+             be :const:`None`)
+
+    """
+
+    etag = None
+    last_modified = None
+
+    for line in unicode(http_headers).splitlines():
+
+        name, _, value = line.partition(":")
+        name = name.strip().lower()
+
+        if name == "etag":
+            etag = value.strip()
+        elif name == "last-modified":
+            last_modified = value.strip()
+
+    return etag, last_modified
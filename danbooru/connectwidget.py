@@ -29,6 +29,7 @@ import PyKDE4.kdecore as kdecore
 import PyKDE4.kdeui as kdeui
 
 import api.remote as remote
+import api.federated as federated
 from ui.ui_connectwidget import Ui_connectForm
 
 _SALTS = {"http://yande.re": "choujin-steiner--{}--",
@@ -50,7 +51,8 @@ class ConnectWidget(QtGui.QWidget):
 
     "Widget used in the dialog for a Danbooru connection."
 
-    connectionEstablished = QtCore.pyqtSignal(remote.DanbooruService)
+    # A DanbooruService, or a FederatedService for all the boards
+    connectionEstablished = QtCore.pyqtSignal(QtCore.QObject)
     rejected = QtCore.pyqtSignal()
 
     def __init__(self, urls=None, parent=None):
@@ -152,9 +154,29 @@ class ConnectWidget(QtGui.QWidget):
 
         self._connection = remote.DanbooruService(unicode(url), username,
                                                   password=password)
+
+        if self.federatedCheckBox.isChecked():
+            self._connection = self._federate(self._connection)
+
         self.connectionEstablished.emit(self._connection)
         self.hide()
 
+    def _federate(self, connection):
+
+        """Search all the boards in the list, with *connection* as the
+        primary board. The other boards are used anonymously."""
+
+        services = [connection]
+
+        for index in range(self.danbooruUrlComboBox.count()):
+
+            url = unicode(self.danbooruUrlComboBox.itemText(index))
+
+            if url != connection.url:
+                services.append(remote.DanbooruService(url))
+
+        return federated.FederatedService(services)
+
     def setup_urls(self, urls):
 
         self.danbooruUrlComboBox.clear()
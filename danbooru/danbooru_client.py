@@ -24,14 +24,70 @@ implementation of said API coupled with a graphical user interface."""
 
 import sys
 
+if sys.version_info.major > 2:
+    unicode = str
+
 import sip
 sip.setapi("QString", 1)
 sip.setapi("QVariant", 1)
 
-from PyKDE4.kdecore import KAboutData, ki18n, KCmdLineArgs, KComponentData
+from PyKDE4.kdecore import (KAboutData, ki18n, KCmdLineArgs, KComponentData,
+                             KCmdLineOptions)
 from PyKDE4.kdeui import KApplication
 
+import api.remote as remote
 import mainwindow
+from mirror import Mirror
+
+
+def command_line_options():
+
+    "Options of the headless mirroring mode."
+
+    options = KCmdLineOptions()
+    options.add("mirror <tags>", ki18n("Download all the posts matching "
+                                       "the tags (separated by spaces), "
+                                       "without showing any window"))
+    options.add("dest <directory>", ki18n("Directory to save the posts "
+                                          "to when mirroring"), ".")
+    options.add("board <url>", ki18n("Board to mirror from"),
+                "http://konachan.com")
+    options.add("jobs <number>", ki18n("How many files to download at the "
+                                       "same time when mirroring"), "4")
+    options.add("rating <rating>", ki18n("Highest rating of the posts to "
+                                         "mirror (Safe, Questionable or "
+                                         "Explicit)"), "Safe")
+
+    return options
+
+
+def run_mirror(arguments):
+
+    """Run the headless mirroring mode, returning the exit status."""
+
+    app = KApplication(False)
+
+    rating = unicode(arguments.getOption("rating")).capitalize()
+
+    if rating not in remote.MAX_RATINGS:
+        KCmdLineArgs.usageError(ki18n("Unknown rating: %1").subs(
+            rating).toString())
+
+    try:
+        jobs = int(arguments.getOption("jobs"))
+    except ValueError:
+        KCmdLineArgs.usageError(ki18n("Invalid number of jobs").toString())
+
+    service = remote.DanbooruService(unicode(arguments.getOption("board")))
+    tags = unicode(arguments.getOption("mirror")).split()
+
+    job = Mirror(service, tags, unicode(arguments.getOption("dest")),
+                 jobs=jobs, rating=rating)
+    job.finished.connect(app.quit)
+    job.start()
+    app.exec_()
+
+    return 1 if job.error else 0
 
 
 def main():
@@ -57,6 +113,13 @@ def main():
     component_data.setAboutData(about_data)
 
     KCmdLineArgs.init(sys.argv, about_data)
+    KCmdLineArgs.addCmdLineOptions(command_line_options())
+
+    arguments = KCmdLineArgs.parsedArgs()
+
+    if arguments.isSet("mirror"):
+        sys.exit(run_mirror(arguments))
+
     app = KApplication()
     window = mainwindow.MainWindow()
     window.show()
@@ -26,7 +26,8 @@ if sys.version_info.major > 2:
     unicode = str
 
 from PyQt4.QtCore import QRegExp, pyqtSignal
-from PyQt4.QtGui import QWidget, QRegExpValidator
+from PyQt4.QtGui import (QWidget, QRegExpValidator, QCompleter,
+                         QStringListModel)
 from PyQt4.uic import loadUi
 from PyKDE4.kdeui import KDialog, KIcon
 from PyKDE4.kdecore import i18n
@@ -39,6 +40,9 @@ NAME_MAPPING = {0: "Safe", 1: "Questionable", 2: "Explicit"}
 PATH = os.path.dirname(__file__)
 FETCH_UI = os.path.join(PATH, "ui_src", "fetchwidget.ui")
 
+# Number of completions shown while typing
+MAX_COMPLETIONS = 10
+
 class FetchWidget(QWidget):
 
     dataSent = pyqtSignal(list, unicode, int)
@@ -53,6 +57,9 @@ class FetchWidget(QWidget):
         self.rating = default_rating
         self.limit = limit
 
+        # A CompletionIndex for the tags of the board, set once available
+        self.completion = None
+
         self.postSpinBox.setValue(limit)
         self.closeButton.setIcon(KIcon("dialog-close"))
 
@@ -65,9 +72,66 @@ class FetchWidget(QWidget):
             default_rating = unicode(default_rating)
             self.ratingComboBox.setCurrentIndex(INDICES[self.rating])
 
+        # Only the tag being typed is completed, not the whole text
+        self.__completion_model = QStringListModel(self)
+        self.__completer = QCompleter(self.__completion_model, self)
+        self.__completer.setWidget(self.tagLineEdit)
+        self.__completer.setCompletionMode(
+            QCompleter.UnfilteredPopupCompletion)
+
+        self.tagLineEdit.textEdited.connect(self.update_completions)
+        self.__completer.activated["QString"].connect(self.insert_completion)
+
         self.downloadButton.clicked.connect(self.accept)
         self.closeButton.clicked.connect(self.rejected.emit)
 
+    def __current_tag(self):
+
+        """Return the text before the tag being typed, and the tag itself."""
+
+        text = unicode(self.tagLineEdit.text())
+        head, separator, tag = text.rpartition(",")
+
+        return head + separator, tag.strip()
+
+    def update_completions(self, text):
+
+        """Show the most used tags starting with the one being typed."""
+
+        if self.completion is None:
+            return
+
+        tag = self.__current_tag()[1]
+        # Negated tags are completed too
+        name = tag.lstrip("-").replace(" ", "_").lower()
+
+        names = list()
+
+        if name:
+            names = self.completion.complete(name, MAX_COMPLETIONS)
+
+        if not names:
+            self.__completer.popup().hide()
+            return
+
+        self.__completion_model.setStringList(names)
+        self.__completer.complete()
+
+    def insert_completion(self, name):
+
+        "Replace the tag being typed with the chosen completion."
+
+        head, tag = self.__current_tag()
+        name = unicode(name)
+
+        if tag.startswith("-"):
+            name = "-" + name
+
+        if head:
+            head += " "
+
+        self.tagLineEdit.setText(head + name)
+
     def accept(self):
 
         self.tags = self.tagLineEdit.text()
@@ -28,16 +28,26 @@ from __future__ import division
 import sys
 import os
 
-from PyQt4.QtCore import Qt, QSize, QVariant
+from PyQt4.QtCore import Qt, QSize, QTimer
 from PyQt4.QtGui import (QLabel, QPixmap, QProgressBar, QSizePolicy,
                          QKeySequence, QDockWidget, QWidget, QVBoxLayout,
                          QSpacerItem)
-from PyKDE4.kdecore import KStandardDirs, KUrl, i18n
-from PyKDE4.kdeui import (KXmlGuiWindow, KPixmapCache, KAction,
+from PyKDE4.kdecore import KGlobal, KStandardDirs, KUrl, i18n, i18np
+from PyKDE4.kdeui import (KXmlGuiWindow, KAction,
                           KStandardAction, KIcon, KConfigDialog,
-                          KToggleAction, KDualAction, KStandardShortcut)
-from PyKDE4.kio import KFileDialog, KIO
-
+                          KToggleAction, KDualAction, KStandardShortcut,
+                          KMessageBox)
+from PyKDE4.kio import KFileDialog
+
+from api.cache import ResponseCache, ThumbnailCache
+from api.decoder import shared_decoder
+from api.download import ImageDownload, shared_manager
+from api.federated import FederatedService
+from api.journal import DownloadJournal, QUEUED, RUNNING
+from api.library import Library
+from api.ratelimit import shared_limiter
+from api.thumbnailstore import ThumbnailStore
+from api.tagindex import TagIndex
 import preferences
 import thumbnailarea
 import tagwidget
@@ -55,8 +65,26 @@ class MainWindow(KXmlGuiWindow):
         "Initialize a new main window."
 
         super(MainWindow,  self).__init__(*args)
-        self.cache = KPixmapCache("danbooru")
         self.preferences = preferences.Preferences()
+
+        thumbnail_dir = KStandardDirs.locateLocal("cache",
+                                                  "danbooru/thumbnails/", True)
+        self.cache = ThumbnailStore(thumbnail_dir,
+                                    self.preferences.thumbnail_cache_size,
+                                    parent=self)
+        self.thumbnail_cache = ThumbnailCache(
+            self.preferences.thumbnail_memory)
+        self.decoder = shared_decoder()
+        self.decoder.set_workers(self.preferences.decode_threads)
+
+        cache_dir = KStandardDirs.locateLocal("cache", "danbooru/api/", True)
+        self.response_cache = ResponseCache(cache_dir,
+                                            self.preferences.api_cache_size)
+
+        library_path = KStandardDirs.locateLocal("appdata", "library.sqlite",
+                                                 True)
+        self.library = Library(library_path)
+
         self.api = None
         self.__ratings = None
         self.__step = 0
@@ -78,9 +106,25 @@ class MainWindow(KXmlGuiWindow):
         self.statusbar.addPermanentWidget(self.progress)
         self.progress.hide()
 
+        journal_path = KStandardDirs.locateLocal("appdata",
+                                                 "downloads.sqlite", True)
+        self.downloads = shared_manager()
+        self.downloads.journal = DownloadJournal(journal_path)
+        self.downloads.set_limits(self.preferences.max_downloads,
+                                  self.preferences.max_host_downloads)
+        self.download_label = QLabel()
+        self.statusbar.addPermanentWidget(self.download_label)
+        self.download_label.hide()
+
         self.setup_welcome_widget()
         self.setup_actions()
 
+        shared_limiter().stateChanged.connect(self.report_rate_limit)
+        self.downloads.statusChanged.connect(self.update_download_status)
+
+        # Once the window is shown
+        QTimer.singleShot(0, self.resume_downloads)
+
     def reload_config(self):
 
         """Reload configuration after a change"""
@@ -104,8 +148,46 @@ class MainWindow(KXmlGuiWindow):
         self.url_list = self.preferences.boards_list
         self.max_retrieve = self.preferences.thumbnail_no
 
+        self.response_cache.set_max_size(self.preferences.api_cache_size)
+        self.thumbnail_cache.set_max_size(self.preferences.thumbnail_memory)
+        self.cache.set_max_size(self.preferences.thumbnail_cache_size)
+        self.decoder.set_workers(self.preferences.decode_threads)
+        self.downloads.set_limits(self.preferences.max_downloads,
+                                  self.preferences.max_host_downloads)
+
+        if self.api is not None:
+            self.setup_api_preferences()
 
+    def setup_api_preferences(self):
 
+        """Apply the performance-related settings to the API."""
+
+        self.api.prefetch_depth = self.preferences.prefetch_depth
+        self.api.prefetch_thumbnails = self.preferences.prefetch_thumbnails
+        self.api.response_cache = self.response_cache
+        self.api.thumbnail_cache = self.thumbnail_cache
+
+    def setup_tag_index(self):
+
+        """Open the local tag index of the connected board, and retrieve the
+        tags added since the last time."""
+
+        host = unicode(KUrl(self.api.url).host())
+        index_path = KStandardDirs.locateLocal("appdata",
+                                               "tags/%s.sqlite" % host, True)
+
+        self.api.tag_index = TagIndex(index_path)
+        self.api.completionUpdated.connect(self.update_completion)
+        self.api.sync_tags()
+        self.update_completion()
+
+    def update_completion(self):
+
+        """Let the fetch widget complete the tags of the connected
+        board."""
+
+        if self.thumbnailarea is not None:
+            self.thumbnailarea.fetchwidget.completion = self.api.completion
 
     def setup_welcome_widget(self):
 
@@ -149,6 +231,10 @@ class MainWindow(KXmlGuiWindow):
             i18n("Fetch thumbnails from a Danbooru board")
         )
         self.batch_download_action.setToolTip(i18n("Batch download images"))
+        self.pause_downloads_action.setToolTip(
+            i18n("Pause or resume the image downloads"))
+        self.cancel_downloads_action.setToolTip(
+            i18n("Cancel all the image downloads"))
 
     def create_actions(self):
 
@@ -170,6 +256,12 @@ class MainWindow(KXmlGuiWindow):
                                               self)
         self.tag_display_action.setIconForStates(KIcon("image-x-generic"))
         self.tag_display_action.setEnabled(False)
+        self.pause_downloads_action = KToggleAction(
+            KIcon("media-playback-pause"), i18n("Pause downloads"), self)
+        self.cancel_downloads_action = KAction(KIcon("process-stop"),
+                                               i18n("Cancel downloads"), self)
+        self.pause_downloads_action.setEnabled(False)
+        self.cancel_downloads_action.setEnabled(False)
 
         # Shortcuts
         connect_default = KAction.ShortcutTypes(KAction.DefaultShortcut)
@@ -195,6 +287,10 @@ class MainWindow(KXmlGuiWindow):
         action_collection.addAction("batchDownload", self.batch_download_action)
         action_collection.addAction("poolDownload", self.pool_toggle_action)
         action_collection.addAction("tagDisplay", self.tag_display_action)
+        action_collection.addAction("pauseDownloads",
+                                    self.pause_downloads_action)
+        action_collection.addAction("cancelDownloads",
+                                    self.cancel_downloads_action)
 
         KStandardAction.quit (self.close, action_collection)
         KStandardAction.preferences(self.show_preferences,
@@ -219,6 +315,8 @@ class MainWindow(KXmlGuiWindow):
         self.batch_download_action.triggered.connect(self.batch_download)
         self.pool_toggle_action.toggled.connect(self.pool_toggle)
         self.tag_display_action.activeChanged.connect(self.tag_display)
+        self.pause_downloads_action.toggled.connect(self.pause_downloads)
+        self.cancel_downloads_action.triggered.connect(self.cancel_downloads)
 
         window_options = self.StandardWindowOption(self.ToolBar| self.Keys |
                                                    self.Create | self.Save |
@@ -256,7 +354,7 @@ class MainWindow(KXmlGuiWindow):
 
         self.api.postRetrieved.connect(self.update_progress)
         self.api.postDownloadFinished.connect(self.download_finished)
-        self.api.tagRetrieved.connect(self.tag_dock.widget().add_tags)
+        self.api.tagListRetrieved.connect(self.tag_dock.widget().add_tags)
         self.tag_dock.widget().itemDoubleClicked.connect(
             self.fetch_tagged_items)
 
@@ -288,6 +386,9 @@ class MainWindow(KXmlGuiWindow):
 
     def handle_connection(self, connection):
 
+        if self.api is not None and self.api.tag_index is not None:
+            self.api.tag_index.close()
+
         self.api = None
         self.api = connection
         self.api.cache = self.cache
@@ -311,6 +412,8 @@ class MainWindow(KXmlGuiWindow):
             self.setup_area()
 
         self.api.cache = self.cache
+        self.setup_api_preferences()
+        self.setup_tag_index()
 
         self.statusBar().showMessage(i18n("Connected to %s" % self.api.url),
                                      3000)
@@ -367,6 +470,12 @@ class MainWindow(KXmlGuiWindow):
 
         self.thumbnailarea.post_limit = limit
         blacklist= list(self.preferences.tag_blacklist)
+
+        unknown_tags = self.api.unknown_tags(tags)
+
+        if unknown_tags:
+            self.statusBar().showMessage(i18n("Unknown tags: %1",
+                                              ", ".join(unknown_tags)), 5000)
         self.api.get_post_list(tags=tags, limit=limit,
                                rating=max_rating,
                                blacklist=blacklist)
@@ -439,10 +548,12 @@ class MainWindow(KXmlGuiWindow):
         if directory.isEmpty():
             return
 
-        for item in selected_items:
+        owned = 0
 
-            file_url = item.url_label.url()
-            tags = item.data.tags
+        for post in selected_items:
+
+            file_url = post.file_url
+            tags = list(post.tags)
 
             # Make a local copy to append paths as addPath works in-place
             destination = KUrl(directory)
@@ -450,16 +561,40 @@ class MainWindow(KXmlGuiWindow):
             file_name = KUrl(file_url).fileName()
             destination.addPath(file_name)
 
-            job = KIO.file_copy(KUrl(file_url), destination, -1)
-            job.setProperty("tags", QVariant(tags))
-            job.result.connect(self.batch_download_slot)
+            # Images already downloaded are linked or copied locally
+            if destination.isLocalFile() and post.md5 in self.library:
+                path = unicode(destination.toLocalFile())
+
+                if self.library.copy_to(post.md5, path):
+                    owned += 1
+                    continue
+
+            # Spread over time by the rate limiter of the board the post
+            # comes from, which differs when searching several boards
+            download = ImageDownload(KUrl(file_url), destination,
+                                     md5=post.md5,
+                                     board_url=post.board or self.api.url,
+                                     limiter=shared_limiter(), parent=self,
+                                     size=post.file_size)
+            download.tags = tags
+            download.post_id = post.id
+            download.finished.connect(self.batch_download_slot)
+
+            # Only a few at a time, the others wait in the queue
+            self.downloads.submit(download)
+
+        if owned:
+            self.statusBar().showMessage(
+                i18np("1 image was already downloaded",
+                      "%1 images were already downloaded", owned), 5000)
 
     def setup_area(self):
 
         "Set up the central widget to display thumbnails."
 
         self.thumbnailarea = thumbnailarea.DanbooruTabWidget(self.api,
-            self.preferences, self.preferences.thumbnail_no, self)
+            self.preferences, self.preferences.thumbnail_no, self,
+            library=self.library)
 
         self.setCentralWidget(self.thumbnailarea)
 
@@ -502,6 +637,124 @@ class MainWindow(KXmlGuiWindow):
         self.__step = 0
         self.progress.hide()
 
+        if isinstance(self.api, FederatedService) and self.api.latencies:
+            self.report_latencies()
+
+    def report_rate_limit(self, host, static):
+
+        "Show when a board slows down the requests made to it."
+
+        state = shared_limiter().state(host, static)
+
+        if not state["blocked"]:
+            return
+
+        message = i18n("%1 is overloaded: waiting %2 s, then sending %3 "
+                       "requests per second", host,
+                       "%.0f" % state["blocked"], "%.1f" % state["rate"])
+        self.statusBar().showMessage(message, 5000)
+
+    def pause_downloads(self, paused):
+
+        "Pause or resume the image downloads."
+
+        if paused:
+            self.downloads.pause()
+        else:
+            self.downloads.resume()
+
+    def resume_downloads(self):
+
+        """Offer to start again the downloads which were interrupted the
+        last time the client was running."""
+
+        journal = self.downloads.journal
+        entries = journal.pending()
+        journal.clear()
+
+        if not entries:
+            return
+
+        text = i18np("A download was interrupted the last time the client "
+                     "was running. Do you want to resume it?",
+                     "%1 downloads were interrupted the last time the client "
+                     "was running. Do you want to resume them?", len(entries))
+        answer = KMessageBox.questionYesNo(self, text,
+                                           i18n("Resume downloads"))
+
+        if answer != KMessageBox.Yes:
+            journal.clear(states=(QUEUED, RUNNING))
+            return
+
+        for entry in entries:
+
+            download = ImageDownload(KUrl(entry["url"]),
+                                     KUrl(entry["destination"]),
+                                     md5=entry["md5"],
+                                     board_url=entry["board"],
+                                     limiter=shared_limiter(), parent=self,
+                                     size=entry["size"])
+            download.tags = entry["tags"]
+            download.post_id = entry["post_id"]
+            download.journal_id = entry["id"]
+            download.finished.connect(self.batch_download_slot)
+
+            self.downloads.submit(download, entry["priority"])
+
+    def cancel_downloads(self):
+
+        "Cancel all the image downloads."
+
+        self.downloads.cancel()
+
+        # New downloads must not wait for a resume
+        self.pause_downloads_action.setChecked(False)
+
+    def update_download_status(self):
+
+        "Show the progress of the image downloads in the status bar."
+
+        status = self.downloads.status()
+        active = bool(status["queued"] or status["running"])
+
+        self.pause_downloads_action.setEnabled(active)
+        self.cancel_downloads_action.setEnabled(active)
+
+        if not active:
+            self.download_label.hide()
+            return
+
+        locale = KGlobal.locale()
+        total = (status["finished"] + status["failed"] + status["queued"] +
+                 status["running"])
+
+        if status["paused"]:
+            text = i18n("Downloads paused: %1 of %2 images",
+                        status["finished"], total)
+        else:
+            text = i18n("Downloading: %1 of %2 images, %3/s",
+                        status["finished"], total,
+                        locale.formatByteSize(status["speed"]))
+
+            if status["eta"] is not None:
+                remaining = locale.prettyFormatDuration(
+                    int(status["eta"] * 1000))
+                text = i18n("%1 (%2 left)", text, remaining)
+
+        self.download_label.setText(text)
+        self.download_label.show()
+
+    def report_latencies(self):
+
+        "Show how long each board took to answer the last search."
+
+        latencies = sorted(self.api.latencies.items(),
+                           key=lambda item: item[1])
+        times = ", ".join("%s %.1f s" % (KUrl(url).host(), seconds)
+                          for url, seconds in latencies)
+
+        self.statusBar().showMessage(i18n("Search times: %1", times), 10000)
+
     def update_progress(self):
 
         "Update the progress bar."
@@ -529,10 +782,12 @@ class MainWindow(KXmlGuiWindow):
 
         "Purge the thumbnail cache."
 
-        self.cache.discard()
+        self.cache.clear()
+        self.response_cache.clear()
+        self.thumbnail_cache.clear()
         self.statusBar().showMessage(i18n("Thumbnail cache cleared."))
 
-    def batch_download_slot(self, job):
+    def batch_download_slot(self, download):
 
         """Slot called when doing batch download, for each file retrieved.
 
@@ -541,13 +796,37 @@ class MainWindow(KXmlGuiWindow):
 
         """
 
-        if job.error():
-            job.ui().showErrorMessage()
+        download.deleteLater()
+
+        if download.cancelled:
+            return
+
+        if download.error is not None:
+            KMessageBox.error(self, download.error)
         else:
+            if download.path is not None:
+                self.library.add(download.md5, download.path,
+                                 board_url=download.board_url,
+                                 post_id=download.post_id)
+
             if self.preferences.nepomuk_enabled:
-                tags = job.property("tags").toPyObject()
-                #danbooru2nepomuk.tag_danbooru_item(job.destUrl().path(),
-                #                                   tags)
+                tags = download.tags
+                #danbooru2nepomuk.tag_danbooru_item(
+                #    download.destination.path(), tags)
+
+    def queryClose(self):
+
+        """Write the pending changes to disk and close the databases before
+        closing. Running downloads are stopped, keeping their partial files,
+        so that they are resumed at the next start."""
+
+        self.downloads.pause()
+        self.downloads.journal.close()
+        self.library.close()
+        self.cache.close()
+        self.response_cache.close()
+
+        return True
 
     def tag_display(self, state):
 
@@ -0,0 +1,299 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#   Copyright 2011 Luca Beltrame <einar@heavensinferno.net>
+#
+#   This program is free software; you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License, under
+#   version 2 of the License, or (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details
+#
+#   You should have received a copy of the GNU General Public
+#   License along with this program; if not, write to the
+#   Free Software Foundation, Inc.,
+#   51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+"""Headless mirroring of all the posts matching a search.
+
+The pages of the search are retrieved one after the other, and the original
+images are downloaded into a directory, a few at a time (see
+:class:`ImageDownload <danbooru.api.download.ImageDownload>`): files already
+in the directory are never downloaded again, and partial ones are resumed.
+
+The last page whose images are all on disk is recorded in a checkpoint file
+in the directory, so that an interrupted run starts again from there rather
+than from the first page.
+
+"""
+
+import collections
+import json
+import os
+import sys
+
+import PyQt4.QtCore as QtCore
+import PyKDE4.kdecore as kdecore
+
+from api import ratelimit
+from api.download import ImageDownload, PART_SUFFIX
+
+if sys.version_info.major > 2:
+    unicode = str
+
+CHECKPOINT_NAME = ".danbooru-mirror.json"
+
+# Posts per page (the maximum allowed by the API)
+PAGE_SIZE = 100
+
+# No new page is retrieved while this many downloads are waiting
+MAX_QUEUED = 2 * PAGE_SIZE
+
+
+def _report(message):
+
+    sys.stdout.write(message + "\n")
+    sys.stdout.flush()
+
+
+class Mirror(QtCore.QObject):
+
+    """Download the images of all the posts matching a search.
+
+    :param service: The :class:`DanbooruService
+                    <danbooru.api.remote.DanbooruService>` of the board
+    :param tags: The tags of the search
+    :param destination: The directory the images are saved to
+    :param jobs: How many images are downloaded at the same time
+    :param rating: The maximum rating of the posts
+    :param blacklist: A list of blacklist entries excluding posts
+
+    :attr:`finished` is emitted with the number of images downloaded once
+    done; :attr:`error` holds the reason if the run stopped early.
+
+    """
+
+    finished = QtCore.pyqtSignal(int)
+
+    def __init__(self, service, tags, destination, jobs=4,
+                 rating="Explicit", blacklist=None, parent=None):
+
+        super(Mirror, self).__init__(parent)
+
+        self.service = service
+        self.tags = [unicode(tag) for tag in tags if tag]
+        self.destination = unicode(destination)
+        self.jobs = max(int(jobs), 1)
+        self.rating = rating
+        self.blacklist = blacklist
+        self.error = None
+
+        self.downloaded = 0
+        self.skipped = 0
+        self.failed = 0
+
+        self.__queue = collections.deque()
+        self.__running = dict()
+        self.__outstanding = dict()
+        self.__page = None
+        self.__page_posts = 0
+        self.__discarded = 0
+        self.__listing = False
+        self.__last_page = False
+        self.__next_page_waiting = False
+        self.__checkpoint = os.path.join(self.destination, CHECKPOINT_NAME)
+
+        # Only the posts are needed, not their thumbnails. Pages are not
+        # retrieved in advance, as their filtered posts would not be counted
+        service.thumbnails = False
+        service.prefetch_depth = 0
+
+        service.postRetrieved.connect(self.__slot_post_retrieved)
+        service.postDownloadFinished.connect(self.__slot_page_finished)
+        service.downloadError.connect(self.__slot_download_error)
+
+    def __load_checkpoint(self):
+
+        """Return the page to start from: the one recorded in the checkpoint
+        for the same search, or the first one."""
+
+        try:
+            with open(self.__checkpoint) as handle:
+                checkpoint = json.load(handle)
+        except (IOError, OSError, ValueError):
+            return 1
+
+        if (checkpoint.get("board") != self.service.url or
+            checkpoint.get("tags") != self.tags):
+            return 1
+
+        return max(int(checkpoint.get("page", 1)), 1)
+
+    def __save_checkpoint(self, page):
+
+        checkpoint = dict(board=self.service.url, tags=self.tags, page=page)
+        temporary = self.__checkpoint + PART_SUFFIX
+
+        with open(temporary, "w") as handle:
+            json.dump(checkpoint, handle)
+
+        # Replaced at once, so that it is never left half written
+        os.rename(temporary, self.__checkpoint)
+
+    def __path(self, post):
+
+        name = unicode(kdecore.KUrl(post.file_url).fileName())
+        return os.path.join(self.destination, name)
+
+    def __request_page(self, page):
+
+        self.__page = page
+        self.__page_posts = 0
+        self.__discarded = self.service.request_statistics["discarded"]
+        self.__listing = True
+        self.__next_page_waiting = False
+        self.__outstanding[page] = 0
+
+        self.service.get_post_list(page=page, tags=self.tags,
+                                   limit=PAGE_SIZE, rating=self.rating,
+                                   blacklist=self.blacklist)
+
+    def __complete_pages(self):
+
+        """Advance the checkpoint past the pages whose images are all on
+        disk."""
+
+        completed = None
+
+        for page in sorted(self.__outstanding):
+
+            if self.__outstanding[page] or (page == self.__page and
+                                            self.__listing):
+                break
+
+            del self.__outstanding[page]
+            completed = page
+
+        if completed is not None:
+            self.__save_checkpoint(completed + 1)
+
+    def __check_finished(self):
+
+        if (not self.__last_page or self.__listing or self.__queue or
+            self.__running):
+            return
+
+        # Nothing left: the next run checks the first page again
+        if os.path.exists(self.__checkpoint):
+            os.remove(self.__checkpoint)
+
+        _report("Done: %d downloaded, %d already present, %d failed" %
+                (self.downloaded, self.skipped, self.failed))
+        self.finished.emit(self.downloaded)
+
+    def __stop(self, error):
+
+        self.error = error
+        _report("Stopped: %s" % error)
+        self.finished.emit(self.downloaded)
+
+    def __dispatch(self):
+
+        """Start queued downloads, up to :attr:`jobs` at the same time."""
+
+        while self.__queue and len(self.__running) < self.jobs:
+
+            post, page = self.__queue.popleft()
+            destination = kdecore.KUrl(self.__path(post))
+
+            download = ImageDownload(post.file_url, destination,
+                                     md5=post.md5,
+                                     board_url=self.service.url,
+                                     limiter=ratelimit.shared_limiter(),
+                                     parent=self)
+            self.__running[download] = page
+            download.finished.connect(self.__slot_file_finished)
+            download.start()
+
+        if self.__next_page_waiting and len(self.__queue) < MAX_QUEUED:
+            self.__request_page(self.__page + 1)
+
+    def __slot_post_retrieved(self, post):
+
+        self.__page_posts += 1
+
+        if post.file_url is None:
+            return
+
+        if os.path.exists(self.__path(post)):
+            self.skipped += 1
+            return
+
+        self.__outstanding[self.__page] += 1
+        self.__queue.append((post, self.__page))
+        self.__dispatch()
+
+    def __slot_page_finished(self):
+
+        self.__listing = False
+        _report("Page %d: %d posts" % (self.__page, self.__page_posts))
+
+        # Posts filtered out do not mean that the search is over
+        discarded = (self.service.request_statistics["discarded"] -
+                     self.__discarded)
+
+        if self.__page_posts + discarded == 0:
+            self.__last_page = True
+        elif len(self.__queue) < MAX_QUEUED:
+            self.__request_page(self.__page + 1)
+        else:
+            self.__next_page_waiting = True
+
+        self.__complete_pages()
+        self.__check_finished()
+
+    def __slot_download_error(self, message):
+
+        # Pages are already retried by the service
+        if self.__listing:
+            self.__listing = False
+            self.__stop(unicode(message))
+
+    def __slot_file_finished(self, download):
+
+        page = self.__running.pop(download, None)
+
+        if page is None:
+            return
+
+        download.deleteLater()
+        name = os.path.basename(download.path)
+
+        if download.error is None:
+            self.downloaded += 1
+            _report(name)
+        else:
+            self.failed += 1
+            _report("Failed: %s (%s)" % (name, download.error))
+
+        self.__outstanding[page] -= 1
+        self.__complete_pages()
+        self.__dispatch()
+        self.__check_finished()
+
+    def start(self):
+
+        "Start mirroring, from the checkpoint if there is one."
+
+        if not os.path.isdir(self.destination):
+            os.makedirs(self.destination)
+
+        page = self.__load_checkpoint()
+
+        if page > 1:
+            _report("Resuming from page %d" % page)
+
+        self.__request_page(page)
@@ -40,12 +40,14 @@ from PyKDE4.kdecore import i18n
 from ui.ui_generalpage import Ui_GeneralPage
 from ui.ui_nepomukpage import Ui_NepomukPage
 from ui.ui_danboorupage import Ui_DanbooruPage
+from ui.ui_performancepage import Ui_PerformancePage
 
 PATH = os.path.dirname(__file__)
 
 GENERAL_UI = os.path.join(PATH, "ui_src", "generalpage.ui")
 NEPOMUK_UI = os.path.join(PATH, "ui_src", "nepomukpage.ui")
 DANBOORU_UI = os.path.join(PATH, "ui_src", "danboorupage.ui")
+PERFORMANCE_UI = os.path.join(PATH, "ui_src", "performancepage.ui")
 
 
 class Preferences(KConfigSkeleton):
@@ -56,6 +58,17 @@ class Preferences(KConfigSkeleton):
         - nepomukEnabled - whether to use Nepomuk tagging or not
         - tagBlacklist - tags that should not be used while tagging
         - columnNumber - number of columns to display
+        - continuousScrolling - whether pages are shown one after the other
+        - prefetchDepth - number of result pages to retrieve in advance
+        - prefetchThumbnails - whether to retrieve thumbnails in advance
+        - apiCacheSize - size of the API answer cache, in MiB
+        - maxDownloads - number of images downloaded at the same time
+        - maxHostDownloads - same, from a single host
+        - thumbnailMemory - memory used by decoded thumbnails, in MiB
+        - thumbnailCacheSize - size of the thumbnail cache on disk, in MiB
+        - decodeThreads - number of threads decoding thumbnails
+        - unloadPagesDelay - minutes before hidden pages are unloaded
+        - hiddenPagesMemory - memory used by hidden pages, in MiB
 
         Currently usernames and passwords are not saved at all."""
 
@@ -95,12 +108,30 @@ class Preferences(KConfigSkeleton):
                                                      self._tag_blacklist_values,
                                                      predefined_blacklist)
         self._column_number = self.addItemInt("displayColumns", 3, 3)
+        self._continuous_scrolling = self.addItemBool("continuousScrolling",
+                                                      False, False)
 
         self._max_rating_value = 0
         self._max_rating = self.addItemInt("maxAllowedRating",
                                               self._max_rating_value,
                                               0)
 
+        self.setCurrentGroup("Performance")
+
+        self._prefetch_depth = self.addItemInt("prefetchDepth", 1, 1)
+        self._prefetch_thumbnails = self.addItemBool("prefetchThumbnails",
+                                                     True, True)
+        self._api_cache_size = self.addItemInt("apiCacheSize", 20, 20)
+        self._max_downloads = self.addItemInt("maxDownloads", 5, 5)
+        self._max_host_downloads = self.addItemInt("maxHostDownloads", 2, 2)
+        self._thumbnail_memory = self.addItemInt("thumbnailMemory", 64, 64)
+        self._thumbnail_cache_size = self.addItemInt("thumbnailCacheSize",
+                                                     100, 100)
+        self._decode_threads = self.addItemInt("decodeThreads", 2, 2)
+        self._unload_pages_delay = self.addItemInt("unloadPagesDelay", 5, 5)
+        self._hidden_pages_memory = self.addItemInt("hiddenPagesMemory", 32,
+                                                    32)
+
         self.readConfig()
 
     @property
@@ -124,6 +155,14 @@ class Preferences(KConfigSkeleton):
 
         return self._column_number.value()
 
+    @property
+    def continuous_scrolling(self):
+
+        """Whether the pages of results are shown one after the other in a
+        single view, rather than one per tab."""
+
+        return self._continuous_scrolling.value()
+
     @property
     def nepomuk_enabled(self):
 
@@ -152,6 +191,77 @@ class Preferences(KConfigSkeleton):
 
         return self._max_rating.value()
 
+    @property
+    def prefetch_depth(self):
+
+        "Number of result pages to retrieve in advance."
+
+        return self._prefetch_depth.value()
+
+    @property
+    def prefetch_thumbnails(self):
+
+        "Whether thumbnails of pages retrieved in advance are downloaded."
+
+        return self._prefetch_thumbnails.value()
+
+    @property
+    def api_cache_size(self):
+
+        "Size of the API answer cache, in bytes."
+
+        return self._api_cache_size.value() * 1024 * 1024
+
+    @property
+    def max_downloads(self):
+
+        "Number of images downloaded at the same time."
+
+        return self._max_downloads.value()
+
+    @property
+    def max_host_downloads(self):
+
+        "Number of images downloaded at the same time from a single host."
+
+        return self._max_host_downloads.value()
+
+    @property
+    def thumbnail_memory(self):
+
+        "Memory used by the decoded thumbnails, in bytes."
+
+        return self._thumbnail_memory.value() * 1024 * 1024
+
+    @property
+    def thumbnail_cache_size(self):
+
+        "Size of the thumbnail cache on disk, in bytes."
+
+        return self._thumbnail_cache_size.value() * 1024 * 1024
+
+    @property
+    def decode_threads(self):
+
+        "Number of threads decoding thumbnails."
+
+        return self._decode_threads.value()
+
+    @property
+    def unload_pages_delay(self):
+
+        """Time after which hidden pages are unloaded, in seconds, or 0 if
+        they are unloaded only to save memory."""
+
+        return self._unload_pages_delay.value() * 60
+
+    @property
+    def hidden_pages_memory(self):
+
+        "Memory used by the thumbnails of hidden pages, in bytes."
+
+        return self._hidden_pages_memory.value() * 1024 * 1024
+
 
 class PreferencesDialog(KConfigDialog):
 
@@ -179,10 +289,16 @@ class PreferencesDialog(KConfigDialog):
         self.nepomuk_page_item = self.addPage(self.nepomuk_page,
                                               i18n("Tagging"))
 
+        self.performance_page = PerformancePage(self, preferences)
+        self.performance_page_item = self.addPage(self.performance_page,
+                                                  i18n("Performance"))
+
         self.general_page_item.setIcon(KIcon("table"))
         self.danbooru_page_item.setIcon(
             KIcon("preferences-web-browser-shortcuts"))
         self.nepomuk_page_item.setIcon(KIcon("nepomuk"))
+        self.performance_page_item.setIcon(
+            KIcon("preferences-system-performance"))
 
 
 class GeneralPage(QWidget, Ui_GeneralPage):
@@ -198,6 +314,8 @@ class GeneralPage(QWidget, Ui_GeneralPage):
 
         self.kcfg_thumbnailMaxRetrieve.setValue(preferences.thumbnail_no)
         self.kcfg_displayColumns.setValue(preferences.column_no)
+        self.kcfg_continuousScrolling.setChecked(
+            preferences.continuous_scrolling)
         self.kcfg_maxAllowedRating.setCurrentIndex(preferences.rating_index)
 
 
@@ -234,3 +352,31 @@ class DanbooruPage(QWidget, Ui_DanbooruPage):
 
         self._validator = QRegExpValidator(regex, self)
         self.kcfg_danbooruUrls.lineEdit().setValidator(self._validator)
+
+
+class PerformancePage(QWidget, Ui_PerformancePage):
+
+    "Page containing network and caching options"
+
+    def __init__(self, parent=None, preferences=None):
+
+        super(PerformancePage, self).__init__(parent)
+        #loadUi(PERFORMANCE_UI, self)
+        self.setupUi(self)
+
+        self.kcfg_prefetchDepth.setValue(preferences.prefetch_depth)
+        self.kcfg_prefetchThumbnails.setChecked(
+            preferences.prefetch_thumbnails)
+        self.kcfg_apiCacheSize.setValue(
+            preferences.api_cache_size // (1024 * 1024))
+        self.kcfg_maxDownloads.setValue(preferences.max_downloads)
+        self.kcfg_maxHostDownloads.setValue(preferences.max_host_downloads)
+        self.kcfg_thumbnailMemory.setValue(
+            preferences.thumbnail_memory // (1024 * 1024))
+        self.kcfg_thumbnailCacheSize.setValue(
+            preferences.thumbnail_cache_size // (1024 * 1024))
+        self.kcfg_decodeThreads.setValue(preferences.decode_threads)
+        self.kcfg_unloadPagesDelay.setValue(
+            preferences.unload_pages_delay // 60)
+        self.kcfg_hiddenPagesMemory.setValue(
+            preferences.hidden_pages_memory // (1024 * 1024))
@@ -33,7 +33,18 @@ class DanbooruTagWidget(QtGui.QListWidget):
         self.tag_list = list()
         self.blacklist = blacklist
 
-    def add_tags(self, tag):
+    def add_tags(self, tags):
+
+        """Add a list of tags to the widget, in a single pass."""
+
+        self.setUpdatesEnabled(False)
+
+        for tag in tags:
+            self.add_tag(tag)
+
+        self.setUpdatesEnabled(True)
+
+    def add_tag(self, tag):
 
         tag_type = tag.type
         tag_name = tag.name
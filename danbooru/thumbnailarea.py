@@ -26,8 +26,9 @@ ThumbnailViews using a tabbed interface.
 
 from functools import partial
 import os
+import time
 
-from PyQt4.QtCore import Qt
+from PyQt4.QtCore import Qt, QTimer
 from PyQt4.QtGui import QWidget, QLabel
 from PyQt4.uic import loadUi
 from PyKDE4.kdecore import i18n
@@ -41,6 +42,9 @@ from connectwidget import ConnectWidget
 PATH = os.path.dirname(__file__)
 WIDGET_UI = os.path.join(PATH, "ui_src", "thumbnailarea.ui")
 
+# Interval between checks for pages to unload, in ms
+_UNLOAD_INTERVAL = 30000
+
 class DanbooruTabWidget(QWidget):
 
     """Class that provides an area where individual ThumbnailViews (from
@@ -48,25 +52,45 @@ class DanbooruTabWidget(QWidget):
     an internal list for each page added, to avoid garbage collection issues.
     Methods to create tabs are not called directly, but are instead slots called
     upon by signal.
+
+    Pages which are not shown are unloaded (see
+    :meth:`DanbooruPostView.unload <thumbnailview.DanbooruPostView.unload>`)
+    once they have been hidden for longer than the preferences allow, or
+    when their thumbnails use more memory than allowed, least recently
+    shown first. They are loaded again when shown.
+
+    If continuous scrolling is enabled in the preferences, a single page
+    holds all the results: the next page of results is asked for as the end
+    of the view comes near, rather than with the "next page" button.
     """
 
     def __init__(self, api_data=None, preferences=None, post_limit=None,
-                 parent=None):
+                 parent=None, library=None):
 
         """Initialize a new ThumbnailArea. api_data is a reference to a
         Danbooru object, while preferences is a reference to a
-        KConfigXT instance."""
+        KConfigXT instance. library is the Library of the images already
+        downloaded, if any."""
 
         super(DanbooruTabWidget, self).__init__(parent)
         loadUi(WIDGET_UI, self)
 
         self.preferences = preferences
         self.api_data = api_data
+        self.library = library
         self.__pages = list()
+        self.__hidden_since = dict()
+        self.__shown = None
         self.__firstpage = True
         self.__current_index = 0
+        self.__continuous = preferences.continuous_scrolling
         self.post_limit = post_limit
 
+        self.__unload_timer = QTimer(self)
+        self.__unload_timer.setInterval(_UNLOAD_INTERVAL)
+        self.__unload_timer.timeout.connect(self.unload_pages)
+        self.__unload_timer.start()
+
         # Generate and set the two widgets
 
         self.fetchwidget = FetchWidget(
@@ -100,6 +124,7 @@ class DanbooruTabWidget(QWidget):
 
         KAcceleratorManager.setNoAccel(self.thumbnailTabWidget)
         self.nextPageButton.setDisabled(True)
+        self.nextPageButton.setVisible(not self.__continuous)
 
         button_toggle = partial(self.nextPageButton.setDisabled, False)
 
@@ -107,6 +132,7 @@ class DanbooruTabWidget(QWidget):
         self.api_data.postDownloadFinished.connect(self.__check)
         self.nextPageButton.clicked.connect(self.update_search_results)
         self.api_data.downloadError.connect(self.display_error)
+        self.thumbnailTabWidget.currentChanged.connect(self.__page_changed)
 
         self.new_page()
 
@@ -139,6 +165,59 @@ class DanbooruTabWidget(QWidget):
             self.nextPageButton.setDisabled(False)
             self.setUpdatesEnabled(True)
 
+    def __page_changed(self, index):
+
+        """Give priority to the thumbnails of the page being shown, loading
+        it again if it was unloaded."""
+
+        widget = self.thumbnailTabWidget.widget(index)
+
+        if self.__shown is not None:
+            self.__hidden_since[self.__shown] = time.time()
+
+        if widget not in self.__pages:
+            self.__shown = None
+            return
+
+        self.__shown = widget
+        self.__hidden_since.pop(widget, None)
+
+        if widget.unloaded:
+            widget.reload()
+
+        widget.activate()
+
+    def unload_pages(self):
+
+        """Unload the pages hidden for longer than the delay set in the
+        preferences, then the least recently shown ones until the memory
+        used by the hidden pages fits the preferences."""
+
+        delay = self.preferences.unload_pages_delay
+        now = time.time()
+
+        # Least recently shown first
+        hidden = sorted((since, self.__pages.index(view), view)
+                        for view, since in self.__hidden_since.items()
+                        if not view.unloaded and view.finished)
+
+        if delay > 0:
+            for since, _, view in hidden:
+                if now - since >= delay:
+                    view.unload()
+
+        hidden = [view for _, _, view in hidden if not view.unloaded]
+        sizes = [view.memory_size() for view in hidden]
+        total = sum(sizes)
+
+        for view, size in zip(hidden, sizes):
+
+            if total <= self.preferences.hidden_pages_memory:
+                break
+
+            view.unload()
+            total -= size
+
     def new_page(self):
 
         "Slot used to create a new page."
@@ -157,9 +236,18 @@ class DanbooruTabWidget(QWidget):
 
         current_page = self.thumbnailTabWidget.currentIndex() + 1
         next_page = 1 if current_page == 0 else current_page + 1
-        page_name = i18n("Page %1", next_page)
 
-        view = thumbnailview.DanbooruPostView(self.api_data, self.preferences)
+        if self.__continuous:
+            page_name = i18n("Results")
+        else:
+            page_name = i18n("Page %1", next_page)
+
+        view = thumbnailview.DanbooruPostView(self.api_data, self.preferences,
+                                              library=self.library,
+                                              continuous=self.__continuous)
+
+        if self.__continuous:
+            view.endReached.connect(partial(self.__load_more, view))
 
         # We add the item to a list to keep a reference of it around
 
@@ -173,11 +261,18 @@ class DanbooruTabWidget(QWidget):
 
         "Removes all pages in the widget."
 
+        # Thumbnails of the old pages are no longer needed
+        self.api_data.scheduler.cancel()
+
         self.thumbnailTabWidget.clear()
         self.__pages = list()
+        self.__hidden_since = dict()
+        self.__shown = None
         self.__firstpage = True
         self.__current_index = 0
+        self.__continuous = self.preferences.continuous_scrolling
         self.nextPageButton.setDisabled(True)
+        self.nextPageButton.setVisible(not self.__continuous)
         self.new_page()
 
     def selected_images(self):
@@ -202,11 +297,30 @@ class DanbooruTabWidget(QWidget):
 
         self.nextPageButton.setDisabled(True)
         self.new_page()
-        current_page = self.__current_index + 1
+
+        # One page per tab: the new tab holds page __current_index
+        self.__request_page(self.__current_index)
+
+    def __load_more(self, view):
+
+        """Ask for the page following those in *view*, in continuous
+        mode."""
+
+        if view not in self.__pages or not view.finished:
+            return
+
+        view.expect_more()
+        self.__current_index += 1
+        self.__request_page(self.__current_index)
+
+    def __request_page(self, page):
+
+        """Retrieve *page* of the results, with the same parameters as
+        originally supplied."""
 
         self.api_data.get_post_list(limit=self.post_limit,
                                     tags=self.api_data.current_tags,
-                                    page=current_page,
+                                    page=page,
                                     blacklist=self.preferences.tag_blacklist,
                                     rating=self.preferences.max_allowed_rating)
 
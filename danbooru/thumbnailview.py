@@ -17,77 +17,844 @@
 #   Free Software Foundation, Inc.,
 #   51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 
+"""Display of the posts retrieved from a Danbooru board.
+
+Posts are kept in a :class:`DanbooruPostModel` and painted by a
+:class:`DanbooruPostDelegate`, so that only the thumbnails on screen cost
+anything to draw: there is no widget per post. The menu and actions are
+shared by all the posts of a :class:`DanbooruPostView`, and act on the post
+under the mouse.
+
+"""
+
 from functools import partial
+import sys
 
 import PyQt4.QtCore as QtCore
 import PyQt4.QtGui as QtGui
 
 import PyKDE4.kdecore as kdecore
+import PyKDE4.kdeui as kdeui
+import PyKDE4.kio as kio
+
+from api.download import ImageDownload, HIGH_PRIORITY, shared_manager
+from api.ratelimit import shared_limiter
+
+if sys.version_info.major > 2:
+    unicode = str
+
+_TRANSLATED_RATINGS = dict(
+    Safe=kdecore.i18nc("Image for all audiences", "Safe"),
+    Questionable=kdecore.i18nc("Image with suggestive themes", "Questionable"),
+    Explicit=kdecore.i18nc("Image with explicit content", "Explicit")
+    )
+
+# Largest thumbnail served by Danbooru boards, in pixels
+THUMBNAIL_SIZE = 150
+
+# Space around the parts of an item, in pixels
+MARGIN = 6
+
+# Lines of text below the thumbnail: size, file size, rating, ownership
+_TEXT_LINES = 4
+
+# Role holding the DanbooruPost of an item
+PostRole = QtCore.Qt.UserRole + 1
+
+# In continuous mode, screens left below the viewport when the next page is
+# asked for
+PREFETCH_SCREENS = 2
+
+# In continuous mode, posts kept above the viewport, and how many more are
+# allowed before the first ones are released
+KEPT_ABOVE = 300
+RELEASE_BATCH = 100
+
+
+def label_text(post):
+
+    "Format the text of *post* for display."
+
+    file_size = int(post.file_size or 0)
+    rating = _TRANSLATED_RATINGS[post.rating]
+
+    # Properly format the strings according to the locale
+
+    sizestr = kdecore.ki18np("1 pixel", "%1 pixels")
+    image_size = kdecore.i18n("Size: %1 x %2",
+                              sizestr.subs(post.width).toString(),
+                              sizestr.subs(post.height).toString())
+    file_size = kdecore.i18n("File size: %1",
+            kdecore.KGlobal.locale().formatByteSize(file_size))
+    rating = kdecore.i18n("Rating: %1", rating)
+
+    text = image_size + "\n" + file_size + "\n" + rating
+
+    return text
+
+
+class DanbooruPostModel(QtCore.QAbstractListModel):
+
+    """Model holding the posts shown by a :class:`DanbooruPostView`, and
+    whether they have been checked for download.
+
+    If *api_data* keeps decoded thumbnails in memory (its
+    ``thumbnail_cache``), they are borrowed from its caches when painted
+    (see :meth:`DanbooruService.thumbnail
+    <danbooru.api.remote.DanbooruService.thumbnail>`) rather than kept with
+    the posts.
+
+    The rows can be removed with :meth:`unload`, keeping only the posts,
+    and put back with :meth:`reload`: the thumbnails are then found again
+    in the caches. The first rows can also be dropped for good with
+    :meth:`release`: rows are then counted from the first one kept, while
+    the check state and the thumbnails being loaded are recorded by the
+    position of the posts since the first one ever added.
+
+    """
+
+    def __init__(self, api_data=None, library=None, parent=None):
+
+        super(DanbooruPostModel, self).__init__(parent)
+
+        self.api_data = api_data
+        self.library = library
+        self.__posts = list()
+        self.__unloaded = list()
+        self.__released = 0
+        self.__released_checked = list()
+        self.__checked = set()
+        self.__loading = set()
+
+    def __len__(self):
+
+        "The number of posts, including those unloaded."
+
+        return len(self.__posts) + len(self.__unloaded)
+
+    @property
+    def unloaded(self):
+
+        "Whether the rows have been removed by :meth:`unload`."
+
+        return bool(self.__unloaded)
+
+    @property
+    def released(self):
+
+        "The number of rows dropped by :meth:`release`."
+
+        return self.__released
+
+    def __borrowed(self):
+
+        return (self.api_data is not None and
+                self.api_data.thumbnail_cache is not None)
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+
+        if parent.isValid():
+            return 0
+
+        return len(self.__posts)
+
+    def flags(self, index):
+
+        return (QtCore.Qt.ItemIsEnabled | QtCore.Qt.ItemIsSelectable |
+                QtCore.Qt.ItemIsUserCheckable)
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+
+        if not index.isValid() or index.row() >= len(self.__posts):
+            return QtCore.QVariant()
+
+        row = index.row()
+        post = self.__posts[row]
+
+        if role == QtCore.Qt.DisplayRole:
+            return QtCore.QVariant(label_text(post))
+        elif role == QtCore.Qt.ToolTipRole:
+            return QtCore.QVariant(kdecore.KUrl(post.file_url).fileName())
+        elif role == QtCore.Qt.DecorationRole:
+            pixmap = self.thumbnail(row)
+
+            if pixmap is not None:
+                return QtCore.QVariant(pixmap)
+        elif role == QtCore.Qt.CheckStateRole:
+            state = (QtCore.Qt.Checked if self.is_checked(row)
+                     else QtCore.Qt.Unchecked)
+            return QtCore.QVariant(state)
+        elif role == PostRole:
+            return QtCore.QVariant(post)
+
+        return QtCore.QVariant()
+
+    def setData(self, index, value, role=QtCore.Qt.EditRole):
+
+        if not index.isValid() or role != QtCore.Qt.CheckStateRole:
+            return False
+
+        state = int(value.toPyObject())
+        self.set_checked(index.row(), state == QtCore.Qt.Checked)
+
+        return True
+
+    def append(self, post):
+
+        """Add *post* at the end of the model."""
+
+        row = len(self.__posts)
+
+        if self.__borrowed():
+            # The caches hold it from now on
+            post.pixmap = None
+
+        self.beginInsertRows(QtCore.QModelIndex(), row, row)
+        self.__posts.append(post)
+        self.endInsertRows()
+
+    def post(self, row):
+
+        "Return the post at *row*."
+
+        return self.__posts[row]
+
+    def posts(self):
+
+        "Return the posts in the model, including those unloaded."
+
+        return self.__posts + self.__unloaded
+
+    def thumbnail(self, row):
+
+        """Return the thumbnail of the post at *row*, or :const:`None` if it
+        is not available (yet: one only on disk is decoded in the background,
+        and the row updated once done)."""
+
+        post = self.__posts[row]
+
+        if post.pixmap is not None or self.api_data is None:
+            return post.pixmap
+
+        position = self.__released + row
+
+        if position in self.__loading:
+            return
+
+        callback = partial(self.__slot_thumbnail_loaded, position)
+        pixmap = self.api_data.thumbnail(post, callback)
+
+        if pixmap is None:
+            self.__loading.add(position)
+
+        return pixmap
+
+    def __slot_thumbnail_loaded(self, position, pixmap):
+
+        if position not in self.__loading:
+            # Unloaded or released in the meantime
+            return
+
+        self.__loading.discard(position)
+        row = position - self.__released
+
+        if row < len(self.__posts):
+
+            if not self.__borrowed():
+                self.__posts[row].pixmap = pixmap
+
+            index = self.index(row)
+            self.dataChanged.emit(index, index)
+
+    def is_checked(self, row):
+
+        "Whether the post at *row* has been checked for download."
+
+        return self.__released + row in self.__checked
+
+    def set_checked(self, row, checked):
+
+        "Check or uncheck the post at *row*."
+
+        if checked:
+            self.__checked.add(self.__released + row)
+        else:
+            self.__checked.discard(self.__released + row)
+
+        index = self.index(row)
+        self.dataChanged.emit(index, index)
+
+    def checked_posts(self):
+
+        """Return the posts checked for download, in order, including those
+        released."""
+
+        posts = self.posts()
+        checked = [posts[position - self.__released]
+                   for position in sorted(self.__checked)]
+
+        return self.__released_checked + checked
+
+    def release(self, count):
+
+        """Drop the first *count* rows and their posts, except those
+        checked for download."""
+
+        count = min(count, len(self.__posts))
+
+        if count <= 0:
+            return
+
+        self.beginRemoveRows(QtCore.QModelIndex(), 0, count - 1)
+
+        end = self.__released + count
+
+        for position in sorted(self.__checked):
+            if position < end:
+                self.__released_checked.append(
+                    self.__posts[position - self.__released])
+                self.__checked.discard(position)
+
+        self.__loading = set(position for position in self.__loading
+                             if position >= end)
+        del self.__posts[:count]
+        self.__released = end
+
+        self.endRemoveRows()
+
+    def memory_size(self):
+
+        """Return an estimate of the memory used by the thumbnails of the
+        rows, held by the posts or kept in the thumbnail cache, in bytes."""
+
+        cache = None
+
+        if self.api_data is not None:
+            cache = self.api_data.thumbnail_cache
+
+        size = 0
+
+        for post in self.__posts:
+
+            pixmap = post.pixmap
+
+            if pixmap is not None:
+                size += pixmap.width() * pixmap.height() * \
+                    max(pixmap.depth(), 8) // 8
+            elif cache is not None:
+                size += cache.cost(post.board or self.api_data.url, post.md5)
+
+        return size
+
+    def unload(self):
+
+        """Remove all the rows, keeping the posts and their check state,
+        and release their thumbnails if they can be found again on disk."""
+
+        if not self.__posts:
+            return
+
+        self.beginResetModel()
+        self.__unloaded = self.__posts
+        self.__posts = list()
+        self.__loading.clear()
+        self.endResetModel()
+
+        if self.api_data is None or self.api_data.cache is None:
+            return
+
+        cache = self.api_data.thumbnail_cache
+
+        for post in self.__unloaded:
+
+            post.pixmap = None
+
+            if cache is not None:
+                cache.remove(post.board or self.api_data.url, post.md5)
+
+    def reload(self):
+
+        """Put back the rows removed by :meth:`unload`."""
+
+        if not self.__unloaded:
+            return
+
+        self.beginInsertRows(QtCore.QModelIndex(), 0,
+                             len(self.__unloaded) - 1)
+        self.__posts = self.__unloaded
+        self.__unloaded = list()
+        self.endInsertRows()
+
+    def is_owned(self, row):
+
+        "Whether the image of the post at *row* is in the local library."
+
+        # Checked in memory only, so it costs nothing per thumbnail
+        return self.library is not None and self.__posts[row].md5 in \
+            self.library
+
+
+class DanbooruPostDelegate(QtGui.QStyledItemDelegate):
+
+    """Paint the posts of a :class:`DanbooruPostModel`: the thumbnail, its
+    description and a check box to select it for download."""
+
+    thumbnailClicked = QtCore.pyqtSignal(QtCore.QModelIndex)
+
+    def __style(self, option):
+
+        if option.widget is not None:
+            return option.widget.style()
+
+        return QtGui.QApplication.style()
+
+    def cell_size(self, metrics, style):
+
+        "Return the size of an item, given the font *metrics* and *style*."
+
+        indicator = style.pixelMetric(QtGui.QStyle.PM_IndicatorHeight)
+        check_height = max(indicator, metrics.height())
+        text_height = metrics.lineSpacing() * _TEXT_LINES
+
+        width = max(THUMBNAIL_SIZE, metrics.averageCharWidth() * 30)
+        height = THUMBNAIL_SIZE + text_height + check_height + 3 * MARGIN
+
+        return QtCore.QSize(width + 2 * MARGIN, height + MARGIN)
+
+    def sizeHint(self, option, index):
+
+        return self.cell_size(option.fontMetrics, self.__style(option))
+
+    def __thumbnail_rect(self, option):
+
+        rect = option.rect
+
+        return QtCore.QRect(rect.left() + MARGIN, rect.top() + MARGIN,
+                            rect.width() - 2 * MARGIN, THUMBNAIL_SIZE)
+
+    def __check_rect(self, option):
 
-from danboorupostwidget import DanbooruPostWidget
+        style = self.__style(option)
+        metrics = option.fontMetrics
 
+        indicator_width = style.pixelMetric(QtGui.QStyle.PM_IndicatorWidth)
+        indicator_height = style.pixelMetric(QtGui.QStyle.PM_IndicatorHeight)
+        spacing = style.pixelMetric(QtGui.QStyle.PM_CheckBoxLabelSpacing)
 
-class DanbooruPostView(QtGui.QTableWidget):
+        height = max(indicator_height, metrics.height())
+        width = (indicator_width + spacing +
+                 metrics.width(kdecore.i18n("Select")))
 
-    """A class to show the thumbnails retrieved from a Danbooru board."""
+        return QtCore.QRect(option.rect.left() + MARGIN,
+                            option.rect.bottom() - MARGIN - height + 1,
+                            width, height)
+
+    def paint(self, painter, option, index):
+
+        model = index.model()
+        row = index.row()
+        post = model.post(row)
+        style = self.__style(option)
+
+        painter.save()
+        style.drawPrimitive(QtGui.QStyle.PE_PanelItemViewItem, option,
+                            painter, option.widget)
+
+        thumbnail_rect = self.__thumbnail_rect(option)
+        pixmap = model.thumbnail(row)
+
+        if pixmap is not None:
+            size = pixmap.size().boundedTo(thumbnail_rect.size())
+            target = QtGui.QStyle.alignedRect(QtCore.Qt.LeftToRight,
+                                              QtCore.Qt.AlignCenter, size,
+                                              thumbnail_rect)
+            painter.drawPixmap(target, pixmap)
+
+        text = label_text(post)
+
+        if model.is_owned(row):
+            text = text + "\n" + kdecore.i18n("Already downloaded")
+
+        text_rect = QtCore.QRect(thumbnail_rect.left(),
+                                 thumbnail_rect.bottom() + MARGIN,
+                                 thumbnail_rect.width(),
+                                 option.fontMetrics.lineSpacing() *
+                                 _TEXT_LINES)
+
+        if option.state & QtGui.QStyle.State_Selected:
+            painter.setPen(option.palette.color(QtGui.QPalette.HighlightedText))
+        else:
+            painter.setPen(option.palette.color(QtGui.QPalette.Text))
+
+        painter.drawText(text_rect, QtCore.Qt.AlignLeft | QtCore.Qt.AlignTop,
+                         text)
+
+        check = QtGui.QStyleOptionButton()
+        check.rect = self.__check_rect(option)
+        check.palette = option.palette
+        check.fontMetrics = option.fontMetrics
+        check.text = kdecore.i18n("Select")
+        check.state = QtGui.QStyle.State_Enabled
+
+        if model.is_checked(row):
+            check.state |= QtGui.QStyle.State_On
+        else:
+            check.state |= QtGui.QStyle.State_Off
+
+        style.drawControl(QtGui.QStyle.CE_CheckBox, check, painter,
+                          option.widget)
+        painter.restore()
+
+    def editorEvent(self, event, model, option, index):
+
+        if event.type() != QtCore.QEvent.MouseButtonRelease:
+            return False
+
+        if event.button() != QtCore.Qt.LeftButton:
+            return False
+
+        if self.__check_rect(option).contains(event.pos()):
+            model.set_checked(index.row(), not model.is_checked(index.row()))
+            return True
+
+        if self.__thumbnail_rect(option).contains(event.pos()):
+            self.thumbnailClicked.emit(index)
+            return True
+
+        return False
+
+
+class DanbooruPostView(QtGui.QListView):
+
+    """A class to show the thumbnails retrieved from a Danbooru board.
+
+    If *continuous* is set, the view holds several pages one after the
+    other: :attr:`endReached` is emitted when the end is near, so that the
+    next page is asked for (and added once :meth:`expect_more` is called),
+    and the posts far above the viewport are released.
+
+    """
 
     # Signals
 
     fetchTags = QtCore.pyqtSignal(QtCore.QString)
+    endReached = QtCore.pyqtSignal()
 
-    def __init__(self, api_data, preferences, parent=None):
+    def __init__(self, api_data, preferences, parent=None, library=None,
+                 continuous=False):
 
         super(DanbooruPostView, self).__init__(parent)
 
-        self.__max_columns = preferences.column_no
-        self.__column_index = 0
-        self.__row_index = 0
+        self.__max_columns = max(preferences.column_no, 1)
         self.preferences = preferences
+        self.continuous = continuous
+        self.exhausted = False
         self.__locked = False
+        self.__group = None
+        self.__group_start = 0
+        self.__menu_post = None
+        self.__downloads = set()
 
         self.api_data = api_data
-        self.__items = list()
+        self.library = library
 
-        self.setColumnCount(self.__max_columns)
-        self.verticalHeader().hide()
-        self.horizontalHeader().hide()
+        self.__model = DanbooruPostModel(api_data, library, self)
+        self.__delegate = DanbooruPostDelegate(self)
+        self.setModel(self.__model)
+        self.setItemDelegate(self.__delegate)
 
-        resize_mode = QtGui.QHeaderView.ResizeToContents
-        self.horizontalHeader().setResizeMode(resize_mode)
-        self.verticalHeader().setResizeMode(resize_mode)
-        self.setShowGrid(False)
-        #self.setDisabled(True)
+        self.setViewMode(QtGui.QListView.IconMode)
+        self.setMovement(QtGui.QListView.Static)
+        self.setResizeMode(QtGui.QListView.Adjust)
+        self.setDragEnabled(False)
+        self.setUniformItemSizes(True)
+        self.setSelectionMode(QtGui.QAbstractItemView.NoSelection)
+        self.setVerticalScrollMode(QtGui.QAbstractItemView.ScrollPerPixel)
+        self.setVerticalScrollBarPolicy(QtCore.Qt.ScrollBarAlwaysOn)
+        self.setMouseTracking(True)
 
-        enable_ = partial(self.setDisabled, False)
+        # Lay out large pages a bit at a time, unless rows are released:
+        # the view is scrolled back at once by their height
+        if not continuous:
+            self.setLayoutMode(QtGui.QListView.Batched)
+            self.setBatchSize(50)
+
+        self.__update_grid()
+
+        self.setup_actions()
 
         self.api_data.postRetrieved.connect(self.create_post)
-        #self.api_data.postDownloadFinished.connect(enable_)
+        self.api_data.postListStarted.connect(self.set_group)
         self.api_data.postDownloadFinished.connect(self.stop_download)
 
+        self.__delegate.thumbnailClicked.connect(self.__slot_clicked)
+        self.verticalScrollBar().valueChanged.connect(self.update_visible_range)
+
+        if continuous:
+            scrollbar = self.verticalScrollBar()
+            scrollbar.valueChanged.connect(self.__release_rows)
+            scrollbar.valueChanged.connect(self.__check_end)
+            scrollbar.rangeChanged.connect(self.__check_end)
+
     def __len__(self):
 
-        "Returns the number of URLs stored."
+        "Returns the number of posts stored."
+
+        return len(self.__model)
+
+    def setup_actions(self):
+
+        """Set up the KActions, shared by all the posts."""
+
+        self.menu = kdeui.KMenu(self)
+        self.action_collection = kdeui.KActionCollection(self)
+
+        self.download_action = self.action_collection.addAction(
+            "download-image")
+        self.view_action = self.action_collection.addAction(
+            "view-image")
+        self.browser_action = self.action_collection.addAction(
+            "open-browser")
+        self.copy_link_action = self.action_collection.addAction(
+            "copy-link")
+
+        self.download_action.setText(kdecore.i18n("Download"))
+        self.view_action.setText(kdecore.i18n("View image"))
+        self.browser_action.setText(kdecore.i18n("Open in browser"))
+        self.copy_link_action.setText(kdecore.i18n("Copy image link"))
+
+        self.download_action.setIcon(kdeui.KIcon("download"))
+        self.view_action.setIcon(kdeui.KIcon("image-x-generic"))
+        self.browser_action.setIcon(kdeui.KIcon("internet-web-browser"))
+
+        self.menu.addAction(self.view_action)
+        self.menu.addAction(self.download_action)
+        self.menu.addAction(self.browser_action)
+        self.menu.addAction(self.copy_link_action)
+
+        self.download_action.triggered.connect(
+            partial(self.__trigger, self.download))
+        self.view_action.triggered.connect(partial(self.__trigger, self.view))
+        self.browser_action.triggered.connect(
+            partial(self.__trigger, self.open_browser))
+        self.copy_link_action.triggered.connect(
+            partial(self.__trigger, self.put_in_clipboard))
+
+    def __trigger(self, method, checked=False):
 
-        return len(self.__items)
+        "Apply *method* to the post the menu was shown for."
 
+        if self.__menu_post is not None:
+            method(self.__menu_post)
+
+    def __slot_clicked(self, index):
+
+        self.view(self.__model.post(index.row()))
+
+    def __update_grid(self):
+
+        """Size the grid so that the preferred number of columns fills the
+        view, when wide enough."""
+
+        cell = self.__delegate.cell_size(self.fontMetrics(), self.style())
+        width = max(cell.width(),
+                    self.viewport().width() // self.__max_columns)
+        grid = QtCore.QSize(width, cell.height())
+
+        if grid != self.gridSize():
+            self.setGridSize(grid)
+
+    def resizeEvent(self, event):
+
+        super(DanbooruPostView, self).resizeEvent(event)
+
+        self.__update_grid()
+        self.update_visible_range()
+
+    def contextMenuEvent(self, event):
+
+        index = self.indexAt(event.pos())
+
+        if not index.isValid():
+            return
+
+        self.__menu_post = self.__model.post(index.row())
+        self.menu.exec_(event.globalPos())
+
+    @property
+    def finished(self):
+
+        "Whether all the posts of the page have been received."
+
+        return self.__locked
+
+    @property
+    def unloaded(self):
+
+        "Whether the page has been unloaded, see :meth:`unload`."
+
+        return self.__model.unloaded
+
+    def memory_size(self):
+
+        "Return an estimate of the memory used by the thumbnails shown."
+
+        return self.__model.memory_size()
+
+    def unload(self):
+
+        """Drop the thumbnails and the rows of the page, keeping the posts
+        only, while it is not shown. Pages still receiving posts are left
+        alone."""
+
+        if not self.__locked:
+            return
+
+        self.__model.unload()
+
+    def reload(self):
+
+        """Show again the posts of a page unloaded with :meth:`unload`,
+        borrowing their thumbnails from the caches."""
+
+        self.__model.reload()
 
     def stop_download(self):
 
+        if self.__locked:
+            return
+
         self.__locked = True
 
-    def items(self):
+        if not self.continuous:
+            return
+
+        # A page without posts: there are no more
+        if self.__position() == self.__group_start:
+            self.exhausted = True
+
+        self.__check_end()
 
-        """Generator function that yields each ThumbnailViewItem stored in the
-        internal list."""
+    def __position(self):
 
-        if not self.__items:
+        "Return the position of the end of the view, since the first post."
+
+        return self.__model.released + self.__model.rowCount()
+
+    def expect_more(self):
+
+        """Accept the next list of posts, added after those shown. Only
+        views in continuous mode do."""
+
+        if not self.continuous or not self.__locked:
+            return
+
+        self.__locked = False
+        self.__group = None
+        self.__group_start = self.__position()
+
+    def __check_end(self, *args):
+
+        """Emit :attr:`endReached` if the end of the view is near, and the
+        last page is complete."""
+
+        if not self.__locked or self.exhausted or not self.isVisible():
+            return
+
+        scrollbar = self.verticalScrollBar()
+        remaining = scrollbar.maximum() - scrollbar.value()
+
+        if remaining <= self.viewport().height() * PREFETCH_SCREENS:
+            self.endReached.emit()
+
+    def __release_rows(self, value=None):
+
+        """Release the rows far above the viewport, and scroll back by their
+        height so that the view does not move."""
+
+        grid = self.gridSize()
+        row_height = max(grid.height(), 1)
+        columns = max(self.viewport().width() // max(grid.width(), 1), 1)
+
+        scrollbar = self.verticalScrollBar()
+        value = scrollbar.value()
+        above = (value // row_height) * columns
+
+        if above < KEPT_ABOVE + RELEASE_BATCH:
+            return
+
+        # Whole rows, so that the others stay in their columns
+        rows = (above - KEPT_ABOVE) // columns
+
+        self.__model.release(rows * columns)
+        self.doItemsLayout()
+        scrollbar.setValue(value - rows * row_height)
+
+    def showEvent(self, event):
+
+        super(DanbooruPostView, self).showEvent(event)
+
+        if self.continuous:
+            self.__check_end()
+
+    def set_group(self, group):
+
+        """Slot called when a new list of posts is started. The view takes
+        ownership of the first list received while it is still accepting
+        posts."""
+
+        if self.__locked or self.__group is not None:
+            return
+
+        self.__group = group
+        self.update_visible_range()
+
+    def activate(self):
+
+        """Make the thumbnails of this view the first to be downloaded."""
+
+        if self.__group is None:
+            return
+
+        self.api_data.scheduler.set_active_group(self.__group)
+        self.update_visible_range()
+
+    def update_visible_range(self, value=None):
+
+        """Tell the thumbnail scheduler which posts would be visible on
+        screen, so that they are retrieved first."""
+
+        if self.__group is None:
+            return
+
+        grid = self.gridSize()
+        row_height = max(grid.height(), 1)
+        columns = max(self.viewport().width() // max(grid.width(), 1), 1)
+
+        first_row = self.verticalScrollBar().value() // row_height
+        rows = self.viewport().height() // row_height + 1
+
+        # Include one more screen so that scrolling down finds the
+        # thumbnails ready. Positions are counted in the current list.
+        offset = self.__model.released - self.__group_start
+        first = max(first_row * columns + offset, 0)
+        last = (first_row + 2 * rows) * columns - 1 + offset
+
+        if last < 0:
             return
-        for item in self.__items:
-            yield item
+
+        self.api_data.scheduler.set_visible_range(self.__group, first, last)
+
+    def items(self):
+
+        """Generator function that yields each post stored in the view."""
+
+        for post in self.__model.posts():
+            yield post
 
     def create_post(self, data):
 
-        """Process thumnnails and create DanbooruPostWidgets.
+        """Add a post to the view.
 
         This  is actually a slot called by postRetrieved."""
 
@@ -98,42 +865,117 @@ class DanbooruPostView(QtGui.QTableWidget):
             # Pass on invalid objects
             return
 
-        item = DanbooruPostWidget(data)
+        self.__model.append(data)
 
-        self.__items.append(item)
+    def selected_images(self):
 
-        if self.rowCount() == 0:
-            self.insertRow(0)
+        """The list of the posts that have been checked.
 
-        if self.__column_index >= self.columnCount():
-            self.__column_index = 0
-            self.__row_index += 1
-            self.insertRow(self.rowCount())
+         Used for batch downloading.
 
-        self.setCellWidget(self.__row_index, self.__column_index, item)
-        self.__column_index += 1
+         :return: A list of the selected posts.
 
-        self.resizeRowsToContents()
-        self.resizeColumnsToContents()
+         """
 
-        item.url_label.leftClickedUrl.connect(item.view)
+        return self.__model.checked_posts()
 
-    def selected_images(self):
+    def download(self, post):
 
-        """The list of the items that have been checked.
+        """Trigger the download of the image of *post* to a user-supplied
+        directory."""
 
-         Used for batch downloading.
+        start_name = kdecore.KUrl(post.file_url).fileName()
+        start_url = kdecore.KUrl("kfiledialog:///danbooru/%s" %
+                                 unicode(start_name))
 
-         :return: A list of the selected items.
+        # Get the mimetype to be passed to the save dialog
+        mimetype_job = kio.KIO.mimetype(kdecore.KUrl(post.file_url),
+                                        kio.KIO.HideProgressInfo)
 
-         """
+        mimetype = ""
+
+        # Small enough to be synchronous
+        if kio.KIO.NetAccess.synchronousRun(mimetype_job, self):
+            mimetype = mimetype_job.mimetype()
+
+        caption = kdecore.i18n("Save image file")
+
+        enable_previews = kio.KFileDialog.ShowInlinePreview
+        confirm_overwrite = kio.KFileDialog.ConfirmOverwrite
+        options = kio.KFileDialog.Option(enable_previews | confirm_overwrite)
+
+        filename = kio.KFileDialog.getSaveFileName(start_url,
+            mimetype, self, caption, options)
 
-        if not self.__items:
+        if not filename:
             return
 
-        selected_items = [item for item in self.items()
-                          if item.checkbox.isChecked()]
+        download_url = kdecore.KUrl(post.file_url)
+        filename = kdecore.KUrl(filename)
+
+        # Full images count against the static file budget of the board
+        board_url = post.board or self.api_data.url
+
+        download = ImageDownload(download_url, filename, md5=post.md5,
+                                 board_url=board_url,
+                                 limiter=shared_limiter(), parent=self,
+                                 size=post.file_size)
+        download.post_id = post.id
+        download.finished.connect(self.download_slot)
+
+        # Kept around until finished, or it would be garbage collected
+        self.__downloads.add(download)
+
+        # Ahead of batch downloads, as the user is waiting for it
+        shared_manager().submit(download, HIGH_PRIORITY)
+
+    def download_slot(self, download):
+
+        "Slot called by the ImageDownload handling a download."
+
+        self.__downloads.discard(download)
+
+        if download.cancelled:
+            return
+
+        if download.error is not None:
+            kdeui.KMessageBox.error(self, download.error)
+            return
+
+        if self.library is not None and download.path is not None:
+            self.library.add(download.md5, download.path,
+                             board_url=download.board_url,
+                             post_id=download.post_id)
+
+            # Shown as already downloaded from now on
+            self.viewport().update()
+
+        if self.preferences.nepomuk_enabled:
+            # Get the URL of the board for Nepomuk tagging
+            board_name = kdecore.KUrl(download.board_url)
+            #danbooru2nepomuk.tag_danbooru_item(download_name, post.tags,
+            #                                   blacklist, board_name)
+
+    def view(self, post):
+
+        """Display the image of *post* using the user's default image
+        viewer."""
+
+        # Garbage collection ensues if we don't keep a reference around
+        self.display = kio.KRun(kdecore.KUrl(post.file_url), self, 0,
+                                False, True, '')
+
+        if self.display.hasError():
+            text = kdecore.i18n("An error occurred while "
+                                "downloading the image.")
+            kdeui.KMessageBox.error(self, text)
+
+    def open_browser(self, post):
 
-        return selected_items
+        kdecore.KToolInvocation.invokeBrowser(post.file_url,
+                                              QtCore.QByteArray())
 
+    def put_in_clipboard(self, post):
 
+        clipboard = QtGui.QApplication.clipboard()
+        clipboard.setText(post.file_url)
@@ -58,6 +58,9 @@ class Ui_connectForm(object):
         self.passwdLineEdit.setPasswordMode(True)
         self.passwdLineEdit.setObjectName(_fromUtf8("passwdLineEdit"))
         self.horizontalLayout.addWidget(self.passwdLineEdit)
+        self.federatedCheckBox = QtGui.QCheckBox(connectForm)
+        self.federatedCheckBox.setObjectName(_fromUtf8("federatedCheckBox"))
+        self.horizontalLayout.addWidget(self.federatedCheckBox)
         self.buttonBox = KDialogButtonBox(connectForm)
         self.buttonBox.setStandardButtons(QtGui.QDialogButtonBox.Ok)
         self.buttonBox.setCenterButtons(False)
@@ -73,5 +76,7 @@ class Ui_connectForm(object):
         self.userLineEdit.setClickMessage(kdecore.i18n(_fromUtf8("Danbooru username (optional)")))
         self.passwordLabel.setText(kdecore.i18n(_fromUtf8("Password")))
         self.passwdLineEdit.setClickMessage(kdecore.i18n(_fromUtf8("Danbooru password (optional)")))
+        self.federatedCheckBox.setToolTip(kdecore.i18n(_fromUtf8("Search all the boards in the list at the same time")))
+        self.federatedCheckBox.setText(kdecore.i18n(_fromUtf8("All boards")))
 
 from PyKDE4.kdeui import KLineEdit, KDialogButtonBox, KPushButton, KComboBox
@@ -40,6 +40,9 @@ class Ui_GeneralPage(object):
         self.ratingLabel = QtGui.QLabel(GeneralPage)
         self.ratingLabel.setObjectName("ratingLabel")
         self.formLayout.setWidget(3, QtGui.QFormLayout.LabelRole, self.ratingLabel)
+        self.kcfg_continuousScrolling = QtGui.QCheckBox(GeneralPage)
+        self.kcfg_continuousScrolling.setObjectName("kcfg_continuousScrolling")
+        self.formLayout.setWidget(4, QtGui.QFormLayout.FieldRole, self.kcfg_continuousScrolling)
 
         self.retranslateUi(GeneralPage)
         QtCore.QMetaObject.connectSlotsByName(GeneralPage)
@@ -51,5 +54,7 @@ class Ui_GeneralPage(object):
         self.kcfg_maxAllowedRating.setItemText(1, kdecore.i18n("Questionable"))
         self.kcfg_maxAllowedRating.setItemText(2, kdecore.i18n("Explicit"))
         self.ratingLabel.setText(kdecore.i18n("Maximum allowed rating"))
+        self.kcfg_continuousScrolling.setWhatsThis(kdecore.i18n("Check this to show the pages of results one after the other in a single view, retrieving the next one while scrolling, rather than one page per tab."))
+        self.kcfg_continuousScrolling.setText(kdecore.i18n("Show all the results in a single scrolling view"))
 
 from PyKDE4.kdeui import KIntSpinBox, KComboBox
@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+# coding=UTF-8
+#
+# Generated by pykdeuic4 from ui_src/performancepage.ui
+#
+# WARNING! All changes to this file will be lost.
+from PyKDE4 import kdecore
+from PyKDE4 import kdeui
+from PyQt4 import QtCore, QtGui
+
+class Ui_PerformancePage(object):
+    def setupUi(self, PerformancePage):
+        PerformancePage.setObjectName("PerformancePage")
+        PerformancePage.resize(402, 287)
+        self.formLayout = QtGui.QFormLayout(PerformancePage)
+        self.formLayout.setObjectName("formLayout")
+        self.prefetchDepthLabel = QtGui.QLabel(PerformancePage)
+        self.prefetchDepthLabel.setObjectName("prefetchDepthLabel")
+        self.formLayout.setWidget(0, QtGui.QFormLayout.LabelRole, self.prefetchDepthLabel)
+        self.kcfg_prefetchDepth = KIntSpinBox(PerformancePage)
+        self.kcfg_prefetchDepth.setMinimum(0)
+        self.kcfg_prefetchDepth.setMaximum(5)
+        self.kcfg_prefetchDepth.setObjectName("kcfg_prefetchDepth")
+        self.formLayout.setWidget(0, QtGui.QFormLayout.FieldRole, self.kcfg_prefetchDepth)
+        self.kcfg_prefetchThumbnails = QtGui.QCheckBox(PerformancePage)
+        self.kcfg_prefetchThumbnails.setObjectName("kcfg_prefetchThumbnails")
+        self.formLayout.setWidget(1, QtGui.QFormLayout.FieldRole, self.kcfg_prefetchThumbnails)
+        self.apiCacheSizeLabel = QtGui.QLabel(PerformancePage)
+        self.apiCacheSizeLabel.setObjectName("apiCacheSizeLabel")
+        self.formLayout.setWidget(2, QtGui.QFormLayout.LabelRole, self.apiCacheSizeLabel)
+        self.kcfg_apiCacheSize = KIntSpinBox(PerformancePage)
+        self.kcfg_apiCacheSize.setMinimum(1)
+        self.kcfg_apiCacheSize.setMaximum(1024)
+        self.kcfg_apiCacheSize.setObjectName("kcfg_apiCacheSize")
+        self.formLayout.setWidget(2, QtGui.QFormLayout.FieldRole, self.kcfg_apiCacheSize)
+        self.maxDownloadsLabel = QtGui.QLabel(PerformancePage)
+        self.maxDownloadsLabel.setObjectName("maxDownloadsLabel")
+        self.formLayout.setWidget(3, QtGui.QFormLayout.LabelRole, self.maxDownloadsLabel)
+        self.kcfg_maxDownloads = KIntSpinBox(PerformancePage)
+        self.kcfg_maxDownloads.setMinimum(1)
+        self.kcfg_maxDownloads.setMaximum(20)
+        self.kcfg_maxDownloads.setObjectName("kcfg_maxDownloads")
+        self.formLayout.setWidget(3, QtGui.QFormLayout.FieldRole, self.kcfg_maxDownloads)
+        self.maxHostDownloadsLabel = QtGui.QLabel(PerformancePage)
+        self.maxHostDownloadsLabel.setObjectName("maxHostDownloadsLabel")
+        self.formLayout.setWidget(4, QtGui.QFormLayout.LabelRole, self.maxHostDownloadsLabel)
+        self.kcfg_maxHostDownloads = KIntSpinBox(PerformancePage)
+        self.kcfg_maxHostDownloads.setMinimum(1)
+        self.kcfg_maxHostDownloads.setMaximum(10)
+        self.kcfg_maxHostDownloads.setObjectName("kcfg_maxHostDownloads")
+        self.formLayout.setWidget(4, QtGui.QFormLayout.FieldRole, self.kcfg_maxHostDownloads)
+        self.thumbnailMemoryLabel = QtGui.QLabel(PerformancePage)
+        self.thumbnailMemoryLabel.setObjectName("thumbnailMemoryLabel")
+        self.formLayout.setWidget(5, QtGui.QFormLayout.LabelRole, self.thumbnailMemoryLabel)
+        self.kcfg_thumbnailMemory = KIntSpinBox(PerformancePage)
+        self.kcfg_thumbnailMemory.setMinimum(8)
+        self.kcfg_thumbnailMemory.setMaximum(1024)
+        self.kcfg_thumbnailMemory.setObjectName("kcfg_thumbnailMemory")
+        self.formLayout.setWidget(5, QtGui.QFormLayout.FieldRole, self.kcfg_thumbnailMemory)
+        self.thumbnailCacheSizeLabel = QtGui.QLabel(PerformancePage)
+        self.thumbnailCacheSizeLabel.setObjectName("thumbnailCacheSizeLabel")
+        self.formLayout.setWidget(6, QtGui.QFormLayout.LabelRole, self.thumbnailCacheSizeLabel)
+        self.kcfg_thumbnailCacheSize = KIntSpinBox(PerformancePage)
+        self.kcfg_thumbnailCacheSize.setMinimum(10)
+        self.kcfg_thumbnailCacheSize.setMaximum(4096)
+        self.kcfg_thumbnailCacheSize.setObjectName("kcfg_thumbnailCacheSize")
+        self.formLayout.setWidget(6, QtGui.QFormLayout.FieldRole, self.kcfg_thumbnailCacheSize)
+        self.decodeThreadsLabel = QtGui.QLabel(PerformancePage)
+        self.decodeThreadsLabel.setObjectName("decodeThreadsLabel")
+        self.formLayout.setWidget(7, QtGui.QFormLayout.LabelRole, self.decodeThreadsLabel)
+        self.kcfg_decodeThreads = KIntSpinBox(PerformancePage)
+        self.kcfg_decodeThreads.setMinimum(1)
+        self.kcfg_decodeThreads.setMaximum(16)
+        self.kcfg_decodeThreads.setObjectName("kcfg_decodeThreads")
+        self.formLayout.setWidget(7, QtGui.QFormLayout.FieldRole, self.kcfg_decodeThreads)
+        self.unloadPagesDelayLabel = QtGui.QLabel(PerformancePage)
+        self.unloadPagesDelayLabel.setObjectName("unloadPagesDelayLabel")
+        self.formLayout.setWidget(8, QtGui.QFormLayout.LabelRole, self.unloadPagesDelayLabel)
+        self.kcfg_unloadPagesDelay = KIntSpinBox(PerformancePage)
+        self.kcfg_unloadPagesDelay.setMinimum(0)
+        self.kcfg_unloadPagesDelay.setMaximum(1440)
+        self.kcfg_unloadPagesDelay.setObjectName("kcfg_unloadPagesDelay")
+        self.formLayout.setWidget(8, QtGui.QFormLayout.FieldRole, self.kcfg_unloadPagesDelay)
+        self.hiddenPagesMemoryLabel = QtGui.QLabel(PerformancePage)
+        self.hiddenPagesMemoryLabel.setObjectName("hiddenPagesMemoryLabel")
+        self.formLayout.setWidget(9, QtGui.QFormLayout.LabelRole, self.hiddenPagesMemoryLabel)
+        self.kcfg_hiddenPagesMemory = KIntSpinBox(PerformancePage)
+        self.kcfg_hiddenPagesMemory.setMinimum(0)
+        self.kcfg_hiddenPagesMemory.setMaximum(1024)
+        self.kcfg_hiddenPagesMemory.setObjectName("kcfg_hiddenPagesMemory")
+        self.formLayout.setWidget(9, QtGui.QFormLayout.FieldRole, self.kcfg_hiddenPagesMemory)
+
+        self.retranslateUi(PerformancePage)
+        QtCore.QMetaObject.connectSlotsByName(PerformancePage)
+
+    def retranslateUi(self, PerformancePage):
+        self.prefetchDepthLabel.setText(kdecore.i18n("Pages to retrieve in advance"))
+        self.kcfg_prefetchDepth.setWhatsThis(kdecore.i18n("Number of result pages that are retrieved in the background once a page has finished loading. Set to 0 to disable."))
+        self.kcfg_prefetchThumbnails.setWhatsThis(kdecore.i18n("Check this to also download the thumbnails of the pages retrieved in advance."))
+        self.kcfg_prefetchThumbnails.setText(kdecore.i18n("Also retrieve thumbnails in advance"))
+        self.apiCacheSizeLabel.setText(kdecore.i18n("Size of the search results cache"))
+        self.kcfg_apiCacheSize.setWhatsThis(kdecore.i18n("Maximum disk space used to store the answers of the Danbooru board, so that repeated searches are faster."))
+        self.kcfg_apiCacheSize.setSuffix(kdecore.i18n(" MiB"))
+        self.maxDownloadsLabel.setText(kdecore.i18n("Images downloaded at the same time"))
+        self.kcfg_maxDownloads.setWhatsThis(kdecore.i18n("Maximum number of images downloaded at the same time. The others wait in a queue."))
+        self.maxHostDownloadsLabel.setText(kdecore.i18n("Images downloaded at the same time from a server"))
+        self.kcfg_maxHostDownloads.setWhatsThis(kdecore.i18n("Maximum number of images downloaded at the same time from the same server."))
+        self.thumbnailMemoryLabel.setText(kdecore.i18n("Memory used by thumbnails"))
+        self.kcfg_thumbnailMemory.setWhatsThis(kdecore.i18n("Maximum memory used to keep the thumbnails shown most recently, so that going back to a page is faster."))
+        self.kcfg_thumbnailMemory.setSuffix(kdecore.i18n(" MiB"))
+        self.thumbnailCacheSizeLabel.setText(kdecore.i18n("Size of the thumbnail cache"))
+        self.kcfg_thumbnailCacheSize.setWhatsThis(kdecore.i18n("Maximum disk space used to store the thumbnails downloaded, so that they are not downloaded again."))
+        self.kcfg_thumbnailCacheSize.setSuffix(kdecore.i18n(" MiB"))
+        self.decodeThreadsLabel.setText(kdecore.i18n("Threads decoding thumbnails"))
+        self.kcfg_decodeThreads.setWhatsThis(kdecore.i18n("Number of thumbnails decoded at the same time, in the background."))
+        self.unloadPagesDelayLabel.setText(kdecore.i18n("Unload hidden pages after"))
+        self.kcfg_unloadPagesDelay.setWhatsThis(kdecore.i18n("Pages of results which are not shown for this long release their thumbnails, and get them back from the cache when shown again. Set to 0 to unload them only to save memory."))
+        self.kcfg_unloadPagesDelay.setSuffix(kdecore.i18n(" min"))
+        self.hiddenPagesMemoryLabel.setText(kdecore.i18n("Memory used by hidden pages"))
+        self.kcfg_hiddenPagesMemory.setWhatsThis(kdecore.i18n("Maximum memory used by the thumbnails of the pages of results which are not shown. Beyond it, the pages shown least recently are unloaded."))
+        self.kcfg_hiddenPagesMemory.setSuffix(kdecore.i18n(" MiB"))
+
+from PyKDE4.kdeui import KIntSpinBox
@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+
+#   Copyright 2011 Luca Beltrame <einar@heavensinferno.net>
+#
+#   This program is free software; you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License, under
+#   version 2 of the License, or (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details
+#
+#   You should have received a copy of the GNU General Public
+#   License along with this program; if not, write to the
+#   Free Software Foundation, Inc.,
+#   51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+"""Tests for :mod:`danbooru.api.cache`."""
+
+import os
+
+from danbooru.api import cache
+from danbooru.api import containers
+
+
+class _Pixmap(object):
+
+    """Stand-in for a ``QPixmap`` of *side* × *side* pixels, 8 bits deep
+    (so that it costs *side* squared bytes)."""
+
+    def __init__(self, side):
+
+        self.side = side
+
+    def width(self):
+
+        return self.side
+
+    def height(self):
+
+        return self.side
+
+    def depth(self):
+
+        return 8
+
+    def isNull(self):
+
+        return False
+
+
+def test_response_cache_round_trip(tmpdir):
+
+    responses = cache.ResponseCache(str(tmpdir))
+    responses.store("key", b"answer", etag='"abc"', last_modified="Mon")
+
+    entry = responses.lookup("key")
+
+    assert entry.data == b"answer"
+    assert entry.etag == '"abc"'
+    assert entry.last_modified == "Mon"
+    assert responses.lookup("other") is None
+
+
+def test_response_cache_evicts_least_recently_used(tmpdir):
+
+    responses = cache.ResponseCache(str(tmpdir), max_size=10)
+    responses.store("a", b"aaaa")
+    responses.store("b", b"bbbb")
+
+    # "a" becomes the most recently used
+    responses.lookup("a")
+    responses.store("c", b"cccc")
+
+    assert responses.lookup("b") is None
+    assert responses.lookup("a") is not None
+    assert responses.lookup("c") is not None
+    assert responses.size == 8
+
+
+def test_response_cache_skips_oversized_answers(tmpdir):
+
+    responses = cache.ResponseCache(str(tmpdir), max_size=4)
+    responses.store("key", b"too large")
+
+    assert len(responses) == 0
+    assert responses.size == 0
+
+
+def test_response_cache_writes_index_on_close(tmpdir):
+
+    responses = cache.ResponseCache(str(tmpdir))
+    responses.store("key", b"answer")
+    responses.close()
+
+    reopened = cache.ResponseCache(str(tmpdir))
+
+    assert reopened.lookup("key").data == b"answer"
+
+
+def test_response_cache_defers_index_writes(tmpdir):
+
+    responses = cache.ResponseCache(str(tmpdir))
+    responses.store("key", b"answer")
+
+    # Not written back yet: the answer is orphaned and removed
+    reopened = cache.ResponseCache(str(tmpdir))
+
+    assert len(reopened) == 0
+    assert os.listdir(str(tmpdir)) == []
+
+
+def test_response_cache_writes_index_after_interval(tmpdir, monkeypatch):
+
+    monkeypatch.setattr(cache, "INDEX_SAVE_INTERVAL", 0)
+
+    responses = cache.ResponseCache(str(tmpdir))
+    responses.store("key", b"answer")
+
+    reopened = cache.ResponseCache(str(tmpdir))
+
+    assert reopened.lookup("key").data == b"answer"
+
+
+def test_tag_cache_expires_tags():
+
+    tag = containers.DanbooruTag(dict(id=1, name="tag", type=0, count=1))
+
+    tags = cache.TagCache()
+    tags.put(tag)
+
+    assert tags.get("tag") is tag
+    assert "tag" in tags
+
+    stale = cache.TagCache(ttl=-1)
+    stale.put(tag)
+
+    assert stale.get("tag") is None
+    assert len(stale) == 0
+
+
+def test_thumbnail_cache_evicts_least_recently_used():
+
+    thumbnails = cache.ThumbnailCache(max_size=300)
+    first, second, third = _Pixmap(10), _Pixmap(10), _Pixmap(10)
+
+    thumbnails.put("board", "1", first)
+    thumbnails.put("board", "2", second)
+    thumbnails.put("board", "3", third)
+
+    assert thumbnails.size == 300
+
+    # "1" becomes the most recently used
+    assert thumbnails.get("board", "1") is first
+    thumbnails.put("board", "4", _Pixmap(10))
+
+    assert thumbnails.get("board", "2") is None
+    assert thumbnails.get("board", "1") is first
+    assert thumbnails.size == 300
+
+    statistics = thumbnails.statistics
+
+    assert statistics["evictions"] == 1
+    assert statistics["hits"] == 2
+    assert statistics["misses"] == 1
+
+
+def test_thumbnail_cache_keys_by_board():
+
+    thumbnails = cache.ThumbnailCache()
+    pixmap = _Pixmap(10)
+    thumbnails.put("first", "md5", pixmap)
+
+    assert thumbnails.get("second", "md5") is None
+    assert thumbnails.cost("first", "md5") == 100
+
+    thumbnails.remove("first", "md5")
+
+    assert len(thumbnails) == 0
+    assert thumbnails.size == 0
+
+
+def test_thumbnail_cache_shrinks_with_budget():
+
+    thumbnails = cache.ThumbnailCache(max_size=1000)
+
+    for md5 in "abcd":
+        thumbnails.put("board", md5, _Pixmap(10))
+
+    thumbnails.set_max_size(200)
+
+    assert len(thumbnails) == 2
+    assert ("board", "d") in thumbnails
+    assert ("board", "a") not in thumbnails
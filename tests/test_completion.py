@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+
+#   Copyright 2011 Luca Beltrame <einar@heavensinferno.net>
+#
+#   This program is free software; you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License, under
+#   version 2 of the License, or (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details
+#
+#   You should have received a copy of the GNU General Public
+#   License along with this program; if not, write to the
+#   Free Software Foundation, Inc.,
+#   51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+
+"""Tests for :mod:`danbooru.api.completion`."""
+
+import random
+
+from danbooru.api import completion
+
+
+def _brute_force(entries, prefix, limit):
+
+    """Rank the names starting with *prefix* the slow way."""
+
+    matches = [(count, name) for name, count in entries
+               if name.startswith(prefix)]
+
+    return [name for count, name in
+            sorted(matches, key=lambda item: -item[0])[:limit]]
+
+
+def test_empty_index():
+
+    index = completion.CompletionIndex([])
+
+    assert len(index) == 0
+    assert index.complete("a") == []
+    assert index.complete("") == []
+
+
+def test_ranked_by_count():
+
+    index = completion.CompletionIndex([("long_hair", 100),
+                                        ("long_sleeves", 200),
+                                        ("short_hair", 300)])
+
+    assert len(index) == 3
+    assert index.complete("long") == ["long_sleeves", "long_hair"]
+    assert index.complete("long", limit=1) == ["long_sleeves"]
+    assert index.complete("short_hair") == ["short_hair"]
+    assert index.complete("x") == []
+
+
+def test_non_ascii_names():
+
+    index = completion.CompletionIndex([(u"ねこ", 5), (u"ねこみみ", 10),
+                                        (u"ぱんだ", 1)])
+
+    assert index.complete(u"ねこ") == [u"ねこみみ", u"ねこ"]
+
+
+def test_large_ranges_match_brute_force():
+
+    # Enough names sharing prefixes to use the precomputed rankings
+    generator = random.Random(42)
+    names = set()
+
+    while len(names) < 5000:
+        length = generator.randint(1, 6)
+        names.add("".join(generator.choice("abcd") for _ in range(length)))
+
+    entries = sorted((name, generator.randint(0, 10000)) for name in names)
+    counts = dict(entries)
+    index = completion.CompletionIndex(entries)
+
+    for prefix in ["", "a", "ab", "abc", "dab", "bbbb", "cccccc"]:
+
+        expected = _brute_force(entries, prefix, completion.TOP_SIZE)
+        result = index.complete(prefix, completion.TOP_SIZE)
+
+        # Ties can be ranked either way
+        assert ([counts[name] for name in result] ==
+                [counts[name] for name in expected])
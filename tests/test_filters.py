@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+
+#   Copyright 2011 Luca Beltrame <einar@heavensinferno.net>
+#
+#   This program is free software; you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License, under
+#   version 2 of the License, or (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details
+#
+#   You should have received a copy of the GNU General Public
+#   License along with this program; if not, write to the
+#   Free Software Foundation, Inc.,
+#   51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+
+"""Tests for :mod:`danbooru.api.filters`."""
+
+from danbooru.api import containers
+from danbooru.api import filters
+
+
+def _post(tags="", rating="s", **fields):
+
+    data = dict(id=1, tags=tags, rating=rating)
+    data.update(fields)
+
+    return containers.DanbooruPost(data)
+
+
+def test_plain_tags_hide_posts():
+
+    post_filter = filters.PostFilter(["bad_tag", "other"])
+
+    assert not post_filter(_post("good bad_tag"))
+    assert post_filter(_post("good"))
+
+
+def test_entries_need_all_their_terms():
+
+    post_filter = filters.PostFilter(["first second"])
+
+    assert not post_filter(_post("first second third"))
+    assert post_filter(_post("first third"))
+
+
+def test_negated_terms():
+
+    post_filter = filters.PostFilter(["tag -exception"])
+
+    assert not post_filter(_post("tag"))
+    assert post_filter(_post("tag exception"))
+
+
+def test_rating_metatag():
+
+    post_filter = filters.PostFilter(["tag rating:e"])
+
+    assert not post_filter(_post("tag", rating="e"))
+    assert post_filter(_post("tag", rating="s"))
+
+
+def test_numeric_metatags():
+
+    post_filter = filters.PostFilter(["width:>1000", "filesize:1kb..2kb"])
+
+    assert not post_filter(_post(width=1200))
+    assert post_filter(_post(width=800))
+    assert not post_filter(_post(file_size=1500))
+    assert post_filter(_post(file_size=4096))
+
+    # Posts without the field never match
+    assert post_filter(_post())
+
+
+def test_unsupported_entries_are_ignored():
+
+    post_filter = filters.PostFilter(["", "tag order:score", "width:abc"])
+
+    assert post_filter(_post("tag", width=10))
+
+
+def test_rating_limit():
+
+    post_filter = filters.PostFilter(max_rating=containers.QUESTIONABLE)
+
+    assert post_filter(_post(rating="q"))
+    assert not post_filter(_post(rating="e"))
+    assert post_filter.filter([_post(rating="s"), _post(rating="e")]) == [
+        _post(rating="s")]
+
+
+def test_tag_names():
+
+    names = filters.tag_names(["plain", "two tags", "-negated", "rating:e"])
+
+    assert names == frozenset(["plain"])
+    assert filters.tag_names(None) == frozenset()
+
+
+def test_server_tags():
+
+    terms = filters.server_tags(["search"], ["first", "two tags", "second"],
+                                max_rating=containers.SAFE)
+
+    assert terms == ["search", "rating:s", "-first", "-second"]
+
+
+def test_server_tags_respects_limits():
+
+    terms = filters.server_tags(["one", "rating:q"], ["first", "second"],
+                                max_rating=containers.SAFE, max_tags=3)
+
+    # The search has its own rating, and room for a single term
+    assert terms == ["one", "rating:q", "-first"]
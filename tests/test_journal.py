@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+
+#   Copyright 2011 Luca Beltrame <einar@heavensinferno.net>
+#
+#   This program is free software; you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License, under
+#   version 2 of the License, or (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details
+#
+#   You should have received a copy of the GNU General Public
+#   License along with this program; if not, write to the
+#   Free Software Foundation, Inc.,
+#   51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+
+"""Tests for :mod:`danbooru.api.journal`."""
+
+import os
+
+import pytest
+
+from danbooru.api import journal
+
+
+class _Url(object):
+
+    """Stand-in for a ``KUrl``."""
+
+    def __init__(self, url):
+
+        self.__url = url
+
+    def url(self):
+
+        return self.__url
+
+
+class _Download(object):
+
+    """Stand-in for an :class:`ImageDownload
+    <danbooru.api.download.ImageDownload>`, with the attributes recorded in
+    the journal."""
+
+    def __init__(self, directory, name, post_id=1):
+
+        self.path = os.path.join(directory, name)
+        self.url = _Url("http://example.com/data/" + name)
+        self.destination = _Url("file://" + self.path)
+        self.md5 = "0" * 32
+        self.board_url = "http://example.com"
+        self.post_id = post_id
+        self.size = 1024
+        self.tags = ["first", "second"]
+
+
+@pytest.fixture
+def directory(tmpdir):
+
+    return str(tmpdir)
+
+
+def _journal(directory):
+
+    return journal.DownloadJournal(os.path.join(directory, "journal.sqlite"))
+
+
+def test_pending_survives_reopening(directory):
+
+    downloads = _journal(directory)
+    first = downloads.add(_Download(directory, "a.jpg", 1), priority=5)
+    second = downloads.add(_Download(directory, "b.jpg", 2))
+    downloads.set_state(second, journal.RUNNING)
+    downloads.close()
+
+    # As after a crash: both were interrupted
+    reopened = _journal(directory)
+    entries = reopened.pending()
+
+    assert [entry["id"] for entry in entries] == [first, second]
+    assert entries[0]["url"] == "http://example.com/data/a.jpg"
+    assert entries[0]["tags"] == ["first", "second"]
+    assert entries[0]["priority"] == 5
+    assert entries[0]["post_id"] == 1
+    assert entries[1]["board"] == "http://example.com"
+
+    reopened.close()
+
+
+def test_finished_downloads_are_not_resumed(directory):
+
+    downloads = _journal(directory)
+    done = downloads.add(_Download(directory, "a.jpg"))
+    failed = downloads.add(_Download(directory, "b.jpg"))
+    removed = downloads.add(_Download(directory, "c.jpg"))
+    downloads.set_state(done, journal.DONE)
+    downloads.set_state(failed, journal.FAILED)
+    downloads.remove(removed)
+
+    assert downloads.pending() == []
+
+    downloads.close()
+
+
+def test_completed_files_are_marked_done(directory):
+
+    downloads = _journal(directory)
+    download = _Download(directory, "a.jpg")
+    downloads.add(download)
+
+    # The file was saved, but the entry not updated
+    with open(download.path, "wb") as handle:
+        handle.write(b"image")
+
+    assert downloads.pending() == []
+
+    # Marked as done: cleared, and not resumed even without the file
+    downloads.clear()
+    os.remove(download.path)
+
+    assert downloads.pending() == []
+
+    downloads.close()
+
+
+def test_clear_keeps_pending_downloads(directory):
+
+    downloads = _journal(directory)
+    pending = downloads.add(_Download(directory, "a.jpg"))
+    done = downloads.add(_Download(directory, "b.jpg"))
+    downloads.set_state(done, journal.DONE)
+    downloads.clear()
+
+    assert [entry["id"] for entry in downloads.pending()] == [pending]
+
+    downloads.close()
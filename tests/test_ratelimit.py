@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+
+#   Copyright 2011 Luca Beltrame <einar@heavensinferno.net>
+#
+#   This program is free software; you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License, under
+#   version 2 of the License, or (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details
+#
+#   You should have received a copy of the GNU General Public
+#   License along with this program; if not, write to the
+#   Free Software Foundation, Inc.,
+#   51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+
+"""Tests for :mod:`danbooru.api.ratelimit`."""
+
+import pytest
+
+QtCore = pytest.importorskip("PyQt4.QtCore")
+pytest.importorskip("PyKDE4.kio")
+
+from danbooru.api import boards
+from danbooru.api import ratelimit
+
+BOARD = "http://example.com"
+DEFAULTS = boards.BoardCapabilities()
+
+# A KIO error which is not worth retrying by itself
+ERROR = max(ratelimit.RETRY_ERRORS) + 1
+
+
+class _Job(object):
+
+    """Stand-in for a finished KIO job."""
+
+    def __init__(self, error=0, code="", headers=""):
+
+        self.__error = error
+        self.__metadata = {"responsecode": code, "HTTP-Headers": headers}
+
+    def error(self):
+
+        return self.__error
+
+    def queryMetaData(self, key):
+
+        return self.__metadata.get(key, "")
+
+
+@pytest.fixture(scope="module", autouse=True)
+def application():
+
+    # QTimer needs an application object
+    return QtCore.QCoreApplication.instance() or QtCore.QCoreApplication([])
+
+
+def _fill(limiter, count, static=False):
+
+    started = list()
+
+    for number in range(count):
+        limiter.request(BOARD, lambda number=number: started.append(number),
+                        static=static)
+
+    return started
+
+
+def test_burst_then_queue():
+
+    limiter = ratelimit.RateLimiter()
+    started = _fill(limiter, DEFAULTS.request_burst + 3)
+
+    assert started == list(range(DEFAULTS.request_burst))
+
+    state = limiter.state("example.com")
+
+    assert state["queued"] == 3
+    assert state["started"] == DEFAULTS.request_burst
+
+
+def test_static_files_have_their_own_bucket():
+
+    limiter = ratelimit.RateLimiter()
+    _fill(limiter, DEFAULTS.request_burst + 1)
+
+    # The API bucket is empty, static files are not held back
+    started = _fill(limiter, DEFAULTS.static_burst, static=True)
+
+    assert len(started) == DEFAULTS.static_burst
+    assert limiter.state("example.com", static=True)["queued"] == 0
+    assert limiter.state("example.com")["queued"] == 1
+
+
+def test_throttling_halves_rate_and_blocks():
+
+    limiter = ratelimit.RateLimiter()
+    limiter.throttled(BOARD, _Job(ERROR, "429", "Retry-After: 30"))
+
+    state = limiter.state("example.com")
+
+    assert state["rate"] == DEFAULTS.request_rate / 2
+    assert 29 < state["blocked"] <= 30
+    assert state["throttled"] == 1
+
+    # Requests wait for the end of the block
+    assert _fill(limiter, 1) == []
+
+    # The static bucket is not affected
+    assert _fill(limiter, 1, static=True) == [0]
+
+
+def test_throttling_without_retry_after():
+
+    limiter = ratelimit.RateLimiter()
+    limiter.throttled(BOARD, _Job(ERROR, "503"))
+
+    assert limiter.state("example.com")["blocked"] <= ratelimit.BASE_DELAY
+
+
+def test_rate_never_falls_below_minimum():
+
+    limiter = ratelimit.RateLimiter()
+
+    for _ in range(20):
+        limiter.throttled(BOARD, _Job(ERROR, "429", "Retry-After: 0"))
+
+    assert limiter.state("example.com")["rate"] == ratelimit.MIN_RATE
+
+
+def test_rate_recovers_with_successes():
+
+    limiter = ratelimit.RateLimiter()
+    limiter.throttled(BOARD, _Job(ERROR, "429", "Retry-After: 0"))
+    limiter.succeeded(BOARD)
+
+    expected = DEFAULTS.request_rate * (0.5 + ratelimit.RECOVERY)
+
+    assert limiter.state("example.com")["rate"] == pytest.approx(expected)
+
+    for _ in range(20):
+        limiter.succeeded(BOARD)
+
+    assert limiter.state("example.com")["rate"] == DEFAULTS.request_rate
+
+
+def test_set_rate():
+
+    limiter = ratelimit.RateLimiter()
+    limiter.set_rate(BOARD, 0, burst=1)
+
+    state = limiter.state("example.com")
+
+    assert state["base_rate"] == ratelimit.MIN_RATE
+    assert _fill(limiter, 3) == [0]
+
+
+def test_retry_delay_is_bounded():
+
+    for attempt in range(10):
+
+        delay = ratelimit.retry_delay(attempt)
+        limit = min(ratelimit.MAX_DELAY, ratelimit.BASE_DELAY * 2 ** attempt)
+
+        assert 0 <= delay <= limit
+
+
+def test_retry_decisions():
+
+    assert ratelimit.should_retry(_Job(ERROR, "503"))
+    assert ratelimit.should_retry(_Job(ERROR, "502"))
+    assert not ratelimit.should_retry(_Job(ERROR, "404"))
+    assert not ratelimit.should_retry(_Job(0, "200"))
+    assert ratelimit.is_throttled(_Job(ERROR, "429"))
+    assert not ratelimit.is_throttled(_Job(ERROR, "500"))
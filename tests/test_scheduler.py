@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+
+#   Copyright 2011 Luca Beltrame <einar@heavensinferno.net>
+#
+#   This program is free software; you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License, under
+#   version 2 of the License, or (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details
+#
+#   You should have received a copy of the GNU General Public
+#   License along with this program; if not, write to the
+#   Free Software Foundation, Inc.,
+#   51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+
+"""Tests for :mod:`danbooru.api.scheduler`."""
+
+import pytest
+
+pytest.importorskip("PyQt4.QtCore")
+pytest.importorskip("PyKDE4.kio")
+
+from danbooru.api import ratelimit
+from danbooru.api import scheduler
+
+
+class _Signal(object):
+
+    def __init__(self):
+
+        self.slots = list()
+
+    def connect(self, slot):
+
+        self.slots.append(slot)
+
+
+class _Job(object):
+
+    """Stand-in for a KIO job which failed in a way worth retrying."""
+
+    def __init__(self):
+
+        self.result = _Signal()
+
+    def error(self):
+
+        return min(ratelimit.RETRY_ERRORS)
+
+    def queryMetaData(self, key):
+
+        return ""
+
+    def finish(self):
+
+        for slot in self.result.slots:
+            slot(self)
+
+
+class _Kio(object):
+
+    """Stand-in for the parts of KIO used to start jobs, recording them."""
+
+    HideProgressInfo = NoReload = 0
+
+    def __init__(self):
+
+        self.jobs = list()
+
+    def JobFlags(self, flags):
+
+        return flags
+
+    def storedGet(self, url, reload_policy, flags):
+
+        self.jobs.append(_Job())
+
+        return self.jobs[-1]
+
+
+class _Timer(object):
+
+    """Stand-in for ``QTimer``, recording the single shot callbacks."""
+
+    callbacks = list()
+
+    @classmethod
+    def singleShot(cls, delay, callback):
+
+        cls.callbacks.append(callback)
+
+
+class _QtCore(object):
+
+    QTimer = _Timer
+
+
+@pytest.fixture
+def kio(monkeypatch):
+
+    kio = _Kio()
+    _Timer.callbacks = list()
+    monkeypatch.setattr(scheduler, "KIO", kio)
+    monkeypatch.setattr(scheduler, "QtCore", _QtCore)
+
+    return kio
+
+
+def test_failed_requests_are_retried(kio):
+
+    finished = list()
+    thumbnails = scheduler.ThumbnailScheduler()
+    thumbnails.submit("http://example.com/a.jpg", finished.append, group=1)
+    kio.jobs[0].finish()
+
+    assert finished == []
+    assert len(_Timer.callbacks) == 1
+
+    _Timer.callbacks.pop()()
+
+    assert len(kio.jobs) == 2
+
+
+def test_cancel_during_retry_delay(kio):
+
+    finished = list()
+    thumbnails = scheduler.ThumbnailScheduler()
+    thumbnails.submit("http://example.com/a.jpg", finished.append, group=1)
+    kio.jobs[0].finish()
+
+    # A new search clears the results while the retry is pending
+    thumbnails.cancel()
+
+    for callback in _Timer.callbacks:
+        callback()
+
+    assert len(kio.jobs) == 1
+    assert len(thumbnails) == 0
+    assert finished == []
+
+
+def test_cancel_group_during_retry_delay(kio):
+
+    finished = list()
+    thumbnails = scheduler.ThumbnailScheduler()
+    thumbnails.submit("http://example.com/a.jpg", finished.append, group=1)
+    thumbnails.submit("http://example.com/b.jpg", finished.append, group=2)
+
+    for job in list(kio.jobs):
+        job.finish()
+
+    thumbnails.cancel(1)
+
+    for callback in _Timer.callbacks:
+        callback()
+
+    # Only the request of the other group is sent again
+    assert len(kio.jobs) == 3
+    assert finished == []
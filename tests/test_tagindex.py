@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+
+#   Copyright 2011 Luca Beltrame <einar@heavensinferno.net>
+#
+#   This program is free software; you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License, under
+#   version 2 of the License, or (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details
+#
+#   You should have received a copy of the GNU General Public
+#   License along with this program; if not, write to the
+#   Free Software Foundation, Inc.,
+#   51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+
+"""Tests for :mod:`danbooru.api.tagindex`."""
+
+import os
+
+import pytest
+
+from danbooru.api import containers
+from danbooru.api import tagindex
+
+
+def _tag(tag_id, name, count=0):
+
+    return containers.DanbooruTag(dict(id=tag_id, name=name, type=0,
+                                       count=count))
+
+
+@pytest.fixture
+def index(tmpdir):
+
+    tag_index = tagindex.TagIndex(os.path.join(str(tmpdir), "tags.sqlite"))
+    yield tag_index
+    tag_index.close()
+
+
+def test_update_and_lookup(index):
+
+    assert index.update([_tag(1, "first", 10), _tag(2, "second", 5)]) == 2
+
+    tag = index.lookup("first")
+
+    assert tag.name == "first"
+    assert int(tag.count) == 10
+    assert "second" in index
+    assert index.lookup("missing") is None
+    assert len(index) == 2
+
+
+def test_update_skips_invalid_tags(index):
+
+    assert index.update([_tag(None, "no_id"), _tag(3, None)]) == 0
+    assert len(index) == 0
+
+
+def test_update_replaces_renamed_ids(index):
+
+    index.update([_tag(1, "old_name")])
+    index.update([_tag(1, "new_name")])
+
+    assert "old_name" not in index
+    assert "new_name" in index
+
+
+def test_watermark_starts_at_zero(index):
+
+    assert index.last_id == 0
+
+
+def test_stored_tags_do_not_move_watermark(index):
+
+    # Tags stored by related tag lookups, outside of a sync
+    index.update([_tag(500, "related")])
+
+    assert index.last_id == 0
+
+
+def test_watermark_is_kept(tmpdir):
+
+    path = os.path.join(str(tmpdir), "tags.sqlite")
+
+    tag_index = tagindex.TagIndex(path)
+    tag_index.update([_tag(1, "first"), _tag(2, "second")])
+    tag_index.set_last_id(2)
+    tag_index.update([_tag(900, "later")])
+    tag_index.close()
+
+    reopened = tagindex.TagIndex(path)
+
+    assert reopened.last_id == 2
+    reopened.close()
+
+
+def test_clear_resets_watermark(index):
+
+    index.update([_tag(1, "first")])
+    index.set_last_id(1)
+    index.clear()
+
+    assert index.last_id == 0
+    assert len(index) == 0
+
+
+def test_complete(index):
+
+    index.update([_tag(1, "long_hair", 100), _tag(2, "long_sleeves", 200),
+                  _tag(3, "short_hair", 300)])
+
+    assert index.complete("long") == ["long_sleeves", "long_hair"]
+    assert index.complete("long", limit=1) == ["long_sleeves"]
+    assert index.complete("") == ["short_hair", "long_sleeves", "long_hair"]
+    assert list(index.names()) == ["long_hair", "long_sleeves", "short_hair"]